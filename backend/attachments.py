@@ -0,0 +1,234 @@
+import os
+import re
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+ROOT_DIR = Path(__file__).parent
+
+# "gridfs" keeps files in MongoDB, "disk" writes them under ATTACHMENT_DIR
+ATTACHMENT_STORAGE = os.environ.get('ATTACHMENT_STORAGE', 'gridfs')
+ATTACHMENT_DIR = Path(os.environ.get('ATTACHMENT_DIR', ROOT_DIR / 'uploads'))
+ATTACHMENT_MAX_BYTES = int(os.environ.get('ATTACHMENT_MAX_BYTES', 100 * 1024 * 1024))
+CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range "bytes=" header into an inclusive (start, end) pair.
+
+    Returns None when the whole file should be sent. Multi-range requests are
+    answered with the whole file, which RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def content_disposition(filename: str) -> str:
+    """Attachment header with a quoted ASCII fallback name and the UTF-8 name (RFC 6266 / RFC 5987)"""
+    fallback = "".join(
+        char if " " <= char <= "~" and char not in '"\\' else "_" for char in filename
+    )
+    return f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename, safe="")}'
+
+
+def range_headers(start: int, end: int, size: int) -> dict:
+    return {
+        "content-range": f"bytes {start}-{end}/{size}",
+        "content-length": str(end - start + 1),
+        "accept-ranges": "bytes"
+    }
+
+
+class FileRangeResponse(Response):
+    """Send a byte range of a file on disk.
+
+    Uses the ASGI zero-copy extension (os.sendfile under the hood) when the
+    server offers it, and falls back to chunked reads otherwise.
+    """
+
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, path: Path, start: int, end: int, size: int, media_type: str = None, headers: dict = None):
+        super().__init__(
+            status_code=206,
+            headers={**(headers or {}), **range_headers(start, end, size)},
+            media_type=media_type
+        )
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.start,
+                    "count": self.count,
+                    "more_body": False
+                })
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class DiskAttachmentStore:
+    name = "disk"
+
+    def __init__(self, directory: Path = ATTACHMENT_DIR):
+        self.directory = Path(directory)
+
+    def path(self, attachment_id: str) -> Path:
+        return self.directory / attachment_id
+
+    async def save(self, attachment_id: str, filename: str, content_type: str,
+                   chunks: AsyncIterator[bytes]) -> int:
+        """Write chunks to a temporary file and move it into place once complete"""
+        await anyio.to_thread.run_sync(lambda: self.directory.mkdir(parents=True, exist_ok=True))
+        final_path = self.path(attachment_id)
+        partial_path = final_path.with_suffix(".partial")
+        size = 0
+        try:
+            async with await anyio.open_file(partial_path, mode="wb") as file:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > ATTACHMENT_MAX_BYTES:
+                        raise AttachmentTooLarge()
+                    await file.write(chunk)
+            await anyio.to_thread.run_sync(os.replace, partial_path, final_path)
+        except BaseException:
+            await anyio.to_thread.run_sync(lambda: partial_path.unlink(missing_ok=True))
+            raise
+        return size
+
+    async def response(self, attachment: dict, byte_range: Optional[Tuple[int, int]]) -> Response:
+        headers = {"content-disposition": content_disposition(attachment["filename"])}
+        if byte_range is None:
+            # FileResponse uses the ASGI pathsend extension when available
+            response = FileResponse(self.path(attachment["id"]), media_type=attachment["content_type"], headers=headers)
+            response.headers["accept-ranges"] = "bytes"
+            return response
+        start, end = byte_range
+        return FileRangeResponse(
+            self.path(attachment["id"]), start, end, attachment["size"],
+            media_type=attachment["content_type"], headers=headers
+        )
+
+    async def delete(self, attachment_id: str) -> None:
+        await anyio.to_thread.run_sync(lambda: self.path(attachment_id).unlink(missing_ok=True))
+
+
+class GridFSAttachmentStore:
+    name = "gridfs"
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name="attachments")
+
+    async def save(self, attachment_id: str, filename: str, content_type: str,
+                   chunks: AsyncIterator[bytes]) -> int:
+        """Stream chunks into GridFS; only one chunk is held in memory at a time"""
+        grid_in = self.bucket.open_upload_stream_with_id(
+            attachment_id, filename, metadata={"content_type": content_type}
+        )
+        size = 0
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > ATTACHMENT_MAX_BYTES:
+                    raise AttachmentTooLarge()
+                await grid_in.write(chunk)
+            await grid_in.close()
+        except BaseException:
+            await grid_in.abort()
+            raise
+        return size
+
+    async def response(self, attachment: dict, byte_range: Optional[Tuple[int, int]]) -> Response:
+        headers = {
+            "content-disposition": content_disposition(attachment["filename"]),
+            "accept-ranges": "bytes"
+        }
+        start, end = byte_range if byte_range else (0, attachment["size"] - 1)
+        grid_out = await self.bucket.open_download_stream(attachment["id"])
+        grid_out.seek(start)
+
+        async def body() -> AsyncIterator[bytes]:
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await grid_out.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+        if byte_range is None:
+            headers["content-length"] = str(attachment["size"])
+            return StreamingResponse(body(), media_type=attachment["content_type"], headers=headers)
+        return StreamingResponse(
+            body(), status_code=206, media_type=attachment["content_type"],
+            headers={**headers, **range_headers(start, end, attachment["size"])}
+        )
+
+    async def delete(self, attachment_id: str) -> None:
+        try:
+            await self.bucket.delete(attachment_id)
+        except NoFile:
+            pass
+
+
+def get_attachment_store(db: AsyncIOMotorDatabase, storage: str = None):
+    """Get the store for a backend name (defaults to ATTACHMENT_STORAGE)"""
+    if (storage or ATTACHMENT_STORAGE) == "disk":
+        return DiskAttachmentStore()
+    return GridFSAttachmentStore(db)
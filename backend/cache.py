@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Small in-process cache with per-entry expiry.
+
+    Entries live in this worker only, so the TTL should stay short enough
+    that readers tolerate values computed by a slightly older request.
+    """
+
+    def __init__(self, ttl: float = 10.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        # Bumped by invalidate so computations that started earlier are not stored
+        self._generation = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None) -> None:
+        """Store a value for ttl seconds (defaults to the cache TTL)"""
+        if len(self._entries) >= self.max_entries:
+            self._evict()
+        self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], ttl: float = None) -> Any:
+        """Return the cached value, or compute it once for every concurrent caller.
+
+        Requests arriving while the value is being computed wait for that
+        computation instead of starting their own. A value whose computation
+        overlapped an invalidate() is returned to its callers but not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._compute(key, compute, ttl))
+        # A cancelled caller must not cancel the computation the others wait on
+        return await asyncio.shield(pending)
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], ttl: float = None) -> Any:
+        generation = self._generation
+        try:
+            value = await compute()
+            if generation == self._generation:
+                self.set(key, value, ttl)
+            return value
+        finally:
+            if self._pending.get(key) is asyncio.current_task():
+                del self._pending[key]
+
+    def invalidate(self, key: Hashable = None) -> None:
+        """Drop one key, or every entry when no key is given.
+
+        Computations already running are not cached, and later callers
+        start a fresh one instead of waiting on them.
+        """
+        self._generation += 1
+        if key is None:
+            self._entries.clear()
+            self._pending.clear()
+        else:
+            self._entries.pop(key, None)
+            self._pending.pop(key, None)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._entries.items() if expires_at < now]:
+            del self._entries[key]
+        # Still full: drop the entry closest to expiry
+        if len(self._entries) >= self.max_entries:
+            oldest = min(self._entries, key=lambda k: self._entries[k][0])
+            del self._entries[oldest]
@@ -1,6 +1,11 @@
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
 import ssl
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from rollups import METRIC_RAW_RETENTION_DAYS, ROLLUP_TIERS
+from sketches import METRIC_SKETCH_RETENTION_DAYS
+import logging
 
 def get_database_client():
     """Get MongoDB client with proper SSL configuration"""
@@ -27,6 +32,206 @@ def get_database():
     db_name = os.environ.get('DB_NAME', os.environ.get('DATABASE_NAME', 'starprint_crm'))
     return client[db_name]
 
+# Collections served by the delta sync (changes since) endpoints
+SYNCED_COLLECTIONS = ["tickets", "customers", "goals"]
+
+# Deletes older than this are forgotten; clients syncing from before it must reset
+TOMBSTONE_RETENTION_DAYS = 30
+
+# "collection" keeps monitoring metrics as regular documents, "timeseries" in a time-series collection
+MONITORING_STORAGE = os.environ.get('MONITORING_STORAGE', 'collection')
+
+# Monitoring metrics stored with MONITORING_STORAGE=timeseries
+TIMESERIES_METRICS_COLLECTION = "monitoring_timeseries"
+METRIC_SKETCHES_COLLECTION = "metric_sketches"
+
+async def backfill_normalized_emails(collection) -> int:
+    """Add email_normalized to documents written before it existed"""
+    result = await collection.update_many(
+        {"email": {"$type": "string"}, "email_normalized": {"$exists": False}},
+        [{"$set": {"email_normalized": {"$toLower": {"$trim": {"input": "$email"}}}}}]
+    )
+    return result.modified_count
+
+async def find_duplicate_emails(collection) -> list:
+    return await collection.aggregate([
+        {"$match": {"email_normalized": {"$type": "string"}}},
+        {"$group": {"_id": "$email_normalized", "ids": {"$push": "$id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$project": {"_id": 0, "email": "$_id", "ids": 1}}
+    ]).to_list(length=None)
+
+async def create_email_indexes(db) -> dict:
+    """Unique case-insensitive emails for users and (when set) customers"""
+    results = {}
+    for name in ("users", "customers"):
+        results[name] = {"backfilled": await backfill_normalized_emails(db[name]), "duplicates": []}
+        try:
+            await db[name].create_index(
+                [("email_normalized", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"email_normalized": {"$type": "string"}}
+            )
+        except OperationFailure as e:
+            # Existing duplicates must be merged before the index can be built; until then
+            # writes fall back to a read check (services.check_email_available)
+            logging.getLogger(__name__).error(
+                f"Unique email index on {name} not created, merge duplicate emails and run "
+                f"backfill-normalized-emails: {e}"
+            )
+            results[name]["duplicates"] = await find_duplicate_emails(db[name])
+    return results
+
+async def backfill_attendance_day_keys(collection) -> int:
+    """Add day_key to attendance records written before it existed"""
+    result = await collection.update_many(
+        {"day_key": {"$exists": False}, "date": {"$type": "date"}},
+        [{"$set": {"day_key": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}}}]
+    )
+    return result.modified_count
+
+async def find_duplicate_attendance_days(collection) -> list:
+    return await collection.aggregate([
+        {"$match": {"day_key": {"$type": "string"}}},
+        {"$group": {"_id": {"user_id": "$user_id", "day_key": "$day_key"}, "ids": {"$push": "$id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$project": {"_id": 0, "user_id": "$_id.user_id", "day_key": "$_id.day_key", "ids": 1}}
+    ]).to_list(length=None)
+
+async def create_attendance_day_index(db) -> dict:
+    """One attendance record per user per day, which check_in's upsert relies on"""
+    result = {"backfilled": await backfill_attendance_day_keys(db.attendance), "duplicates": []}
+    try:
+        await db.attendance.create_index(
+            [("user_id", ASCENDING), ("day_key", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"day_key": {"$type": "string"}}
+        )
+    except OperationFailure as e:
+        # Legacy records of the same day must be merged before the index can be built
+        logging.getLogger(__name__).error(
+            f"Unique attendance day index not created, merge records sharing a day and run "
+            f"backfill-attendance-day-keys: {e}"
+        )
+        result["duplicates"] = await find_duplicate_attendance_days(db.attendance)
+    return result
+
+async def ensure_ttl_index(collection, field: str, seconds: int):
+    """Create a TTL index, or change the expiry of an existing one"""
+    try:
+        await collection.create_index([(field, ASCENDING)], expireAfterSeconds=seconds)
+    except OperationFailure:
+        await collection.database.command(
+            "collMod", collection.name, index={"keyPattern": {field: 1}, "expireAfterSeconds": seconds}
+        )
+
+async def create_monitoring_timeseries(db):
+    """Create the time-series collection for monitoring metrics (MongoDB 5.0+)"""
+    # Points only expire once enable-metric-retention has rolled them up (create_metric_retention)
+    if TIMESERIES_METRICS_COLLECTION not in await db.list_collection_names():
+        await db.create_collection(
+            TIMESERIES_METRICS_COLLECTION,
+            timeseries={"timeField": "timestamp", "metaField": "meta", "granularity": "seconds"}
+        )
+    await db[TIMESERIES_METRICS_COLLECTION].create_index([("meta.name", ASCENDING), ("timestamp", ASCENDING)])
+    await db[TIMESERIES_METRICS_COLLECTION].create_index([("meta.category", ASCENDING), ("timestamp", DESCENDING)])
+    await db[TIMESERIES_METRICS_COLLECTION].create_index([("meta.user_id", ASCENDING), ("timestamp", DESCENDING)])
+    await db[TIMESERIES_METRICS_COLLECTION].create_index([("id", ASCENDING)])
+
+async def raw_metrics_expire(collection) -> bool:
+    """Whether a raw metrics collection already drops points past METRIC_RAW_RETENTION_DAYS"""
+    listed = await collection.database.command("listCollections", filter={"name": collection.name})
+    for info in listed["cursor"]["firstBatch"]:
+        if info.get("options", {}).get("expireAfterSeconds") is not None:
+            return True
+    indexes = await collection.index_information()
+    return any("expireAfterSeconds" in index for index in indexes.values())
+
+async def create_metric_retention(db):
+    """Expire raw monitoring metrics after METRIC_RAW_RETENTION_DAYS.
+    
+    Expired points are gone for good, so this only runs from the
+    enable-metric-retention maintenance job, after the whole raw history
+    has been rolled up and sketched.
+    """
+    expire_after = METRIC_RAW_RETENTION_DAYS * 24 * 3600
+    await ensure_ttl_index(db.monitoring_metrics, "timestamp", expire_after)
+    if TIMESERIES_METRICS_COLLECTION in await db.list_collection_names():
+        await db.command("collMod", TIMESERIES_METRICS_COLLECTION, expireAfterSeconds=expire_after)
+
+async def create_indexes(db):
+    """Create the indexes the services rely on (idempotent)"""
+    # Ticket filters and the $facet statistics pipeline
+    await db.tickets.create_index([("id", ASCENDING)], unique=True)
+    await db.tickets.create_index([("status", ASCENDING)])
+    await db.tickets.create_index([("priority", ASCENDING)])
+    await db.tickets.create_index([("assigned_to", ASCENDING), ("status", ASCENDING)])
+    await db.tickets.create_index([("customer_id", ASCENDING), ("created_at", DESCENDING)])
+    await db.tickets.create_index([("created_at", DESCENDING)])
+    await db.tickets.create_index([("status", ASCENDING), ("resolved_at", ASCENDING)])
+    
+    # Archived (cold) tickets
+    await db.tickets_archive.create_index([("id", ASCENDING)], unique=True)
+    await db.tickets_archive.create_index([("customer_id", ASCENDING), ("created_at", DESCENDING)])
+    await db.tickets_archive.create_index([("created_at", DESCENDING)])
+    
+    # Delta sync: changes are read in (updated_at, id) order
+    for name in SYNCED_COLLECTIONS:
+        await db[name].create_index([("updated_at", ASCENDING), ("id", ASCENDING)])
+    await db.tombstones.create_index([("collection", ASCENDING), ("id", ASCENDING)], unique=True)
+    await db.tombstones.create_index([("collection", ASCENDING), ("updated_at", ASCENDING), ("id", ASCENDING)])
+    await db.tombstones.create_index("deleted_at", expireAfterSeconds=TOMBSTONE_RETENTION_DAYS * 24 * 3600)
+    
+    # Users joined into goal rollups by id and department
+    await db.users.create_index([("id", ASCENDING)], unique=True)
+    await db.users.create_index([("department", ASCENDING)])
+    await create_email_indexes(db)
+    
+    # Goals updated from ticket events
+    await db.goals.create_index([("unit", ASCENDING), ("user_id", ASCENDING), ("start_date", ASCENDING)])
+    await db.goals.create_index([("unit", ASCENDING), ("team_id", ASCENDING), ("start_date", ASCENDING)])
+    await db.tickets.create_index([("assigned_to", ASCENDING), ("resolved_at", ASCENDING)])
+    await db.goal_progress_history.create_index([("goal_id", ASCENDING), ("day", ASCENDING)], unique=True)
+    
+    # One attendance record per user per day
+    await db.attendance.create_index([("user_id", ASCENDING), ("date", ASCENDING)])
+    await create_attendance_day_index(db)
+    
+    # Monthly attendance buckets (ATTENDANCE_STORAGE=bucket)
+    await db.attendance_buckets.create_index([("user_id", ASCENDING), ("month_key", ASCENDING)], unique=True)
+    await db.attendance_buckets.create_index([("days.id", ASCENDING)])
+    await db.attendance_buckets.create_index([("month_key", ASCENDING)])
+    
+    # Materialized per-agent counters
+    await db.agent_stats.create_index([("user_id", ASCENDING)], unique=True)
+    
+    # Raw monitoring metrics; their TTL is added by enable-metric-retention (create_metric_retention)
+    await db.monitoring_metrics.create_index([("name", ASCENDING), ("timestamp", ASCENDING)])
+    await db.monitoring_metrics.create_index([("category", ASCENDING), ("timestamp", DESCENDING)])
+    for tier in ROLLUP_TIERS:
+        rollups = db[tier.collection]
+        await rollups.create_index(
+            [("name", ASCENDING), ("category", ASCENDING), ("user_id", ASCENDING), ("start", ASCENDING)], unique=True
+        )
+        await rollups.create_index([("name", ASCENDING), ("start", ASCENDING)])
+        await ensure_ttl_index(rollups, "start", tier.retention_days * 24 * 3600)
+    
+    # Hourly quantile sketches per metric name
+    sketches = db[METRIC_SKETCHES_COLLECTION]
+    await sketches.create_index([("name", ASCENDING), ("accuracy", ASCENDING), ("start", ASCENDING)], unique=True)
+    await ensure_ttl_index(sketches, "start", METRIC_SKETCH_RETENTION_DAYS * 24 * 3600)
+    
+    # Monitoring metrics time-series collection; migrate-monitoring-timeseries creates it ahead of the switch
+    if MONITORING_STORAGE == "timeseries":
+        try:
+            await create_monitoring_timeseries(db)
+        except OperationFailure as e:
+            logging.getLogger(__name__).warning(f"Monitoring time-series collection not created: {e}")
+    
+    # Ticket attachments
+    await db.ticket_attachments.create_index([("id", ASCENDING)], unique=True)
+    await db.ticket_attachments.create_index([("ticket_id", ASCENDING)])
+
 # Global instances
 client = get_database_client()
 db = get_database()
\ No newline at end of file
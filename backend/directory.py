@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from skill_index import SkillIndex
+
+logger = logging.getLogger(__name__)
+
+# Changes made by other workers are picked up by polling updated_at this often
+DIRECTORY_POLL_SECONDS = float(os.environ.get('DIRECTORY_POLL_SECONDS', 5))
+
+# Re-read a little before the last change seen, to tolerate clock skew between workers
+POLL_OVERLAP = timedelta(seconds=2)
+
+INDEXED_FIELDS = ("role", "department", "is_active")
+
+
+def index_value(user: dict, field: str):
+    # Users created before is_active existed count as active
+    return user.get(field, True) if field == "is_active" else user.get(field)
+
+
+def email_key(user: dict) -> Optional[str]:
+    email = user.get("email_normalized") or user.get("email")
+    return email.strip().lower() if email else None
+
+
+class UserDirectory:
+    """Per-worker snapshot of the users collection with secondary indexes.
+
+    Loaded in full once, then kept current by local writes and by polling
+    users changed (and tombstones written) since the last poll, so role,
+    email, active and department lookups never leave the process.
+    """
+
+    def __init__(self):
+        self._users: Dict[str, dict] = {}
+        self._by_email: Dict[str, str] = {}
+        self._indexes: Dict[str, Dict[object, Set[str]]] = {field: {} for field in INDEXED_FIELDS}
+        self.skills = SkillIndex()
+        self._synced_to: Optional[datetime] = None
+        self._polled_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    async def ensure_loaded(self, db) -> None:
+        """Load the snapshot on first use; poll when no background poller is running"""
+        if self._synced_to is None:
+            await self.load(db)
+        elif self._task is None and time.monotonic() - self._polled_at >= DIRECTORY_POLL_SECONDS:
+            await self.poll(db)
+
+    async def load(self, db) -> None:
+        started = datetime.utcnow()
+        self._users = {}
+        self._by_email = {}
+        self._indexes = {field: {} for field in INDEXED_FIELDS}
+        self.skills = SkillIndex()
+        async for user in db["users"].find({}, {"_id": 0}):
+            self.apply(user)
+        self._synced_to = started
+        self._polled_at = time.monotonic()
+
+    async def poll(self, db) -> int:
+        """Apply users changed or deleted since the last poll"""
+        since = self._synced_to - POLL_OVERLAP
+        started = datetime.utcnow()
+        changed = 0
+        async for user in db["users"].find({"updated_at": {"$gte": since}}, {"_id": 0}):
+            self.apply(user)
+            changed += 1
+        async for tombstone in db["tombstones"].find(
+            {"collection": "users", "updated_at": {"$gte": since}}, {"_id": 0, "id": 1}
+        ):
+            self.remove(tombstone["id"])
+            changed += 1
+        self._synced_to = started
+        self._polled_at = time.monotonic()
+        return changed
+
+    def apply(self, user: dict) -> None:
+        """Add or replace a user after a change"""
+        self.remove(user["id"])
+        user = dict(user)
+        self._users[user["id"]] = user
+        email = email_key(user)
+        if email:
+            self._by_email[email] = user["id"]
+        for field in INDEXED_FIELDS:
+            self._indexes[field].setdefault(index_value(user, field), set()).add(user["id"])
+        self.skills.apply(user)
+
+    def remove(self, user_id: str) -> None:
+        user = self._users.pop(user_id, None)
+        if user is None:
+            return
+        email = email_key(user)
+        if email and self._by_email.get(email) == user_id:
+            del self._by_email[email]
+        for field in INDEXED_FIELDS:
+            value = index_value(user, field)
+            users = self._indexes[field].get(value)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._indexes[field][value]
+        self.skills.remove(user_id)
+
+    def get(self, user_id: str) -> Optional[dict]:
+        user = self._users.get(user_id)
+        return dict(user) if user else None
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        user_id = self._by_email.get(email.strip().lower()) if email else None
+        return self.get(user_id) if user_id else None
+
+    def find(self, **filters) -> List[dict]:
+        """Users matching every field=value filter on the indexed fields, ordered by name"""
+        user_ids = None
+        for field, value in filters.items():
+            matches = self._indexes[field].get(value, set())
+            user_ids = set(matches) if user_ids is None else user_ids & matches
+        if user_ids is None:
+            user_ids = set(self._users)
+        users = [dict(self._users[user_id]) for user_id in user_ids]
+        return sorted(users, key=lambda user: (user.get("name") or "", user["id"]))
+
+    def ids(self, **filters) -> List[str]:
+        return [user["id"] for user in self.find(**filters)]
+
+    async def _run(self, db) -> None:
+        while True:
+            try:
+                if self._synced_to is None:
+                    await self.load(db)
+                else:
+                    await self.poll(db)
+            except Exception as e:
+                logger.warning(f"Could not refresh the user directory: {e}")
+            await asyncio.sleep(DIRECTORY_POLL_SECONDS)
+
+    def start(self, db) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(db))
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# Shared by every request handled in this worker
+directory = UserDirectory()
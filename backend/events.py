@@ -0,0 +1,122 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set
+
+
+# Topics whose documents carry each filterable field; events of other topics ignore the filter
+FILTER_TOPICS = {
+    "assigned_to": {"tickets"},
+    "status": {"tickets", "users", "attendance"},
+    "category": {"monitoring_metrics", "settings"},
+}
+
+
+class Event:
+    """A change notification, serialized once and shared by every subscriber"""
+
+    __slots__ = ("topic", "action", "data", "previous", "payload")
+
+    def __init__(self, topic: str, action: str, data: dict, previous: dict = None):
+        self.topic = topic
+        self.action = action
+        self.data = data
+        # The document before an update, when the publisher knows it
+        self.previous = previous or {}
+        self.payload = json.dumps({
+            "topic": topic,
+            "action": action,
+            "id": data.get("id"),
+            "data": data,
+            "timestamp": datetime.utcnow()
+        }, default=str)
+
+
+class Subscription:
+    """A subscriber's bounded queue of matching events.
+
+    When a slow client lets the queue fill up the oldest event is dropped,
+    so publishers never block; `dropped` tells the client it must resync.
+    """
+
+    def __init__(self, topics: Set[str], filters: Dict[str, str], max_queue: int = 100):
+        self.topics = topics
+        self.filters = filters
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def matches(self, event: Event) -> bool:
+        for key, value in self.filters.items():
+            if event.topic not in FILTER_TOPICS.get(key, ()):
+                continue
+            field = event.data.get(key)
+            # Delete events only carry the id; let them through
+            if field is None and event.action == "deleted":
+                continue
+            # A document leaving the filter is sent too, so the subscriber can drop it
+            if field != value and event.previous.get(key) != value:
+                return False
+        return True
+
+    def offer(self, event: Event) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def next(self, timeout: float = None) -> Optional[Event]:
+        """Wait for the next event, or return None after timeout seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def take_dropped(self) -> int:
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class EventHub:
+    """In-process publish/subscribe hub for document changes.
+
+    Subscribers are indexed by topic (the collection name), so a publish
+    only visits the subscribers of that topic. Events published by one
+    worker process reach only that worker's subscribers.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, topics: Iterable[str], filters: Dict[str, str] = None, max_queue: int = 100) -> Subscription:
+        subscription = Subscription(set(topics), filters or {}, max_queue)
+        for topic in subscription.topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topic: str, action: str, data: dict, previous: dict = None) -> None:
+        """Fan an event out to matching subscribers without blocking"""
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return
+        event = Event(topic, action, data, previous)
+        for subscription in subscribers:
+            if subscription.matches(event):
+                subscription.offer(event)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(set().union(*self._subscribers.values())) if self._subscribers else 0,
+            "by_topic": {topic: len(subscribers) for topic, subscribers in self._subscribers.items()}
+        }
+
+
+# Shared by every request handled in this worker
+hub = EventHub()
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import math
+import os
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Points held in memory before ingestion requests are refused
+INGEST_BUFFER_SIZE = int(os.environ.get('INGEST_BUFFER_SIZE', 100_000))
+# A flush is triggered once this many points are buffered...
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 2000))
+# ...or when the oldest buffered point is this old
+INGEST_FLUSH_SECONDS = float(os.environ.get('INGEST_FLUSH_SECONDS', 1.0))
+
+
+class BufferFull(Exception):
+    """Raised when accepting a batch would overflow the buffer"""
+
+    def __init__(self, retry_after: int, unavailable: bool):
+        super().__init__("Ingest buffer is full")
+        self.retry_after = retry_after
+        # True when the store is failing rather than just slower than the producers
+        self.unavailable = unavailable
+
+
+class MetricIngestBuffer:
+    """Bounded in-process buffer between ingestion requests and the metric store.
+
+    Requests only validate and enqueue; a background task drains the buffer
+    with one insert_many per batch. When producers outpace the store the
+    buffer fills and `offer` raises BufferFull instead of growing memory.
+    Each worker process has its own buffer.
+    """
+
+    def __init__(self, capacity: int = INGEST_BUFFER_SIZE, batch_size: int = INGEST_BATCH_SIZE,
+                 flush_seconds: float = INGEST_FLUSH_SECONDS):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._points: deque = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._sink: Optional[Callable[[List[dict]], Awaitable[None]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._failing = False
+        self.stats = {"accepted": 0, "rejected": 0, "flushed": 0, "flushes": 0, "failed_flushes": 0}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def offer(self, metrics: List[dict]) -> int:
+        """Stamp and enqueue validated metrics, or raise BufferFull"""
+        if len(self._points) + len(metrics) > self.capacity:
+            self.stats["rejected"] += len(metrics)
+            backlog_flushes = math.ceil(len(self._points) / self.batch_size)
+            raise BufferFull(max(1, math.ceil(backlog_flushes * self.flush_seconds)), self._failing)
+        now = datetime.utcnow()
+        for metric in metrics:
+            metric["id"] = str(uuid.uuid4())
+            if not metric.get("timestamp"):
+                metric["timestamp"] = now
+            elif metric["timestamp"].tzinfo is not None:
+                # Stored like every other datetime here: naive UTC
+                metric["timestamp"] = metric["timestamp"].astimezone(timezone.utc).replace(tzinfo=None)
+            metric["created_at"] = now
+            metric["updated_at"] = now
+        self._points.extend(metrics)
+        self.stats["accepted"] += len(metrics)
+        if self._wakeup is not None and len(self._points) >= self.batch_size:
+            self._wakeup.set()
+        return len(metrics)
+
+    def _take(self) -> List[dict]:
+        count = min(self.batch_size, len(self._points))
+        return [self._points.popleft() for _ in range(count)]
+
+    async def flush(self) -> int:
+        """Write out everything buffered now, one insert_many per batch"""
+        flushed = 0
+        while self._points:
+            batch = self._take()
+            try:
+                await self._sink(batch)
+            except Exception:
+                # Put the batch back in order; the next flush retries it
+                self._points.extendleft(reversed(batch))
+                self._failing = True
+                self.stats["failed_flushes"] += 1
+                raise
+            self._failing = False
+            flushed += len(batch)
+            self.stats["flushed"] += len(batch)
+            self.stats["flushes"] += 1
+        return flushed
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            started = time.monotonic()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Could not flush ingested metrics: {e}")
+                # Back off instead of retrying a failing store in a tight loop
+                await asyncio.sleep(max(0.0, self.flush_seconds - (time.monotonic() - started)))
+
+    def start(self, sink: Callable[[List[dict]], Awaitable[None]]) -> None:
+        if self._task is None:
+            self._sink = sink
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flusher and write out what is still buffered"""
+        if self._task is not None:
+            # Let an in-flight insert finish rather than cancelling it halfway
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if self._sink is not None:
+            await self.flush()
+
+    def status(self) -> dict:
+        return {
+            **self.stats,
+            "buffered": len(self._points),
+            "capacity": self.capacity,
+            "batch_size": self.batch_size,
+            "flush_seconds": self.flush_seconds,
+            "failing": self._failing
+        }
+
+
+# Shared by every request handled in this worker
+ingest_buffer = MetricIngestBuffer()
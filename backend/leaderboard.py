@@ -0,0 +1,179 @@
+import asyncio
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+# Boards are rebuilt from the goals collection at most this often, which also
+# picks up progress written by other workers
+REFRESH_SECONDS = 60
+
+
+def period_key(start_date: datetime, end_date: datetime) -> str:
+    return f"{start_date:%Y-%m-%d}/{end_date:%Y-%m-%d}"
+
+
+def attainment(goal: dict) -> Optional[float]:
+    target = goal.get("target_value") or 0
+    if target <= 0:
+        return None
+    return (goal.get("current_value") or 0) / target
+
+
+class Leaderboard:
+    """Goals of one unit and period ranked by attainment (current / target).
+
+    Rank keys are kept in a sorted list, so top-k is a slice and the rank
+    of a goal is a bisect: O(k) and O(log n) respectively.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[float, str]] = []
+        self._entries: Dict[str, dict] = {}
+        self._goals_by_user: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @staticmethod
+    def _key(entry: dict) -> Tuple[float, str]:
+        # Highest attainment first; goal id breaks ties deterministically
+        return -entry["attainment"], entry["goal_id"]
+
+    def upsert(self, entry: dict) -> None:
+        self.remove(entry["goal_id"])
+        self._entries[entry["goal_id"]] = entry
+        insort(self._keys, self._key(entry))
+        if entry.get("user_id"):
+            self._goals_by_user.setdefault(entry["user_id"], set()).add(entry["goal_id"])
+
+    def remove(self, goal_id: str) -> None:
+        entry = self._entries.pop(goal_id, None)
+        if entry is None:
+            return
+        del self._keys[bisect_left(self._keys, self._key(entry))]
+        goals = self._goals_by_user.get(entry.get("user_id"))
+        if goals is not None:
+            goals.discard(goal_id)
+            if not goals:
+                del self._goals_by_user[entry["user_id"]]
+
+    def top(self, limit: int = 10, offset: int = 0) -> List[dict]:
+        return [
+            {"rank": offset + index + 1, **self._entries[goal_id]}
+            for index, (_, goal_id) in enumerate(self._keys[offset:offset + limit])
+        ]
+
+    def rank_of_user(self, user_id: str) -> Optional[dict]:
+        """Best-ranked goal of a user"""
+        ranked = [
+            (bisect_left(self._keys, self._key(self._entries[goal_id])) + 1, goal_id)
+            for goal_id in self._goals_by_user.get(user_id, ())
+        ]
+        if not ranked:
+            return None
+        rank, goal_id = min(ranked)
+        return {"rank": rank, **self._entries[goal_id]}
+
+
+class LeaderboardRegistry:
+    """Per-worker leaderboards keyed by (unit, period)"""
+
+    def __init__(self):
+        self.boards: Dict[Tuple[str, str], Leaderboard] = {}
+        self._board_of_goal: Dict[str, Tuple[str, str]] = {}
+        self._loaded_at: Optional[float] = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        # Local changes made while a rebuild reads the goals, replayed onto its result
+        self._replay: Optional[List[Tuple[str, object]]] = None
+
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < REFRESH_SECONDS
+
+    async def ensure_loaded(self, db) -> None:
+        """Rebuild every REFRESH_SECONDS; reads keep the previous boards until the new ones are complete"""
+        if self._fresh():
+            return
+        async with self._lock:
+            if self._fresh():
+                # Rebuilt by a concurrent caller
+                return
+            generation = self._generation
+            self._replay = []
+            try:
+                loaded = LeaderboardRegistry()
+                projection = {"_id": 0, "id": 1, "title": 1, "unit": 1, "user_id": 1, "team_id": 1,
+                              "current_value": 1, "target_value": 1, "start_date": 1, "end_date": 1, "is_active": 1}
+                async for goal in db["goals"].find({"is_active": {"$ne": False}, "target_value": {"$gt": 0}}, projection):
+                    loaded.apply(goal)
+            finally:
+                replay, self._replay = self._replay, None
+            for change, value in replay:
+                if change == "apply":
+                    loaded.apply(value)
+                else:
+                    loaded.remove(value)
+            self.boards, self._board_of_goal = loaded.boards, loaded._board_of_goal
+            # Bulk writes invalidated during the read may be missing; rebuild again on the next read
+            self._loaded_at = time.monotonic() if generation == self._generation else None
+
+    def invalidate(self) -> None:
+        """Force a rebuild on the next read (after bulk writes)"""
+        self._generation += 1
+        self._loaded_at = None
+
+    def apply(self, goal: dict) -> None:
+        """Insert, move or drop a goal after a change"""
+        if self._replay is not None:
+            self._replay.append(("apply", goal))
+        self._drop(goal["id"])
+        score = attainment(goal)
+        if score is None or goal.get("is_active") is False or not goal.get("start_date") or not goal.get("end_date"):
+            return
+        board_key = (goal["unit"], period_key(goal["start_date"], goal["end_date"]))
+        self.boards.setdefault(board_key, Leaderboard()).upsert({
+            "goal_id": goal["id"],
+            "title": goal.get("title"),
+            "user_id": goal.get("user_id"),
+            "team_id": goal.get("team_id"),
+            "current_value": goal.get("current_value") or 0,
+            "target_value": goal["target_value"],
+            "attainment": score
+        })
+        self._board_of_goal[goal["id"]] = board_key
+
+    def remove(self, goal_id: str) -> None:
+        if self._replay is not None:
+            self._replay.append(("remove", goal_id))
+        self._drop(goal_id)
+
+    def _drop(self, goal_id: str) -> None:
+        board_key = self._board_of_goal.pop(goal_id, None)
+        if board_key is None:
+            return
+        board = self.boards[board_key]
+        board.remove(goal_id)
+        if not len(board):
+            del self.boards[board_key]
+
+    def periods(self, unit: str) -> List[str]:
+        return sorted(period for board_unit, period in self.boards if board_unit == unit)
+
+    def get(self, unit: str, period: str = None) -> Tuple[Optional[str], Optional[Leaderboard]]:
+        """Get a board; without a period, the largest board whose period covers today"""
+        if period:
+            return period, self.boards.get((unit, period))
+        today = f"{datetime.utcnow():%Y-%m-%d}"
+        current = [
+            (len(board), board_period) for (board_unit, board_period), board in self.boards.items()
+            if board_unit == unit and board_period.split("/")[0] <= today <= board_period.split("/")[1]
+        ]
+        if not current:
+            return None, None
+        _, board_period = max(current)
+        return board_period, self.boards[(unit, board_period)]
+
+
+# Shared by every request handled in this worker
+leaderboards = LeaderboardRegistry()
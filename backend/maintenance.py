@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Maintenance jobs for the StarPrint CRM backend.
+
+Run from the backend directory, e.g. from cron:
+    python maintenance.py reconcile-agent-stats --days 30
+    python maintenance.py archive-tickets --older-than-days 90
+    python maintenance.py compare-monitoring-storage --days 7 --hours 1
+    python maintenance.py rebuild-metric-rollups --days 7
+    python maintenance.py enable-metric-retention
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+from database import get_database, create_email_indexes, create_metric_retention, raw_metrics_expire
+from rollups import METRIC_RAW_RETENTION_DAYS
+from services import (
+    AgentStatsService, TicketService, GoalService, AttendanceService, BucketedAttendanceService,
+    get_attendance_service, MonitoringService, TimeSeriesMonitoringService, MetricRollupService,
+    MetricSketchService, get_monitoring_service
+)
+
+
+async def reconcile_agent_stats(db, args):
+    return await AgentStatsService(db).reconcile(args.days)
+
+
+async def archive_tickets(db, args):
+    return await TicketService(db).archive_closed(args.older_than_days, args.batch_size, args.max_batches)
+
+
+async def recompute_goals(db, args):
+    return await GoalService(db).recompute_progress(args.goal_ids or None)
+
+
+async def backfill_attendance_day_keys(db, args):
+    return await AttendanceService(db).backfill_day_keys()
+
+
+async def migrate_attendance_buckets(db, args):
+    return await BucketedAttendanceService(db).migrate_from_daily()
+
+
+async def classify_attendance(db, args):
+    end = datetime.utcnow()
+    start = (end - timedelta(days=args.days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return await get_attendance_service(db).classify_records(start, end, args.user_id)
+
+
+async def backfill_emails(db, args):
+    return await create_email_indexes(db)
+
+
+async def collection_size(db, name: str) -> dict:
+    stats = await db.command("collStats", name)
+    return {
+        "documents": stats.get("count", 0),
+        "size_bytes": stats.get("size", 0),
+        "storage_bytes": stats.get("storageSize", 0),
+        "index_bytes": stats.get("totalIndexSize", 0)
+    }
+
+
+async def time_reads(read, keys) -> dict:
+    timings = []
+    for key in keys:
+        start = time.perf_counter()
+        await read(key)
+        timings.append((time.perf_counter() - start) * 1000)
+    if not timings:
+        return {}
+    return {"reads": len(timings), "mean_ms": statistics.mean(timings), "median_ms": statistics.median(timings)}
+
+
+async def compare_attendance_storage(db, args):
+    """Compare storage size and monthly timesheet read latency of daily vs bucketed attendance"""
+    start = datetime.strptime(args.month, "%Y-%m")
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(microseconds=1)
+    user_ids = (await db.attendance_buckets.distinct("user_id", {"month_key": args.month}))[:args.users]
+    
+    daily = AttendanceService(db)
+    bucketed = BucketedAttendanceService(db)
+    return {
+        "month": args.month,
+        "storage": {
+            "daily": await collection_size(db, "attendance"),
+            "bucket": await collection_size(db, "attendance_buckets")
+        },
+        "timesheet_reads": {
+            "daily": await time_reads(lambda user_id: daily.get_by_user_range(user_id, start, end), user_ids),
+            "bucket": await time_reads(lambda user_id: bucketed.get_by_user_range(user_id, start, end), user_ids)
+        }
+    }
+
+
+async def migrate_monitoring_timeseries(db, args):
+    return await TimeSeriesMonitoringService(db).migrate_from_collection(args.batch_size)
+
+
+async def compare_monitoring_storage(db, args):
+    """Compare storage size and time-range read latency of regular vs time-series metrics"""
+    # Evenly spaced windows over the last `days`
+    window = timedelta(hours=args.hours)
+    first = datetime.utcnow() - timedelta(days=args.days)
+    step = (timedelta(days=args.days) - window) / max(args.reads - 1, 1)
+    windows = [(first + step * index, first + step * index + window) for index in range(args.reads)]
+    
+    async def range_read(service, window):
+        start, stop = window
+        return await service.get_all(limit=1000, filters={"timestamp": {"$gte": start, "$lte": stop}})
+    
+    regular = MonitoringService(db)
+    timeseries = TimeSeriesMonitoringService(db)
+    return {
+        "window_hours": args.hours,
+        "storage": {
+            "collection": await collection_size(db, "monitoring_metrics"),
+            "timeseries": await collection_size(db, timeseries.collection.name)
+        },
+        "range_reads": {
+            "collection": await time_reads(lambda window: range_read(regular, window), windows),
+            "timeseries": await time_reads(lambda window: range_read(timeseries, window), windows)
+        }
+    }
+
+
+async def rebuild_metric_rollups(db, args):
+    end = datetime.utcnow()
+    start = end - timedelta(days=args.days)
+    return {
+        "rollups": await MetricRollupService(db).rebuild(start, end, args.batch_size),
+        "sketches": await MetricSketchService(db).rebuild(start, end, args.batch_size)
+    }
+
+
+async def enable_metric_retention(db, args):
+    """Roll up and sketch the whole raw metric history, then let raw metrics expire"""
+    raw = get_monitoring_service(db)
+    raw_expires = await raw_metrics_expire(raw.collection)
+    oldest = await raw.collection.aggregate(
+        raw._points_pipeline({"timestamp": {"$type": "date"}}, sort={"timestamp": 1}, limit=1)
+    ).to_list(length=1)
+    result = {"raw_already_expiring": raw_expires}
+    if oldest:
+        start, end = oldest[0]["timestamp"], datetime.utcnow()
+        result["rollups"] = await MetricRollupService(db).rebuild(start, end, args.batch_size, raw_expires)
+        result["sketches"] = await MetricSketchService(db).rebuild(start, end, args.batch_size, raw_expires)
+    await create_metric_retention(db)
+    result["retention_days"] = METRIC_RAW_RETENTION_DAYS
+    return result
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="StarPrint CRM maintenance jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    reconcile = subparsers.add_parser("reconcile-agent-stats", help="Rebuild agent_stats from tickets")
+    reconcile.add_argument("--days", type=int, default=30, help="Days of per-day resolved counts to keep")
+    reconcile.set_defaults(job=reconcile_agent_stats)
+    
+    archive = subparsers.add_parser("archive-tickets", help="Move old resolved/closed tickets to tickets_archive")
+    archive.add_argument("--older-than-days", type=int, default=90)
+    archive.add_argument("--batch-size", type=int, default=500)
+    archive.add_argument("--max-batches", type=int, default=None)
+    archive.set_defaults(job=archive_tickets)
+    
+    goals = subparsers.add_parser("recompute-goals", help="Recompute ticket-driven goal progress")
+    goals.add_argument("goal_ids", nargs="*", help="Limit to these goals (default: all active)")
+    goals.set_defaults(job=recompute_goals)
+    
+    day_keys = subparsers.add_parser("backfill-attendance-day-keys",
+                                     help="Add day_key to legacy attendance records, list duplicate days, create the unique day index")
+    day_keys.set_defaults(job=backfill_attendance_day_keys)
+    
+    buckets = subparsers.add_parser("migrate-attendance-buckets",
+                                    help="Copy daily attendance records into monthly buckets (safe to re-run)")
+    buckets.set_defaults(job=migrate_attendance_buckets)
+    
+    classify = subparsers.add_parser("classify-attendance",
+                                     help="Mark attendance as late / early leave against user schedules")
+    classify.add_argument("--days", type=int, default=30, help="Days of history to classify")
+    classify.add_argument("--user-id", default=None)
+    classify.set_defaults(job=classify_attendance)
+    
+    emails = subparsers.add_parser("backfill-normalized-emails",
+                                   help="Add email_normalized to users/customers, list duplicates, create unique indexes")
+    emails.set_defaults(job=backfill_emails)
+    
+    compare = subparsers.add_parser("compare-attendance-storage",
+                                    help="Compare size and timesheet read latency of daily vs bucketed attendance")
+    compare.add_argument("--month", default=datetime.utcnow().strftime("%Y-%m"), help="Month to read (YYYY-MM)")
+    compare.add_argument("--users", type=int, default=200, help="Number of users to sample")
+    compare.set_defaults(job=compare_attendance_storage)
+    
+    metrics = subparsers.add_parser("migrate-monitoring-timeseries",
+                                    help="Copy monitoring metrics into the time-series collection (resumable)")
+    metrics.add_argument("--batch-size", type=int, default=1000)
+    metrics.set_defaults(job=migrate_monitoring_timeseries)
+    
+    compare_metrics = subparsers.add_parser("compare-monitoring-storage",
+                                            help="Compare size and range-query latency of regular vs time-series metrics")
+    compare_metrics.add_argument("--days", type=int, default=7, help="Period to sample windows from")
+    compare_metrics.add_argument("--hours", type=int, default=1, help="Length of each range query")
+    compare_metrics.add_argument("--reads", type=int, default=50, help="Number of range queries")
+    compare_metrics.set_defaults(job=compare_monitoring_storage)
+    
+    rollups = subparsers.add_parser("rebuild-metric-rollups",
+                                    help="Recompute metric rollups and quantile sketches from raw metrics")
+    rollups.add_argument("--days", type=int, default=7, help="Days of raw metrics to roll up")
+    rollups.add_argument("--batch-size", type=int, default=1000)
+    rollups.set_defaults(job=rebuild_metric_rollups)
+    
+    retention = subparsers.add_parser("enable-metric-retention",
+                                      help="Roll up the whole raw metric history, then expire raw metrics "
+                                           "after METRIC_RAW_RETENTION_DAYS (re-run after changing it)")
+    retention.add_argument("--batch-size", type=int, default=1000)
+    retention.set_defaults(job=enable_metric_retention)
+    
+    return parser
+
+
+async def main():
+    args = build_parser().parse_args()
+    db = get_database()
+    result = await args.job(db, args)
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, conint
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -94,12 +94,15 @@ class UserUpdate(BaseModel):
 
 
 # Schedule Models
+Weekday = conint(ge=0, le=6)  # 0=Monday
+
+
 class Schedule(BaseEntity):
     name: str
     user_id: str
     start_time: str  # "09:00"
     end_time: str    # "18:00"
-    days_of_week: List[int]  # [0, 1, 2, 3, 4] (0=Monday)
+    days_of_week: List[Weekday]  # [0, 1, 2, 3, 4] (0=Monday)
     is_active: bool = True
 
 
@@ -108,14 +111,14 @@ class ScheduleCreate(BaseModel):
     user_id: str
     start_time: str
     end_time: str
-    days_of_week: List[int]
+    days_of_week: List[Weekday]
 
 
 class ScheduleUpdate(BaseModel):
     name: Optional[str] = None
     start_time: Optional[str] = None
     end_time: Optional[str] = None
-    days_of_week: Optional[List[int]] = None
+    days_of_week: Optional[List[Weekday]] = None
     is_active: Optional[bool] = None
 
 
@@ -130,6 +133,8 @@ class Attendance(BaseEntity):
     status: AttendanceStatus = AttendanceStatus.PRESENT
     notes: Optional[str] = None
     hours_worked: Optional[float] = None
+    minutes_late: Optional[int] = None
+    minutes_early_leave: Optional[int] = None
 
 
 class AttendanceCreate(BaseModel):
@@ -277,13 +282,18 @@ class MonitoringMetric(BaseEntity):
 
 class MonitoringMetricCreate(BaseModel):
     name: str
-    value: float
+    value: float = Field(allow_inf_nan=False)  # NaN / Infinity would poison rollups and sketches
     unit: str
     category: str
     user_id: Optional[str] = None
     metadata: Dict[str, Any] = {}
 
 
+class MonitoringMetricIngest(MonitoringMetricCreate):
+    """A sample sent to the batch ingestion endpoint; collectors may stamp their own time"""
+    timestamp: Optional[datetime] = None
+
+
 # Report Models
 class Report(BaseEntity):
     title: str
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# An agent sending heartbeats is considered offline after missing them for this long
+PRESENCE_TTL_SECONDS = int(os.environ.get('PRESENCE_TTL_SECONDS', 90))
+# Status changes are written to the users collection in batches this often
+PRESENCE_FLUSH_SECONDS = float(os.environ.get('PRESENCE_FLUSH_SECONDS', 5))
+
+OFFLINE_STATUS = "inactive"
+
+# User fields kept alongside the presence entry so status reads never query users
+PROFILE_FIELDS = ("id", "name", "email", "role", "department", "skills", "is_active")
+
+
+class PresenceStore:
+    """In-memory agent presence with heartbeats, expiry and write-behind persistence.
+
+    Entries are indexed by status, so "who is available" is a set lookup.
+    Status changes only mark the user dirty; the flusher persists the latest
+    status of every dirty user in one bulk write. Each worker process keeps
+    its own map, like the event hub.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, dict] = {}
+        self._by_status: Dict[str, Set[str]] = {}
+        self._dirty: Dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _index(self, user_id: str, status: Optional[str]) -> None:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            users = self._by_status.get(entry["status"])
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._by_status[entry["status"]]
+        if status is not None:
+            self._by_status.setdefault(status, set()).add(user_id)
+
+    def known(self, user_id: str) -> bool:
+        return user_id in self._entries
+
+    def set_status(self, user: dict, status: str) -> dict:
+        """Record a status change for a user (a users document or cached profile)"""
+        user_id = user["id"]
+        now = datetime.utcnow()
+        self._index(user_id, status)
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = {"profile": {}}
+        entry["profile"] = {field: user[field] for field in PROFILE_FIELDS if field in user} or entry["profile"]
+        if entry.get("status") != status:
+            entry["status_changed_at"] = now
+            self._dirty[user_id] = {"status": status, "status_changed_at": now}
+        entry["status"] = status
+        entry["last_seen"] = time.monotonic()
+        return self.view(user_id)
+
+    def heartbeat(self, user_id: str) -> Optional[dict]:
+        """Keep a known user online; returns None if the user has no presence yet"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        entry["last_seen"] = time.monotonic()
+        # From now on a lapse in heartbeats takes the user offline
+        entry["heartbeats"] = True
+        return self.view(user_id)
+
+    def update_profile(self, user: dict) -> None:
+        """Refresh the cached profile after the user document changed"""
+        entry = self._entries.get(user["id"])
+        if entry is not None:
+            entry["profile"] = {field: user[field] for field in PROFILE_FIELDS if field in user}
+
+    def remove(self, user_id: str) -> None:
+        self._index(user_id, None)
+        self._entries.pop(user_id, None)
+        self._dirty.pop(user_id, None)
+
+    def view(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        return {**entry["profile"], "status": entry["status"], "status_changed_at": entry["status_changed_at"]}
+
+    def overlay(self, doc: Optional[dict]) -> Optional[dict]:
+        """Replace a users document's persisted status with the live one"""
+        if doc is not None:
+            entry = self._entries.get(doc.get("id"))
+            if entry is not None:
+                doc["status"] = entry["status"]
+        return doc
+
+    def with_status(self, status: str, skills: Iterable[str] = ()) -> List[dict]:
+        """Users currently in a status, optionally having every one of skills"""
+        required = set(skills)
+        views = []
+        for user_id in self._by_status.get(status, ()):
+            profile = self._entries[user_id]["profile"]
+            if profile.get("is_active") is False:
+                continue
+            if required and not required.issubset(profile.get("skills") or ()):
+                continue
+            views.append(self.view(user_id))
+        return views
+
+    def user_ids(self, status: str) -> Set[str]:
+        """Ids of users currently in a status"""
+        return set(self._by_status.get(status, ()))
+
+    def counts(self) -> Dict[str, int]:
+        return {status: len(users) for status, users in self._by_status.items()}
+
+    def expire(self) -> int:
+        """Mark users whose heartbeat lapsed as offline.
+        
+        Clients that only set statuses (and never send heartbeats) keep
+        the status they set.
+        """
+        deadline = time.monotonic() - PRESENCE_TTL_SECONDS
+        expired = [
+            user_id for user_id, entry in self._entries.items()
+            if entry.get("heartbeats") and entry["last_seen"] < deadline and entry["status"] != OFFLINE_STATUS
+        ]
+        for user_id in expired:
+            self.set_status(self._entries[user_id]["profile"] or {"id": user_id}, OFFLINE_STATUS)
+        return len(expired)
+
+    async def flush(self, db) -> int:
+        """Persist the latest status of every user changed since the last flush"""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        operations = [UpdateOne({"id": user_id}, {"$set": fields}) for user_id, fields in dirty.items()]
+        try:
+            await db["users"].bulk_write(operations, ordered=False)
+        except Exception:
+            # Keep the changes for the next flush unless newer ones arrived meanwhile
+            for user_id, fields in dirty.items():
+                self._dirty.setdefault(user_id, fields)
+            raise
+        return len(operations)
+
+    async def load(self, db) -> int:
+        """Register the persisted status of every user not already present"""
+        loaded = 0
+        projection = {"_id": 0, "status": 1, "status_changed_at": 1, **{field: 1 for field in PROFILE_FIELDS}}
+        async for user in db["users"].find({"status": {"$type": "string"}}, projection):
+            if user["id"] in self._entries:
+                # Changed through this worker while loading
+                continue
+            self._index(user["id"], user["status"])
+            self._entries[user["id"]] = {
+                "profile": {field: user[field] for field in PROFILE_FIELDS if field in user},
+                "status": user["status"],
+                "status_changed_at": user.get("status_changed_at"),
+                "last_seen": time.monotonic()
+            }
+            loaded += 1
+        return loaded
+
+    async def _run(self, db) -> None:
+        while True:
+            await asyncio.sleep(PRESENCE_FLUSH_SECONDS)
+            try:
+                self.expire()
+                await self.flush(db)
+            except Exception as e:
+                logger.warning(f"Could not flush agent presence: {e}")
+
+    async def start(self, db) -> None:
+        """Load the persisted statuses, then keep flushing changes in the background"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(db))
+            try:
+                loaded = await self.load(db)
+                logger.info(f"Loaded the presence of {loaded} users")
+            except Exception as e:
+                logger.warning(f"Could not load agent presence: {e}")
+
+    async def stop(self, db) -> None:
+        """Stop the flusher and write out pending changes"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush(db)
+
+
+# Shared by every request handled in this worker
+presence = PresenceStore()
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Samples kept per worker; the oldest are overwritten first
+RECENT_METRICS_CAPACITY = int(os.environ.get('RECENT_METRICS_CAPACITY', 1_000_000))
+# Longest window the recent-metrics queries answer
+RECENT_METRICS_WINDOW_MINUTES = int(os.environ.get('RECENT_METRICS_WINDOW_MINUTES', 60))
+
+GROUP_FIELDS = ("name", "category", "user_id")
+AGGREGATES = ("count", "sum", "avg", "min", "max")
+
+# A dictionary is compacted to the values still in the buffer once it reaches this size, then twice its live size
+MIN_DICTIONARY_COMPACT = 1024
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_millis(timestamp: datetime) -> int:
+    return (timestamp - _EPOCH) // timedelta(milliseconds=1)
+
+
+def from_millis(millis: int) -> datetime:
+    return _EPOCH + timedelta(milliseconds=int(millis))
+
+
+class StringDictionary:
+    """Dictionary encoding of a string column; code 0 stands for a missing value"""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self.values: List[Optional[str]] = [None]
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: Optional[str]) -> Optional[int]:
+        """Code of an existing value, None if it was never seen"""
+        return 0 if value is None else self._codes.get(value)
+
+    def compact(self, used: np.ndarray) -> np.ndarray:
+        """Keep only the codes in `used` (sorted); returns the old-to-new code mapping"""
+        used = used[used != 0]
+        mapping = np.zeros(len(self.values), dtype=np.int32)
+        mapping[used] = np.arange(1, len(used) + 1, dtype=np.int32)
+        self.values = [None] + [self.values[code] for code in used]
+        self._codes = {value: code for code, value in enumerate(self.values) if code}
+        return mapping
+
+
+class RecentMetrics:
+    """Per-worker columnar ring buffer of the most recent metric samples.
+
+    Timestamps (epoch milliseconds) and values are NumPy arrays; name,
+    category and user_id are dictionary-encoded into integer columns. Fed
+    by the metric insert path and warmed from the store at startup, it
+    answers interval, rate and top-k queries over the last
+    RECENT_METRICS_WINDOW_MINUTES with vectorized operations. Each worker
+    only sees the samples stored through it after startup.
+    """
+
+    def __init__(self, capacity: int = RECENT_METRICS_CAPACITY, window_minutes: int = RECENT_METRICS_WINDOW_MINUTES):
+        self.capacity = capacity
+        self.window = timedelta(minutes=window_minutes)
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.codes = {field: np.zeros(capacity, dtype=np.int32) for field in GROUP_FIELDS}
+        self.dictionaries = {field: StringDictionary() for field in GROUP_FIELDS}
+        self._compact_at = {field: MIN_DICTIONARY_COMPACT for field in GROUP_FIELDS}
+        self._next = 0
+        self._size = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, metrics: List[dict]) -> int:
+        """Add stored metrics; samples without a datetime timestamp and numeric value are skipped"""
+        metrics = [
+            metric for metric in metrics
+            if isinstance(metric.get("timestamp"), datetime) and isinstance(metric.get("value"), (int, float))
+        ][-self.capacity:]
+        if not metrics:
+            return 0
+        slots = (self._next + np.arange(len(metrics))) % self.capacity
+        self.timestamps[slots] = [to_millis(metric["timestamp"]) for metric in metrics]
+        self.values[slots] = [metric["value"] for metric in metrics]
+        for field in GROUP_FIELDS:
+            encode = self.dictionaries[field].encode
+            self.codes[field][slots] = [encode(metric.get(field)) for metric in metrics]
+        self._next = (self._next + len(metrics)) % self.capacity
+        self._size = min(self._size + len(metrics), self.capacity)
+        for field in GROUP_FIELDS:
+            if len(self.dictionaries[field].values) >= self._compact_at[field]:
+                self._compact(field)
+        return len(metrics)
+
+    def _compact(self, field: str) -> None:
+        """Forget values whose samples were all overwritten.
+
+        Runs once the dictionary doubles, so the cost is amortized over the
+        values added and the dictionary stays within twice the distinct
+        values still in the buffer.
+        """
+        codes = self.codes[field][:self._size]
+        mapping = self.dictionaries[field].compact(np.unique(codes))
+        codes[:] = mapping[codes]
+        self._compact_at[field] = max(MIN_DICTIONARY_COMPACT, 2 * len(self.dictionaries[field].values))
+
+    def _select(self, minutes: int, now: datetime = None, **filters) -> np.ndarray:
+        """Positions of samples in the last `minutes` matching field=value filters"""
+        since = to_millis((now or datetime.utcnow()) - timedelta(minutes=minutes))
+        mask = self.timestamps[:self._size] >= since
+        for field, value in filters.items():
+            if value is None:
+                continue
+            code = self.dictionaries[field].lookup(value)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.codes[field][:self._size] == code
+        return np.flatnonzero(mask)
+
+    def _coverage(self, minutes: int, now: datetime = None) -> dict:
+        """Whether the buffer still holds every sample of the window"""
+        since = (now or datetime.utcnow()) - timedelta(minutes=minutes)
+        oldest = from_millis(self.timestamps[:self._size].min()) if self._size else None
+        wrapped = self._size == self.capacity
+        return {"since": since, "oldest_sample": oldest, "complete": not wrapped or oldest <= since}
+
+    @staticmethod
+    def _aggregate(groups: np.ndarray, values: np.ndarray, size: int) -> Dict[str, np.ndarray]:
+        """count/sum/avg/min/max of values per group index in [0, size)"""
+        counts = np.bincount(groups, minlength=size)
+        sums = np.bincount(groups, weights=values, minlength=size)
+        mins = np.full(size, np.inf)
+        maxs = np.full(size, -np.inf)
+        np.minimum.at(mins, groups, values)
+        np.maximum.at(maxs, groups, values)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avgs = sums / counts
+        return {"count": counts, "sum": sums, "avg": avgs, "min": mins, "max": maxs}
+
+    def series(self, name: str, minutes: int = 15, interval: int = 60, category: str = None,
+               user_id: str = None, now: datetime = None) -> dict:
+        """One metric grouped into `interval`-second buckets"""
+        positions = self._select(minutes, now, name=name, category=category, user_id=user_id)
+        buckets = self.timestamps[positions] // (interval * 1000)
+        starts, groups = np.unique(buckets, return_inverse=True)
+        stats = self._aggregate(groups.ravel(), self.values[positions], len(starts))
+        points = [
+            {"start": from_millis(start * interval * 1000), **{key: stats[key][index].item() for key in AGGREGATES}}
+            for index, start in enumerate(starts)
+        ]
+        return {"name": name, "interval": interval, **self._coverage(minutes, now), "points": points}
+
+    def rates(self, minutes: int = 5, group_by: str = "name", name: str = None, category: str = None,
+              now: datetime = None) -> dict:
+        """Samples per second and value per second of each group over the window"""
+        positions = self._select(minutes, now, name=name, category=category)
+        dictionary = self.dictionaries[group_by]
+        codes = self.codes[group_by][positions]
+        stats = self._aggregate(codes, self.values[positions], len(dictionary.values))
+        seconds = minutes * 60
+        present = np.flatnonzero(stats["count"])
+        rates = [
+            {
+                group_by: dictionary.values[code],
+                "samples": stats["count"][code].item(),
+                "samples_per_second": stats["count"][code].item() / seconds,
+                "value_per_second": stats["sum"][code].item() / seconds
+            }
+            for code in present
+        ]
+        rates.sort(key=lambda rate: rate["samples"], reverse=True)
+        return {"group_by": group_by, "seconds": seconds, **self._coverage(minutes, now), "rates": rates}
+
+    def top(self, k: int = 10, by: str = "user_id", aggregate: str = "sum", minutes: int = 15,
+            name: str = None, category: str = None, now: datetime = None) -> dict:
+        """The k groups with the highest aggregate over the window"""
+        positions = self._select(minutes, now, name=name, category=category)
+        dictionary = self.dictionaries[by]
+        codes = self.codes[by][positions]
+        stats = self._aggregate(codes, self.values[positions], len(dictionary.values))
+        present = np.flatnonzero(stats["count"])
+        if by == "user_id":
+            # Samples without a user are not a contender
+            present = present[present != 0]
+        scores = stats[aggregate][present]
+        if len(present) > k:
+            chosen = np.argpartition(-scores, k - 1)[:k]
+        else:
+            chosen = np.arange(len(present))
+        chosen = chosen[np.argsort(-scores[chosen], kind="stable")]
+        top = [
+            {by: dictionary.values[present[index]], **{key: stats[key][present[index]].item() for key in AGGREGATES}}
+            for index in chosen
+        ]
+        return {"by": by, "aggregate": aggregate, **self._coverage(minutes, now), "top": top}
+
+    async def warm(self, service) -> int:
+        """Load the current window from the metric store.
+
+        Only metrics created before the load started are read; later ones
+        arrive through `append`, so nothing is counted twice.
+        """
+        started = datetime.utcnow()
+        pipeline = service._points_pipeline(
+            {"timestamp": {"$gte": started - self.window}, "created_at": {"$lt": started}},
+            sort={"timestamp": -1}
+        ) + [
+            {"$limit": self.capacity},
+            {"$project": {"_id": 0, "timestamp": 1, "value": 1, **{field: 1 for field in GROUP_FIELDS}}}
+        ]
+        metrics = await service.collection.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+        return self.append(metrics[::-1])
+
+    async def _warm(self, service) -> None:
+        try:
+            loaded = await self.warm(service)
+            logger.info(f"Loaded {loaded} recent metrics")
+        except Exception as e:
+            logger.warning(f"Could not load recent metrics: {e}")
+
+    def start(self, service) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._warm(service))
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "samples": self._size,
+            "capacity": self.capacity,
+            "window_minutes": self.window // timedelta(minutes=1),
+            "distinct": {field: len(dictionary.values) - 1 for field, dictionary in self.dictionaries.items()}
+        }
+
+
+# Shared by every request handled in this worker
+recent_metrics = RecentMetrics()
@@ -0,0 +1,100 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo import UpdateOne
+
+# Raw metric points expire after this many days (once enable-metric-retention has run); older ranges are served from rollups
+METRIC_RAW_RETENTION_DAYS = int(os.environ.get('METRIC_RAW_RETENTION_DAYS', 30))
+
+
+class RollupTier(NamedTuple):
+    name: str
+    seconds: int
+    retention_days: int
+
+    @property
+    def collection(self) -> str:
+        return f"metric_rollups_{self.name}"
+
+
+# Finest first
+ROLLUP_TIERS = [
+    RollupTier("1m", 60, 14),
+    RollupTier("1h", 3600, 180),
+    RollupTier("1d", 86400, 1825),
+]
+
+SERIES_FIELDS = ("name", "category", "user_id")
+
+# Buffered ingestion can still add points this long after a bucket ends
+ROLLUP_SETTLE = timedelta(minutes=1)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(timestamp: datetime, seconds: int) -> datetime:
+    offset = int((timestamp - _EPOCH).total_seconds()) // seconds * seconds
+    return _EPOCH + timedelta(seconds=offset)
+
+
+def closed_before(end: datetime, seconds: int, now: datetime = None) -> datetime:
+    """End of the last whole bucket before `end` that no longer receives writes"""
+    settled = (now or datetime.utcnow()) - ROLLUP_SETTLE
+    return bucket_start(min(end, settled), seconds)
+
+
+def summarize(metrics: List[dict], seconds: int) -> Dict[Tuple, dict]:
+    """Pre-aggregate a batch per series and bucket so each bucket is written once"""
+    buckets: Dict[Tuple, dict] = {}
+    for metric in metrics:
+        timestamp = metric["timestamp"]
+        key = tuple(metric.get(field) for field in SERIES_FIELDS) + (bucket_start(timestamp, seconds),)
+        value = metric["value"]
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = {"count": 1, "sum": value, "min": value, "max": value, "last": value, "last_at": timestamp}
+            continue
+        bucket["count"] += 1
+        bucket["sum"] += value
+        bucket["min"] = min(bucket["min"], value)
+        bucket["max"] = max(bucket["max"], value)
+        if timestamp >= bucket["last_at"]:
+            bucket["last"], bucket["last_at"] = value, timestamp
+    return buckets
+
+
+def rollup_operations(metrics: List[dict], seconds: int) -> List[UpdateOne]:
+    """Pipeline upserts merging a batch into one tier's buckets"""
+    operations = []
+    for key, bucket in summarize(metrics, seconds).items():
+        series = dict(zip(SERIES_FIELDS, key[:-1]))
+        operations.append(UpdateOne({**series, "start": key[-1]}, [{"$set": {
+            "count": {"$add": [{"$ifNull": ["$count", 0]}, bucket["count"]]},
+            "sum": {"$add": [{"$ifNull": ["$sum", 0]}, bucket["sum"]]},
+            # $min / $max ignore the missing field of a new bucket
+            "min": {"$min": ["$min", bucket["min"]]},
+            "max": {"$max": ["$max", bucket["max"]]},
+            "last": {"$cond": [
+                {"$gte": [bucket["last_at"], {"$ifNull": ["$last_at", _EPOCH]}]}, bucket["last"], "$last"
+            ]},
+            "last_at": {"$max": ["$last_at", bucket["last_at"]]}
+        }}], upsert=True))
+    return operations
+
+
+def choose_tier(start: datetime, resolution: int, now: datetime = None) -> Tuple[Optional[RollupTier], bool]:
+    """Coarsest source no coarser than `resolution` seconds that still holds `start`.
+
+    Returns (None, exact) for raw points. When only coarser data is retained
+    for `start`, returns the finest tier that holds it and exact=False.
+    """
+    now = now or datetime.utcnow()
+    sources = [(None, 0, METRIC_RAW_RETENTION_DAYS)] + [(tier, tier.seconds, tier.retention_days) for tier in ROLLUP_TIERS]
+    retained = [(tier, seconds) for tier, seconds, days in sources if start >= now - timedelta(days=days)]
+    fine_enough = [tier for tier, seconds in retained if seconds <= resolution]
+    if fine_enough:
+        return fine_enough[-1], True
+    if retained:
+        return retained[0][0], False
+    return ROLLUP_TIERS[-1], False
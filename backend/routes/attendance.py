@@ -1,13 +1,22 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from models import Attendance, AttendanceCreate, AttendanceUpdate, ApiResponse, PaginatedResponse
-from services import AttendanceService
+from services import get_attendance_service
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 import os
+import csv
+import io
 from datetime import datetime
 
 router = APIRouter(prefix="/attendance", tags=["attendance"])
 
+TIMESHEET_COLUMNS = [
+    "user_id", "name", "email", "department", "days", "present_days", "late_days",
+    "early_leave_days", "absences", "hours_worked", "break_hours"
+]
+
 # Dependency to get database
 async def get_database():
     from motor.motor_asyncio import AsyncIOMotorClient
@@ -21,7 +30,7 @@ async def get_database():
 async def create_attendance(attendance_data: AttendanceCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Create a new attendance record"""
     try:
-        attendance_service = AttendanceService(db)
+        attendance_service = get_attendance_service(db)
         
         attendance_dict = attendance_data.dict()
         attendance = await attendance_service.create(attendance_dict)
@@ -31,6 +40,8 @@ async def create_attendance(attendance_data: AttendanceCreate, db: AsyncIOMotorD
             message="Attendance record created successfully",
             data=attendance
         )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Attendance record already exists for this day")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -38,7 +49,7 @@ async def create_attendance(attendance_data: AttendanceCreate, db: AsyncIOMotorD
 async def get_attendance(attendance_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get attendance by ID"""
     try:
-        attendance_service = AttendanceService(db)
+        attendance_service = get_attendance_service(db)
         attendance = await attendance_service.get_by_id(attendance_id)
         
         if not attendance:
@@ -62,7 +73,7 @@ async def get_attendance_records(
 ):
     """Get all attendance records with pagination and filters"""
     try:
-        attendance_service = AttendanceService(db)
+        attendance_service = get_attendance_service(db)
         
         # Build filters
         filters = {}
@@ -94,7 +105,7 @@ async def update_attendance(
 ):
     """Update attendance record"""
     try:
-        attendance_service = AttendanceService(db)
+        attendance_service = get_attendance_service(db)
         
         # Check if attendance exists
         existing_attendance = await attendance_service.get_by_id(attendance_id)
@@ -117,7 +128,7 @@ async def update_attendance(
 async def delete_attendance(attendance_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Delete attendance record"""
     try:
-        attendance_service = AttendanceService(db)
+        attendance_service = get_attendance_service(db)
         
         # Check if attendance exists
         existing_attendance = await attendance_service.get_by_id(attendance_id)
@@ -141,7 +152,7 @@ async def delete_attendance(attendance_id: str, db: AsyncIOMotorDatabase = Depen
 async def get_attendance_by_user(user_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get attendance records by user"""
     try:
-        attendance_service = AttendanceService(db)
+        attendance_service = get_attendance_service(db)
         attendance_records = await attendance_service.get_all(filters={"user_id": user_id})
         
         return ApiResponse(
@@ -160,7 +171,7 @@ async def get_attendance_by_user_and_date(
 ):
     """Get attendance by user and date"""
     try:
-        attendance_service = AttendanceService(db)
+        attendance_service = get_attendance_service(db)
         
         # Parse date
         date_obj = datetime.strptime(date, "%Y-%m-%d")
@@ -187,7 +198,7 @@ async def check_in(
 ):
     """Check in user"""
     try:
-        attendance_service = AttendanceService(db)
+        attendance_service = get_attendance_service(db)
         
         attendance = await attendance_service.check_in(user_id, timestamp)
         
@@ -207,7 +218,7 @@ async def check_out(
 ):
     """Check out user"""
     try:
-        attendance_service = AttendanceService(db)
+        attendance_service = get_attendance_service(db)
         
         attendance = await attendance_service.check_out(user_id, timestamp)
         
@@ -231,7 +242,7 @@ async def get_attendance_by_date_range(
 ):
     """Get attendance records within date range"""
     try:
-        attendance_service = AttendanceService(db)
+        attendance_service = get_attendance_service(db)
         
         # Parse dates
         start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
@@ -254,4 +265,82 @@ async def get_attendance_by_date_range(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/classify/{start_date}/{end_date}", response_model=ApiResponse)
+async def classify_attendance(
+    start_date: str,  # Format: YYYY-MM-DD
+    end_date: str,    # Format: YYYY-MM-DD
+    user_id: Optional[str] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Mark records in a period as late or early leave against user schedules"""
+    try:
+        attendance_service = get_attendance_service(db)
+        
+        # Parse dates (end date is inclusive)
+        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
+        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").replace(
+            hour=23, minute=59, second=59, microsecond=999999
+        )
+        
+        result = await attendance_service.classify_records(start_date_obj, end_date_obj, user_id)
+        
+        return ApiResponse(
+            success=True,
+            message="Attendance records classified successfully",
+            data=result
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/timesheet/{start_date}/{end_date}")
+async def get_timesheet(
+    start_date: str,  # Format: YYYY-MM-DD
+    end_date: str,    # Format: YYYY-MM-DD
+    user_id: Optional[str] = Query(None),
+    format: str = Query("csv", pattern="^(csv|json)$"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get hours worked, late days and absences per user over a period"""
+    try:
+        attendance_service = get_attendance_service(db)
+        
+        # Parse dates (end date is inclusive)
+        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
+        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").replace(
+            hour=23, minute=59, second=59, microsecond=999999
+        )
+        
+        rows = attendance_service.timesheet(start_date_obj, end_date_obj, user_id)
+        
+        if format == "json":
+            return ApiResponse(
+                success=True,
+                message="Timesheet generated successfully",
+                data=[row async for row in rows]
+            )
+        
+        async def csv_chunks():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=TIMESHEET_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            async for row in rows:
+                writer.writerow(row)
+                if buffer.tell() > 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        
+        return StreamingResponse(
+            csv_chunks(),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="timesheet_{start_date}_{end_date}.csv"'}
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
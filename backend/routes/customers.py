@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import List, Optional
 from models import Customer, CustomerCreate, CustomerUpdate, ApiResponse, PaginatedResponse
-from services import CustomerService
+from services import CustomerService, InvalidSyncToken
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 import os
 
 router = APIRouter(prefix="/customers", tags=["customers"])
@@ -22,12 +23,7 @@ async def create_customer(customer_data: CustomerCreate, db: AsyncIOMotorDatabas
     try:
         customer_service = CustomerService(db)
         
-        # Check if email already exists
-        if customer_data.email:
-            existing_customer = await customer_service.get_by_email(customer_data.email)
-            if existing_customer:
-                raise HTTPException(status_code=400, detail="Email already exists")
-        
+        # Email uniqueness is enforced by a unique index
         customer_dict = customer_data.dict()
         customer = await customer_service.create(customer_dict)
         
@@ -36,6 +32,29 @@ async def create_customer(customer_data: CustomerCreate, db: AsyncIOMotorDatabas
             message="Customer created successfully",
             data=customer
         )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already exists")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/changes", response_model=ApiResponse)
+async def get_customer_changes(
+    since: Optional[str] = Query(None),
+    limit: int = Query(500, ge=1, le=1000),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get customers changed or deleted since a sync token"""
+    try:
+        customer_service = CustomerService(db)
+        changes = await customer_service.get_changes(since, limit)
+        
+        return ApiResponse(
+            success=True,
+            message="Customers changes retrieved successfully",
+            data=changes
+        )
+    except InvalidSyncToken:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -103,13 +122,7 @@ async def update_customer(
         if not existing_customer:
             raise HTTPException(status_code=404, detail="Customer not found")
         
-        # Check if email already exists for another customer
-        if customer_data.email:
-            email_customer = await customer_service.get_by_email(customer_data.email)
-            if email_customer and email_customer['id'] != customer_id:
-                raise HTTPException(status_code=400, detail="Email already exists")
-        
-        # Update customer
+        # Update customer (email uniqueness is enforced by a unique index)
         update_dict = customer_data.dict(exclude_unset=True)
         customer = await customer_service.update(customer_id, update_dict)
         
@@ -118,6 +131,10 @@ async def update_customer(
             message="Customer updated successfully",
             data=customer
         )
+    except HTTPException:
+        raise
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already exists")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
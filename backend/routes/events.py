@@ -0,0 +1,99 @@
+from fastapi import APIRouter, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from models import ApiResponse
+from events import hub
+import asyncio
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+KEEPALIVE_SECONDS = 15
+
+def build_subscription(topics: str, assigned_to: Optional[str], status: Optional[str], category: Optional[str]):
+    """Subscribe to the hub with the filters given as query parameters.
+    
+    Each filter only applies to the topics whose documents have that field
+    (events.FILTER_TOPICS); updates moving a document out of a filter are
+    still delivered.
+    """
+    filters = {}
+    if assigned_to:
+        filters["assigned_to"] = assigned_to
+    if status:
+        filters["status"] = status
+    if category:
+        filters["category"] = category
+    return hub.subscribe([topic.strip() for topic in topics.split(",") if topic.strip()], filters)
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    topics: str = Query("tickets,monitoring_metrics"),
+    assigned_to: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    category: Optional[str] = Query(None)
+):
+    """Server-Sent Events stream of document changes"""
+    subscription = build_subscription(topics, assigned_to, status, category)
+    
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.next(timeout=KEEPALIVE_SECONDS)
+                dropped = subscription.take_dropped()
+                if dropped:
+                    # The client fell behind; it should refetch instead of trusting the stream
+                    yield f"event: lagged\ndata: {dropped}\n\n"
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event.topic}\ndata: {event.payload}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws")
+async def websocket_events(
+    websocket: WebSocket,
+    topics: str = "tickets,monitoring_metrics",
+    assigned_to: Optional[str] = None,
+    status: Optional[str] = None,
+    category: Optional[str] = None
+):
+    """WebSocket stream of document changes"""
+    await websocket.accept()
+    subscription = build_subscription(topics, assigned_to, status, category)
+    
+    async def pump():
+        while True:
+            event = await subscription.next()
+            dropped = subscription.take_dropped()
+            if dropped:
+                await websocket.send_text(f'{{"action": "lagged", "dropped": {dropped}}}')
+            await websocket.send_text(event.payload)
+    
+    pump_task = asyncio.create_task(pump())
+    try:
+        # Incoming messages are ignored; reading detects the disconnect
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        pump_task.cancel()
+        hub.unsubscribe(subscription)
+
+@router.get("/stats", response_model=ApiResponse)
+async def get_event_stats():
+    """Get subscriber counts for this worker"""
+    return ApiResponse(
+        success=True,
+        message="Event hub statistics retrieved successfully",
+        data=hub.stats()
+    )
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import List, Optional
 from models import Goal, GoalCreate, GoalUpdate, ApiResponse, PaginatedResponse
-from services import GoalService
+from services import GoalService, InvalidSyncToken
 from motor.motor_asyncio import AsyncIOMotorDatabase
 import os
+from datetime import datetime
 
 router = APIRouter(prefix="/goals", tags=["goals"])
 
@@ -33,6 +34,27 @@ async def create_goal(goal_data: GoalCreate, db: AsyncIOMotorDatabase = Depends(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/changes", response_model=ApiResponse)
+async def get_goal_changes(
+    since: Optional[str] = Query(None),
+    limit: int = Query(500, ge=1, le=1000),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get goals changed or deleted since a sync token"""
+    try:
+        goal_service = GoalService(db)
+        changes = await goal_service.get_changes(since, limit)
+        
+        return ApiResponse(
+            success=True,
+            message="Goals changes retrieved successfully",
+            data=changes
+        )
+    except InvalidSyncToken:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/{goal_id}", response_model=ApiResponse)
 async def get_goal(goal_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get goal by ID"""
@@ -208,4 +230,151 @@ async def update_goal_progress(
             data=goal
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/progress/recompute", response_model=ApiResponse)
+async def recompute_goal_progress(
+    goal_ids: Optional[List[str]] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Recompute ticket-driven goal progress from tickets"""
+    try:
+        goal_service = GoalService(db)
+        result = await goal_service.recompute_progress(goal_ids)
+        
+        return ApiResponse(
+            success=True,
+            message="Goal progress recomputed successfully",
+            data=result
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/leaderboard/{unit}", response_model=ApiResponse)
+async def get_goal_leaderboard(
+    unit: str,
+    period: Optional[str] = Query(None),  # Format: YYYY-MM-DD/YYYY-MM-DD (goal start/end)
+    limit: int = Query(10, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get goals of a unit ranked by attainment (current_value / target_value)"""
+    try:
+        goal_service = GoalService(db)
+        leaderboard = await goal_service.get_leaderboard(unit, period, limit, offset)
+        
+        return ApiResponse(
+            success=True,
+            message="Leaderboard retrieved successfully",
+            data=leaderboard
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/leaderboard/{unit}/rank/{user_id}", response_model=ApiResponse)
+async def get_goal_leaderboard_rank(
+    unit: str,
+    user_id: str,
+    period: Optional[str] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get a user's rank on a goal leaderboard"""
+    try:
+        goal_service = GoalService(db)
+        rank = await goal_service.get_leaderboard_rank(unit, user_id, period)
+        
+        if not rank:
+            raise HTTPException(status_code=404, detail="User not ranked on this leaderboard")
+        
+        return ApiResponse(
+            success=True,
+            message="Leaderboard rank retrieved successfully",
+            data=rank
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{goal_id}/history", response_model=ApiResponse)
+async def get_goal_history(
+    goal_id: str,
+    start_date: Optional[str] = Query(None),  # Format: YYYY-MM-DD, defaults to the goal start
+    end_date: Optional[str] = Query(None),    # Format: YYYY-MM-DD, defaults to now
+    points: int = Query(200, ge=2, le=5000),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get downsampled goal progress history for burndown charts"""
+    try:
+        goal_service = GoalService(db)
+        
+        # Check if goal exists
+        goal = await goal_service.get_by_id(goal_id)
+        if not goal:
+            raise HTTPException(status_code=404, detail="Goal not found")
+        
+        # Parse dates (end date is inclusive)
+        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d") if start_date else goal["start_date"]
+        end_date_obj = datetime.utcnow()
+        if end_date:
+            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").replace(
+                hour=23, minute=59, second=59, microsecond=999999
+            )
+        
+        history = await goal_service.history.get_history(goal_id, start_date_obj, end_date_obj, points)
+        
+        return ApiResponse(
+            success=True,
+            message="Goal history retrieved successfully",
+            data={
+                "goal_id": goal_id,
+                "target_value": goal["target_value"],
+                "samples": history
+            }
+        )
+    except HTTPException:
+        raise
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/teams/rollup", response_model=ApiResponse)
+async def get_team_rollups(
+    unit: Optional[str] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get goal progress summed and averaged per team (department) and unit"""
+    try:
+        goal_service = GoalService(db)
+        rollups = await goal_service.get_team_rollups(unit)
+        
+        return ApiResponse(
+            success=True,
+            message="Team rollups retrieved successfully",
+            data=rollups
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/teams/{team_id}/dashboard", response_model=ApiResponse)
+async def get_team_dashboard(
+    team_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get a team's goal rollup and member goals in one request"""
+    try:
+        goal_service = GoalService(db)
+        dashboard = await goal_service.get_team_dashboard(team_id, limit)
+        
+        return ApiResponse(
+            success=True,
+            message="Team dashboard retrieved successfully",
+            data=dashboard
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,13 +1,26 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
 from typing import List, Optional
-from models import MonitoringMetric, MonitoringMetricCreate, ApiResponse, PaginatedResponse
-from services import MonitoringService
+from pydantic import TypeAdapter, ValidationError
+from models import MonitoringMetric, MonitoringMetricCreate, MonitoringMetricIngest, ApiResponse, PaginatedResponse
+from services import get_monitoring_service, MetricRollupService, MetricSketchService
+from ingest import ingest_buffer, BufferFull
+from recent_metrics import recent_metrics, RECENT_METRICS_WINDOW_MINUTES
 from motor.motor_asyncio import AsyncIOMotorDatabase
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter(prefix="/monitoring", tags=["monitoring"])
 
+# Largest number of samples accepted in one ingestion request
+INGEST_MAX_BATCH = int(os.environ.get('INGEST_MAX_BATCH', 10_000))
+
+# Validates a whole batch in one pass of pydantic-core
+metric_batch_adapter = TypeAdapter(List[MonitoringMetricIngest])
+
+def to_naive_utc(value: datetime) -> datetime:
+    # Stored datetimes are naive UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
 # Dependency to get database
 async def get_database():
     from motor.motor_asyncio import AsyncIOMotorClient
@@ -21,7 +34,7 @@ async def get_database():
 async def create_metric(metric_data: MonitoringMetricCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Create a new monitoring metric"""
     try:
-        monitoring_service = MonitoringService(db)
+        monitoring_service = get_monitoring_service(db)
         
         metric_dict = metric_data.dict()
         metric = await monitoring_service.create(metric_dict)
@@ -34,11 +47,163 @@ async def create_metric(metric_data: MonitoringMetricCreate, db: AsyncIOMotorDat
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/ingest", response_model=ApiResponse, status_code=202)
+async def ingest_metrics(request: Request):
+    """Accept a batch of metrics as a JSON array or NDJSON; they are written asynchronously"""
+    body = await request.body()
+    if "ndjson" in request.headers.get("content-type", ""):
+        # Join the lines into one array so the batch is validated in a single call
+        lines = [line for line in body.split(b"\n") if line.strip()]
+        body = b"[" + b",".join(lines) + b"]"
+    try:
+        metrics = metric_batch_adapter.validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False)[:20])
+    if len(metrics) > INGEST_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {INGEST_MAX_BATCH} metrics per request")
+    
+    try:
+        accepted = ingest_buffer.offer([metric.model_dump() for metric in metrics])
+    except BufferFull as e:
+        raise HTTPException(
+            status_code=503 if e.unavailable else 429,
+            detail="Metric store unavailable" if e.unavailable else "Ingest buffer is full",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    return ApiResponse(
+        success=True,
+        message="Metrics accepted",
+        data={"accepted": accepted}
+    )
+
+@router.get("/ingest/status", response_model=ApiResponse)
+async def get_ingest_status():
+    """Get this worker's ingest buffer counters"""
+    return ApiResponse(
+        success=True,
+        message="Ingest status retrieved successfully",
+        data=ingest_buffer.status()
+    )
+
+@router.get("/series/{name}", response_model=ApiResponse)
+async def get_metric_series(
+    name: str,
+    start: Optional[datetime] = Query(None, description="Defaults to 24 hours before end"),
+    end: Optional[datetime] = Query(None, description="Defaults to now"),
+    resolution: Optional[int] = Query(None, ge=1, description="Seconds per point; picked from max_points when omitted"),
+    max_points: int = Query(500, ge=1, le=10_000),
+    category: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get one metric aggregated over time, read from the coarsest rollup that fits"""
+    try:
+        end = to_naive_utc(end) if end else datetime.utcnow()
+        start = to_naive_utc(start) if start else end - timedelta(hours=24)
+        if start >= end:
+            raise HTTPException(status_code=400, detail="start must be before end")
+        
+        series = await MetricRollupService(db).get_series(name, start, end, resolution, max_points, category, user_id)
+        
+        return ApiResponse(
+            success=True,
+            message="Metric series retrieved successfully",
+            data=series
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/quantiles/{name}", response_model=ApiResponse)
+async def get_metric_quantiles(
+    name: str,
+    start: Optional[datetime] = Query(None, description="Defaults to 24 hours before end; rounded down to the hour"),
+    end: Optional[datetime] = Query(None, description="Defaults to now"),
+    q: List[float] = Query([0.5, 0.9, 0.95, 0.99], description="Quantiles between 0 and 1; repeat for several"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get estimated quantiles of one metric from its hourly sketches"""
+    try:
+        end = to_naive_utc(end) if end else datetime.utcnow()
+        start = to_naive_utc(start) if start else end - timedelta(hours=24)
+        if start >= end:
+            raise HTTPException(status_code=400, detail="start must be before end")
+        if any(quantile < 0 or quantile > 1 for quantile in q):
+            raise HTTPException(status_code=400, detail="Quantiles must be between 0 and 1")
+        
+        quantiles = await MetricSketchService(db).get_quantiles(name, start, end, q)
+        
+        return ApiResponse(
+            success=True,
+            message="Metric quantiles retrieved successfully",
+            data=quantiles
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/recent/status", response_model=ApiResponse)
+async def get_recent_metrics_status():
+    """Get this worker's recent-metrics buffer size"""
+    return ApiResponse(
+        success=True,
+        message="Recent metrics status retrieved successfully",
+        data=recent_metrics.status()
+    )
+
+@router.get("/recent/series/{name}", response_model=ApiResponse)
+async def get_recent_series(
+    name: str,
+    minutes: int = Query(15, ge=1, le=RECENT_METRICS_WINDOW_MINUTES),
+    interval: int = Query(60, ge=1, description="Seconds per point"),
+    category: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None)
+):
+    """Get one metric per interval over the last minutes, from memory"""
+    return ApiResponse(
+        success=True,
+        message="Recent metric series retrieved successfully",
+        data=recent_metrics.series(name, minutes, interval, category, user_id)
+    )
+
+@router.get("/recent/rates", response_model=ApiResponse)
+async def get_recent_rates(
+    minutes: int = Query(5, ge=1, le=RECENT_METRICS_WINDOW_MINUTES),
+    group_by: str = Query("name", pattern="^(name|category|user_id)$"),
+    name: Optional[str] = Query(None),
+    category: Optional[str] = Query(None)
+):
+    """Get samples and value per second of each group over the last minutes, from memory"""
+    return ApiResponse(
+        success=True,
+        message="Recent metric rates retrieved successfully",
+        data=recent_metrics.rates(minutes, group_by, name, category)
+    )
+
+@router.get("/recent/top", response_model=ApiResponse)
+async def get_recent_top(
+    k: int = Query(10, ge=1, le=1000),
+    by: str = Query("user_id", pattern="^(name|category|user_id)$"),
+    aggregate: str = Query("sum", pattern="^(count|sum|avg|min|max)$"),
+    minutes: int = Query(15, ge=1, le=RECENT_METRICS_WINDOW_MINUTES),
+    name: Optional[str] = Query(None),
+    category: Optional[str] = Query(None)
+):
+    """Get the k groups with the highest aggregate over the last minutes, from memory"""
+    return ApiResponse(
+        success=True,
+        message="Recent top metrics retrieved successfully",
+        data=recent_metrics.top(k, by, aggregate, minutes, name, category)
+    )
+
 @router.get("/{metric_id}", response_model=ApiResponse)
 async def get_metric(metric_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get metric by ID"""
     try:
-        monitoring_service = MonitoringService(db)
+        monitoring_service = get_monitoring_service(db)
         metric = await monitoring_service.get_by_id(metric_id)
         
         if not metric:
@@ -62,7 +227,7 @@ async def get_metrics(
 ):
     """Get all metrics with pagination and filters"""
     try:
-        monitoring_service = MonitoringService(db)
+        monitoring_service = get_monitoring_service(db)
         
         # Build filters
         filters = {}
@@ -90,7 +255,7 @@ async def get_metrics(
 async def delete_metric(metric_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Delete metric"""
     try:
-        monitoring_service = MonitoringService(db)
+        monitoring_service = get_monitoring_service(db)
         
         # Check if metric exists
         existing_metric = await monitoring_service.get_by_id(metric_id)
@@ -114,7 +279,7 @@ async def delete_metric(metric_id: str, db: AsyncIOMotorDatabase = Depends(get_d
 async def get_metrics_by_category(category: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get metrics by category"""
     try:
-        monitoring_service = MonitoringService(db)
+        monitoring_service = get_monitoring_service(db)
         metrics = await monitoring_service.get_by_category(category)
         
         return ApiResponse(
@@ -129,7 +294,7 @@ async def get_metrics_by_category(category: str, db: AsyncIOMotorDatabase = Depe
 async def get_metrics_by_user(user_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get metrics by user"""
     try:
-        monitoring_service = MonitoringService(db)
+        monitoring_service = get_monitoring_service(db)
         metrics = await monitoring_service.get_by_user(user_id)
         
         return ApiResponse(
@@ -144,7 +309,7 @@ async def get_metrics_by_user(user_id: str, db: AsyncIOMotorDatabase = Depends(g
 async def get_latest_metrics(limit: int = 100, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get latest metrics"""
     try:
-        monitoring_service = MonitoringService(db)
+        monitoring_service = get_monitoring_service(db)
         metrics = await monitoring_service.get_latest_metrics(limit)
         
         return ApiResponse(
@@ -163,7 +328,7 @@ async def get_metrics_by_timerange(
 ):
     """Get metrics within time range"""
     try:
-        monitoring_service = MonitoringService(db)
+        monitoring_service = get_monitoring_service(db)
         
         # Parse dates
         start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
@@ -185,23 +350,7 @@ async def get_metrics_by_timerange(
 async def get_dashboard_data(db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get dashboard data with aggregated metrics"""
     try:
-        monitoring_service = MonitoringService(db)
-        
-        # Get latest metrics
-        latest_metrics = await monitoring_service.get_latest_metrics(50)
-        
-        # Get metrics by category
-        performance_metrics = await monitoring_service.get_by_category("performance")
-        quality_metrics = await monitoring_service.get_by_category("quality")
-        volume_metrics = await monitoring_service.get_by_category("volume")
-        
-        dashboard_data = {
-            "latest_metrics": latest_metrics,
-            "performance_metrics": performance_metrics[:10],  # Last 10
-            "quality_metrics": quality_metrics[:10],
-            "volume_metrics": volume_metrics[:10],
-            "total_metrics": len(latest_metrics)
-        }
+        dashboard_data = await get_monitoring_service(db).get_dashboard()
         
         return ApiResponse(
             success=True,
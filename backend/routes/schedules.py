@@ -0,0 +1,192 @@
+from fastapi import APIRouter, HTTPException, Query, Depends
+from typing import List, Optional
+from models import Schedule, ScheduleCreate, ScheduleUpdate, ApiResponse, PaginatedResponse
+from services import ScheduleService
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+
+router = APIRouter(prefix="/schedules", tags=["schedules"])
+
+# Dependency to get database
+async def get_database():
+    from database import get_database
+    return get_database()
+
+@router.post("/", response_model=ApiResponse)
+async def create_schedule(schedule_data: ScheduleCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Create a new schedule"""
+    try:
+        schedule_service = ScheduleService(db)
+        
+        schedule_dict = schedule_data.dict()
+        schedule_dict["is_active"] = True
+        schedule = await schedule_service.create(schedule_dict)
+        
+        return ApiResponse(
+            success=True,
+            message="Schedule created successfully",
+            data=schedule
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/on-shift", response_model=ApiResponse)
+async def get_on_shift(
+    at: Optional[datetime] = Query(None, description="Instant to check (UTC), default now"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get the agents scheduled to be on shift at an instant"""
+    try:
+        schedule_service = ScheduleService(db)
+        on_shift = await schedule_service.get_on_shift(at)
+        
+        return ApiResponse(
+            success=True,
+            message="On-shift agents retrieved successfully",
+            data=on_shift
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/coverage", response_model=ApiResponse)
+async def get_coverage(
+    step: int = Query(60, ge=5, le=1440, description="Slot length in minutes"),
+    weekday: Optional[int] = Query(None, ge=0, le=6, description="0=Monday"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get the number of scheduled shifts per time slot of the week"""
+    try:
+        schedule_service = ScheduleService(db)
+        coverage = await schedule_service.get_coverage(step, weekday)
+        
+        return ApiResponse(
+            success=True,
+            message="Schedule coverage retrieved successfully",
+            data=coverage
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/user/{user_id}", response_model=ApiResponse)
+async def get_schedules_by_user(user_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Get schedules by user"""
+    try:
+        schedule_service = ScheduleService(db)
+        schedules = await schedule_service.get_by_user(user_id)
+        
+        return ApiResponse(
+            success=True,
+            message="Schedules retrieved successfully",
+            data=schedules
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{schedule_id}", response_model=ApiResponse)
+async def get_schedule(schedule_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Get schedule by ID"""
+    try:
+        schedule_service = ScheduleService(db)
+        schedule = await schedule_service.get_by_id(schedule_id)
+        
+        if not schedule:
+            raise HTTPException(status_code=404, detail="Schedule not found")
+        
+        return ApiResponse(
+            success=True,
+            message="Schedule retrieved successfully",
+            data=schedule
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/", response_model=PaginatedResponse)
+async def get_schedules(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    user_id: Optional[str] = Query(None),
+    is_active: Optional[bool] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get all schedules with pagination and filters"""
+    try:
+        schedule_service = ScheduleService(db)
+        
+        # Build filters
+        filters = {}
+        if user_id:
+            filters["user_id"] = user_id
+        if is_active is not None:
+            filters["is_active"] = is_active
+        
+        schedules = await schedule_service.get_all(skip=skip, limit=limit, filters=filters)
+        total = await schedule_service.count(filters)
+        
+        return PaginatedResponse(
+            success=True,
+            message="Schedules retrieved successfully",
+            data=schedules,
+            total=total,
+            page=skip // limit + 1,
+            per_page=limit,
+            total_pages=(total + limit - 1) // limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.put("/{schedule_id}", response_model=ApiResponse)
+async def update_schedule(
+    schedule_id: str,
+    schedule_data: ScheduleUpdate,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Update schedule"""
+    try:
+        schedule_service = ScheduleService(db)
+        
+        # Check if schedule exists
+        existing_schedule = await schedule_service.get_by_id(schedule_id)
+        if not existing_schedule:
+            raise HTTPException(status_code=404, detail="Schedule not found")
+        
+        # Update schedule
+        update_dict = schedule_data.dict(exclude_unset=True)
+        schedule = await schedule_service.update(schedule_id, update_dict)
+        
+        return ApiResponse(
+            success=True,
+            message="Schedule updated successfully",
+            data=schedule
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/{schedule_id}", response_model=ApiResponse)
+async def delete_schedule(schedule_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Delete schedule"""
+    try:
+        schedule_service = ScheduleService(db)
+        
+        # Check if schedule exists
+        existing_schedule = await schedule_service.get_by_id(schedule_id)
+        if not existing_schedule:
+            raise HTTPException(status_code=404, detail="Schedule not found")
+        
+        # Delete schedule
+        deleted = await schedule_service.delete(schedule_id)
+        
+        if not deleted:
+            raise HTTPException(status_code=500, detail="Failed to delete schedule")
+        
+        return ApiResponse(
+            success=True,
+            message="Schedule deleted successfully"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, Header
 from typing import List, Optional
 from models import Ticket, TicketCreate, TicketUpdate, ApiResponse, PaginatedResponse
-from services import TicketService
+from services import TicketService, AgentStatsService, AttachmentService, InvalidSyncToken
+from attachments import AttachmentTooLarge, RangeNotSatisfiable, parse_range, ATTACHMENT_MAX_BYTES
 from motor.motor_asyncio import AsyncIOMotorDatabase
 import os
 from datetime import datetime
@@ -17,6 +18,16 @@ async def get_database():
     db = client[db_name]
     return db
 
+
+async def get_writable_ticket(ticket_service: TicketService, ticket_id: str) -> dict:
+    """Load a ticket about to be changed; archived tickets are read-only"""
+    ticket = await ticket_service.get_by_id(ticket_id)
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    if ticket.get("archived_at"):
+        raise HTTPException(status_code=409, detail="Ticket is archived and can no longer be changed")
+    return ticket
+
 @router.post("/", response_model=ApiResponse)
 async def create_ticket(ticket_data: TicketCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Create a new ticket"""
@@ -34,6 +45,58 @@ async def create_ticket(ticket_data: TicketCreate, db: AsyncIOMotorDatabase = De
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/changes", response_model=ApiResponse)
+async def get_ticket_changes(
+    since: Optional[str] = Query(None),
+    limit: int = Query(500, ge=1, le=1000),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get tickets changed or deleted since a sync token"""
+    try:
+        ticket_service = TicketService(db)
+        changes = await ticket_service.get_changes(since, limit)
+        
+        return ApiResponse(
+            success=True,
+            message="Tickets changes retrieved successfully",
+            data=changes
+        )
+    except InvalidSyncToken:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stats", response_model=ApiResponse)
+async def get_ticket_stats(
+    start_date: Optional[str] = Query(None),  # Format: YYYY-MM-DD
+    end_date: Optional[str] = Query(None),    # Format: YYYY-MM-DD
+    customer_id: Optional[str] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get ticket counts by status, priority, channel and assignee plus average satisfaction"""
+    try:
+        ticket_service = TicketService(db)
+        
+        # Parse dates (end date is inclusive)
+        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+        end_date_obj = None
+        if end_date:
+            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").replace(
+                hour=23, minute=59, second=59, microsecond=999999
+            )
+        
+        stats = await ticket_service.get_stats(start_date_obj, end_date_obj, customer_id)
+        
+        return ApiResponse(
+            success=True,
+            message="Ticket statistics retrieved successfully",
+            data=stats
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/{ticket_id}", response_model=ApiResponse)
 async def get_ticket(ticket_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get ticket by ID"""
@@ -102,10 +165,8 @@ async def update_ticket(
     try:
         ticket_service = TicketService(db)
         
-        # Check if ticket exists
-        existing_ticket = await ticket_service.get_by_id(ticket_id)
-        if not existing_ticket:
-            raise HTTPException(status_code=404, detail="Ticket not found")
+        # Check if ticket exists and can still be changed
+        await get_writable_ticket(ticket_service, ticket_id)
         
         # Update ticket
         update_dict = ticket_data.dict(exclude_unset=True)
@@ -116,6 +177,8 @@ async def update_ticket(
             message="Ticket updated successfully",
             data=ticket
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -125,10 +188,8 @@ async def delete_ticket(ticket_id: str, db: AsyncIOMotorDatabase = Depends(get_d
     try:
         ticket_service = TicketService(db)
         
-        # Check if ticket exists
-        existing_ticket = await ticket_service.get_by_id(ticket_id)
-        if not existing_ticket:
-            raise HTTPException(status_code=404, detail="Ticket not found")
+        # Check if ticket exists and can still be changed
+        await get_writable_ticket(ticket_service, ticket_id)
         
         # Delete ticket
         deleted = await ticket_service.delete(ticket_id)
@@ -140,6 +201,8 @@ async def delete_ticket(ticket_id: str, db: AsyncIOMotorDatabase = Depends(get_d
             success=True,
             message="Ticket deleted successfully"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -198,10 +261,8 @@ async def assign_ticket(
     try:
         ticket_service = TicketService(db)
         
-        # Check if ticket exists
-        existing_ticket = await ticket_service.get_by_id(ticket_id)
-        if not existing_ticket:
-            raise HTTPException(status_code=404, detail="Ticket not found")
+        # Check if ticket exists and can still be changed
+        await get_writable_ticket(ticket_service, ticket_id)
         
         # Assign ticket
         ticket = await ticket_service.assign_ticket(ticket_id, user_id)
@@ -211,6 +272,8 @@ async def assign_ticket(
             message="Ticket assigned successfully",
             data=ticket
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -224,10 +287,8 @@ async def resolve_ticket(
     try:
         ticket_service = TicketService(db)
         
-        # Check if ticket exists
-        existing_ticket = await ticket_service.get_by_id(ticket_id)
-        if not existing_ticket:
-            raise HTTPException(status_code=404, detail="Ticket not found")
+        # Check if ticket exists and can still be changed
+        await get_writable_ticket(ticket_service, ticket_id)
         
         # Resolve ticket
         ticket = await ticket_service.resolve_ticket(ticket_id, resolution)
@@ -237,6 +298,8 @@ async def resolve_ticket(
             message="Ticket resolved successfully",
             data=ticket
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -251,10 +314,8 @@ async def rate_ticket(
     try:
         ticket_service = TicketService(db)
         
-        # Check if ticket exists
-        existing_ticket = await ticket_service.get_by_id(ticket_id)
-        if not existing_ticket:
-            raise HTTPException(status_code=404, detail="Ticket not found")
+        # Check if ticket exists and can still be changed
+        await get_writable_ticket(ticket_service, ticket_id)
         
         # Rate ticket
         ticket = await ticket_service.rate_ticket(ticket_id, rating, comment)
@@ -264,5 +325,200 @@ async def rate_ticket(
             message="Ticket rated successfully",
             data=ticket
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/agents/stats", response_model=ApiResponse)
+async def get_agent_stats(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get workload and satisfaction counters for all agents"""
+    try:
+        agent_stats_service = AgentStatsService(db)
+        stats = await agent_stats_service.get_all_stats(skip=skip, limit=limit)
+        
+        return ApiResponse(
+            success=True,
+            message="Agent statistics retrieved successfully",
+            data=stats
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/agents/{user_id}/stats", response_model=ApiResponse)
+async def get_agent_stats_by_user(user_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Get workload and satisfaction counters for one agent"""
+    try:
+        agent_stats_service = AgentStatsService(db)
+        stats = await agent_stats_service.get_by_user(user_id)
+        
+        if not stats:
+            raise HTTPException(status_code=404, detail="Agent statistics not found")
+        
+        return ApiResponse(
+            success=True,
+            message="Agent statistics retrieved successfully",
+            data=stats
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/agents/stats/reconcile", response_model=ApiResponse)
+async def reconcile_agent_stats(
+    days: int = Query(30, ge=1, le=365),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Rebuild agent counters from tickets to repair drift"""
+    try:
+        agent_stats_service = AgentStatsService(db)
+        result = await agent_stats_service.reconcile(days)
+        
+        return ApiResponse(
+            success=True,
+            message="Agent statistics reconciled successfully",
+            data=result
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{ticket_id}/attachments", response_model=ApiResponse)
+async def upload_attachment(
+    ticket_id: str,
+    request: Request,
+    filename: str = Query(..., min_length=1),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Upload an attachment as the raw request body, streamed in chunks"""
+    try:
+        ticket_service = TicketService(db)
+        attachment_service = AttachmentService(db)
+        
+        # Check if ticket exists and can still be changed
+        await get_writable_ticket(ticket_service, ticket_id)
+        
+        content_length = request.headers.get("content-length")
+        try:
+            declared_size = int(content_length) if content_length else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+        if declared_size is not None and declared_size > ATTACHMENT_MAX_BYTES:
+            raise AttachmentTooLarge()
+        
+        content_type = request.headers.get("content-type", "application/octet-stream")
+        attachment = await attachment_service.upload(ticket_id, filename, content_type, request.stream())
+        
+        return ApiResponse(
+            success=True,
+            message="Attachment uploaded successfully",
+            data=attachment
+        )
+    except HTTPException:
+        raise
+    except AttachmentTooLarge:
+        raise HTTPException(status_code=413, detail=f"Attachment exceeds {ATTACHMENT_MAX_BYTES} bytes")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{ticket_id}/attachments", response_model=ApiResponse)
+async def get_attachments(ticket_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Get attachments by ticket"""
+    try:
+        attachment_service = AttachmentService(db)
+        attachments = await attachment_service.get_by_ticket(ticket_id)
+        
+        return ApiResponse(
+            success=True,
+            message="Attachments retrieved successfully",
+            data=attachments
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{ticket_id}/attachments/{attachment_id}")
+async def download_attachment(
+    ticket_id: str,
+    attachment_id: str,
+    range: Optional[str] = Header(None),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Download an attachment, honouring a single HTTP Range"""
+    try:
+        attachment_service = AttachmentService(db)
+        attachment = await attachment_service.get_by_id(attachment_id)
+        
+        if not attachment or attachment["ticket_id"] != ticket_id:
+            raise HTTPException(status_code=404, detail="Attachment not found")
+        
+        byte_range = parse_range(range, attachment["size"])
+        return await attachment_service.download(attachment, byte_range)
+    except HTTPException:
+        raise
+    except RangeNotSatisfiable:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{attachment['size']}"}
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/{ticket_id}/attachments/{attachment_id}", response_model=ApiResponse)
+async def delete_attachment(
+    ticket_id: str,
+    attachment_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Delete attachment"""
+    try:
+        ticket_service = TicketService(db)
+        attachment_service = AttachmentService(db)
+        
+        # Check if ticket exists and can still be changed
+        await get_writable_ticket(ticket_service, ticket_id)
+        
+        # Check if attachment exists
+        attachment = await attachment_service.get_by_id(attachment_id)
+        if not attachment or attachment["ticket_id"] != ticket_id:
+            raise HTTPException(status_code=404, detail="Attachment not found")
+        
+        deleted = await attachment_service.remove(attachment)
+        
+        if not deleted:
+            raise HTTPException(status_code=500, detail="Failed to delete attachment")
+        
+        return ApiResponse(
+            success=True,
+            message="Attachment deleted successfully"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/archive/run", response_model=ApiResponse)
+async def archive_tickets(
+    older_than_days: int = Query(90, ge=1),
+    batch_size: int = Query(500, ge=1, le=5000),
+    max_batches: Optional[int] = Query(None, ge=1),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Move old resolved/closed tickets to the archive"""
+    try:
+        ticket_service = TicketService(db)
+        result = await ticket_service.archive_closed(older_than_days, batch_size, max_batches)
+        
+        return ApiResponse(
+            success=True,
+            message="Tickets archived successfully",
+            data=result
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
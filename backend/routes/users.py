@@ -3,6 +3,7 @@ from typing import List, Optional
 from models import User, UserCreate, UserUpdate, ApiResponse, PaginatedResponse
 from services import UserService
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 import os
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -18,11 +19,7 @@ async def create_user(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(
     try:
         user_service = UserService(db)
         
-        # Check if email already exists
-        existing_user = await user_service.get_by_email(user_data.email)
-        if existing_user:
-            raise HTTPException(status_code=400, detail="Email already exists")
-        
+        # Email uniqueness is enforced by a unique index
         user_dict = user_data.dict()
         user = await user_service.create(user_dict)
         
@@ -31,6 +28,8 @@ async def create_user(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(
             message="User created successfully",
             data=user
         )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already exists")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -101,13 +100,7 @@ async def update_user(
         if not existing_user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Check if email already exists for another user
-        if user_data.email:
-            email_user = await user_service.get_by_email(user_data.email)
-            if email_user and email_user['id'] != user_id:
-                raise HTTPException(status_code=400, detail="Email already exists")
-        
-        # Update user
+        # Update user (email uniqueness is enforced by a unique index)
         update_dict = user_data.dict(exclude_unset=True)
         user = await user_service.update(user_id, update_dict)
         
@@ -116,6 +109,10 @@ async def update_user(
             message="User updated successfully",
             data=user
         )
+    except HTTPException:
+        raise
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already exists")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -171,19 +168,79 @@ async def update_user_status(
     try:
         user_service = UserService(db)
         
-        # Check if user exists
-        existing_user = await user_service.get_by_id(user_id)
-        if not existing_user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Update status
+        # Update status (fails if the user does not exist)
         user = await user_service.update_status(user_id, status)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
         
         return ApiResponse(
             success=True,
             message="User status updated successfully",
             data=user
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{user_id}/heartbeat", response_model=ApiResponse)
+async def user_heartbeat(user_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Keep a user's presence alive"""
+    try:
+        user_service = UserService(db)
+        
+        presence_entry = await user_service.heartbeat(user_id)
+        if not presence_entry:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        return ApiResponse(
+            success=True,
+            message="Heartbeat recorded successfully",
+            data=presence_entry
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/presence/available", response_model=ApiResponse)
+async def get_available_users(
+    skills: List[str] = Query([], description="Require every one of these skills"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get users currently available, optionally with the given skills"""
+    try:
+        user_service = UserService(db)
+        users = await user_service.get_available(skills)
+        
+        return ApiResponse(
+            success=True,
+            message="Available users retrieved successfully",
+            data=users
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/skills/search", response_model=ApiResponse)
+async def search_users_by_skills(
+    skills: List[str] = Query([]),
+    match: str = Query("all", pattern="^(all|any)$"),
+    role: Optional[str] = Query(None),
+    is_active: Optional[bool] = Query(None),
+    status: Optional[str] = Query(None, description="Live presence status, e.g. available"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Find users having all (or any) of the given skills"""
+    try:
+        user_service = UserService(db)
+        users = await user_service.search_by_skills(skills, match, role, is_active, status, limit)
+        
+        return ApiResponse(
+            success=True,
+            message="Users retrieved successfully",
+            data=users
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
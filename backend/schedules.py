@@ -0,0 +1,251 @@
+import asyncio
+import os
+import time
+from bisect import bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# Schedule start/end times are wall-clock times in this zone; attendance is stored in UTC
+SCHEDULE_TIMEZONE = ZoneInfo(os.environ.get('SCHEDULE_TIMEZONE', 'UTC'))
+LATE_GRACE_MINUTES = int(os.environ.get('LATE_GRACE_MINUTES', 5))
+
+# Schedules are reloaded at most this often, which also picks up changes from other workers
+REFRESH_SECONDS = 300
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_minutes(value: str) -> int:
+    """Minutes since midnight for an "HH:MM" string"""
+    hours, minutes = value.split(":")
+    if not (0 <= int(hours) < 24 and 0 <= int(minutes) < 60):
+        raise ValueError(f"Invalid time: {value}")
+    return int(hours) * 60 + int(minutes)
+
+
+def to_local(when: datetime) -> datetime:
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.astimezone(SCHEDULE_TIMEZONE)
+
+
+def shift_window(midnight: datetime, schedule: dict) -> Tuple[datetime, datetime]:
+    """Local start and end of a parsed schedule's shift starting on the day of `midnight`"""
+    start = midnight + timedelta(minutes=schedule["start"])
+    end = midnight + timedelta(minutes=schedule["end"])
+    if end <= start:
+        # Overnight shift
+        end += timedelta(days=1)
+    return start, end
+
+
+def utc(when: datetime) -> datetime:
+    return when.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def local_day(when: datetime) -> datetime:
+    """Midnight of the calendar day `when` falls on in SCHEDULE_TIMEZONE, as a naive date"""
+    return to_local(when).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class ScheduleCache:
+    """Active schedules of every user, parsed once and held in memory.
+
+    Besides the per-user lists used for attendance classification, every
+    shift is kept as (start, end, schedule id) intervals in a sorted array
+    per weekday, with overnight shifts split at midnight. "Who is on shift"
+    is a bisect over one day's array and coverage a sweep over it.
+    """
+
+    def __init__(self):
+        self._by_id: Dict[str, dict] = {}
+        self._by_user: Dict[str, List[dict]] = {}
+        self._intervals: Dict[int, List[Tuple[int, int, str]]] = {weekday: [] for weekday in range(7)}
+        self._longest = 0
+        self._coverage: Dict[int, List[dict]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        # Local changes made while a reload reads the collection, replayed onto its result
+        self._replay: Optional[List[Tuple[str, object]]] = None
+
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < REFRESH_SECONDS
+
+    async def ensure_loaded(self, db) -> None:
+        """Reload every REFRESH_SECONDS; reads keep the previous state until the new one is complete"""
+        if self._fresh():
+            return
+        async with self._lock:
+            if self._fresh():
+                # Reloaded by a concurrent caller
+                return
+            self._replay = []
+            try:
+                loaded = ScheduleCache()
+                async for schedule in db["schedules"].find({"is_active": {"$ne": False}}, {"_id": 0}):
+                    loaded.apply(schedule)
+            finally:
+                replay, self._replay = self._replay, None
+            for change, value in replay:
+                if change == "apply":
+                    loaded.apply(value)
+                else:
+                    loaded.remove(value)
+            self._by_id, self._by_user = loaded._by_id, loaded._by_user
+            self._intervals, self._longest, self._coverage = loaded._intervals, loaded._longest, loaded._coverage
+            self._loaded_at = time.monotonic()
+
+    def apply(self, schedule: dict) -> None:
+        """Add, replace or drop a schedule after a change"""
+        if self._replay is not None:
+            self._replay.append(("apply", schedule))
+        self._drop(schedule["id"])
+        if schedule.get("is_active") is False:
+            return
+        try:
+            parsed = {
+                "id": schedule["id"],
+                "user_id": schedule["user_id"],
+                "name": schedule.get("name"),
+                "start": parse_minutes(schedule["start_time"]),
+                "end": parse_minutes(schedule["end_time"]),
+                # Invalid weekdays would index past the per-weekday arrays
+                "days": frozenset(
+                    day for day in schedule.get("days_of_week") or [] if isinstance(day, int) and 0 <= day <= 6
+                )
+            }
+        except (KeyError, ValueError, TypeError, AttributeError):
+            return
+        self._by_id[parsed["id"]] = parsed
+        self._by_user.setdefault(parsed["user_id"], []).append(parsed)
+        for weekday, interval in self._day_intervals(parsed):
+            insort(self._intervals[weekday], interval)
+            self._longest = max(self._longest, interval[1] - interval[0])
+        self._coverage = {}
+
+    def remove(self, schedule_id: str) -> None:
+        if self._replay is not None:
+            self._replay.append(("remove", schedule_id))
+        self._drop(schedule_id)
+
+    def _drop(self, schedule_id: str) -> None:
+        parsed = self._by_id.pop(schedule_id, None)
+        if parsed is None:
+            return
+        schedules = self._by_user[parsed["user_id"]]
+        schedules.remove(parsed)
+        if not schedules:
+            del self._by_user[parsed["user_id"]]
+        for weekday, interval in self._day_intervals(parsed):
+            intervals = self._intervals[weekday]
+            del intervals[bisect_right(intervals, interval) - 1]
+        self._coverage = {}
+
+    @staticmethod
+    def _day_intervals(parsed: dict) -> List[Tuple[int, Tuple[int, int, str]]]:
+        """(weekday, interval) pairs of a schedule, overnight shifts split at midnight"""
+        intervals = []
+        for weekday in parsed["days"]:
+            if parsed["end"] > parsed["start"]:
+                intervals.append((weekday, (parsed["start"], parsed["end"], parsed["id"])))
+            else:
+                intervals.append((weekday, (parsed["start"], MINUTES_PER_DAY, parsed["id"])))
+                if parsed["end"] > 0:
+                    intervals.append(((weekday + 1) % 7, (0, parsed["end"], parsed["id"])))
+        return intervals
+
+    def on_shift(self, when: datetime) -> List[dict]:
+        """Schedules covering an instant, earliest start first"""
+        local = to_local(when)
+        minute = local.hour * 60 + local.minute
+        intervals = self._intervals[local.weekday()]
+        # Only intervals starting at or before `minute`, and no longer ago than the longest shift
+        first = bisect_right(intervals, (minute - self._longest,))
+        last = bisect_right(intervals, (minute, MINUTES_PER_DAY + 1))
+        on_shift = []
+        for start, end, schedule_id in intervals[first:last]:
+            if end > minute:
+                parsed = self._by_id[schedule_id]
+                on_shift.append({
+                    "schedule_id": schedule_id,
+                    "user_id": parsed["user_id"],
+                    "name": parsed["name"],
+                    "start_time": format_minutes(parsed["start"]),
+                    "end_time": format_minutes(parsed["end"])
+                })
+        return on_shift
+
+    def coverage(self, step: int = 60) -> List[dict]:
+        """Number of scheduled shifts at the start of every `step` minutes of the week"""
+        if step not in self._coverage:
+            slots = []
+            for weekday in range(7):
+                # Difference array over the day's minutes, then a running sum
+                deltas = [0] * (MINUTES_PER_DAY + 1)
+                for start, end, _ in self._intervals[weekday]:
+                    deltas[start] += 1
+                    deltas[end] -= 1
+                scheduled = 0
+                for minute in range(MINUTES_PER_DAY):
+                    scheduled += deltas[minute]
+                    if minute % step == 0:
+                        slots.append({"weekday": weekday, "time": format_minutes(minute), "scheduled": scheduled})
+            self._coverage[step] = slots
+        return self._coverage[step]
+
+    def shift_for(self, user_id: str, when: datetime) -> Optional[Tuple[datetime, datetime]]:
+        """UTC start and end of the user's shift at `when` (a check-in time).
+
+        An overnight shift from the previous local day that is still running
+        wins; otherwise the earliest shift of the local day of `when`.
+        """
+        local = to_local(when)
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        previous_day = midnight - timedelta(days=1)
+        schedules = sorted(self._by_user.get(user_id, ()), key=lambda shift: shift["start"])
+        for schedule in schedules:
+            if previous_day.weekday() in schedule["days"] and schedule["end"] <= schedule["start"]:
+                start, end = shift_window(previous_day, schedule)
+                if local < end:
+                    return utc(start), utc(end)
+        for schedule in schedules:
+            if local.weekday() in schedule["days"]:
+                start, end = shift_window(midnight, schedule)
+                return utc(start), utc(end)
+        return None
+
+
+def minutes_between(earlier: datetime, later: datetime) -> int:
+    if earlier.tzinfo is not None:
+        earlier = earlier.astimezone(timezone.utc).replace(tzinfo=None)
+    if later.tzinfo is not None:
+        later = later.astimezone(timezone.utc).replace(tzinfo=None)
+    return max(0, int((later - earlier).total_seconds() // 60))
+
+
+def classify(shift: Optional[Tuple[datetime, datetime]], check_in: datetime = None, check_out: datetime = None) -> dict:
+    """Status and minutes late / left early for a day against its shift"""
+    if shift is None:
+        return {}
+    start, end = shift
+    result = {}
+    if check_in:
+        result["minutes_late"] = minutes_between(start, check_in)
+    if check_out:
+        result["minutes_early_leave"] = minutes_between(check_out, end)
+    if result.get("minutes_late", 0) > LATE_GRACE_MINUTES:
+        result["status"] = "late"
+    elif result.get("minutes_early_leave", 0) > LATE_GRACE_MINUTES:
+        result["status"] = "early_leave"
+    else:
+        result["status"] = "present"
+    return result
+
+
+# Shared by every request handled in this worker
+schedule_cache = ScheduleCache()
@@ -10,7 +10,12 @@ import uuid
 from datetime import datetime
 
 # Import database
-from database import db, client
+from database import db, client, create_indexes
+from presence import presence
+from directory import directory
+from ingest import ingest_buffer
+from recent_metrics import recent_metrics
+from services import get_monitoring_service
 
 # Import route modules
 from routes.users import router as users_router
@@ -19,6 +24,8 @@ from routes.tickets import router as tickets_router
 from routes.goals import router as goals_router
 from routes.attendance import router as attendance_router
 from routes.monitoring import router as monitoring_router
+from routes.events import router as events_router
+from routes.schedules import router as schedules_router
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -40,6 +47,8 @@ api_router.include_router(tickets_router)
 api_router.include_router(goals_router)
 api_router.include_router(attendance_router)
 api_router.include_router(monitoring_router)
+api_router.include_router(events_router)
+api_router.include_router(schedules_router)
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -100,6 +109,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_indexes():
+    try:
+        await create_indexes(db)
+    except Exception as e:
+        logger.warning(f"Could not create database indexes: {e}")
+
+@app.on_event("startup")
+async def startup_presence_flusher():
+    await presence.start(db)
+
+@app.on_event("startup")
+async def startup_user_directory():
+    directory.start(db)
+
+@app.on_event("startup")
+async def startup_metric_ingest():
+    ingest_buffer.start(get_monitoring_service(db).insert_many)
+
+@app.on_event("startup")
+async def startup_recent_metrics():
+    recent_metrics.start(get_monitoring_service(db))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    directory.stop()
+    recent_metrics.stop()
+    try:
+        await presence.stop(db)
+    except Exception as e:
+        logger.warning(f"Could not flush agent presence: {e}")
+    try:
+        await ingest_buffer.stop()
+    except Exception as e:
+        logger.warning(f"Could not flush ingested metrics ({len(ingest_buffer)} dropped): {e}")
     client.close()
@@ -1,8 +1,70 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import asyncio
+import base64
+import logging
+import math
+import os
 import uuid
+from pymongo import ReturnDocument, UpdateOne, ReplaceOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from models import *
+from cache import TTLCache
+from attachments import get_attachment_store
+from database import (
+    MONITORING_STORAGE, TOMBSTONE_RETENTION_DAYS, TIMESERIES_METRICS_COLLECTION, METRIC_SKETCHES_COLLECTION,
+    create_attendance_day_index, create_monitoring_timeseries
+)
+from events import hub
+from leaderboard import leaderboards
+from presence import presence
+from directory import directory
+from schedules import LATE_GRACE_MINUTES, classify, local_day, schedule_cache
+from rollups import METRIC_RAW_RETENTION_DAYS, ROLLUP_TIERS, bucket_start, choose_tier, closed_before, rollup_operations
+from recent_metrics import recent_metrics
+from sketches import (
+    METRIC_SKETCH_ACCURACY, METRIC_SKETCH_RETENTION_DAYS, METRIC_SKETCH_SECONDS, DDSketch,
+    add_sample, sketch_batch, sketch_operations
+)
+
+
+# "daily" keeps one attendance document per user per day, "bucket" one per user per month
+ATTENDANCE_STORAGE = os.environ.get('ATTENDANCE_STORAGE', 'daily')
+
+# Short-lived caches shared by every request handled in this worker
+ticket_stats_cache = TTLCache(ttl=15)
+goal_rollup_cache = TTLCache(ttl=60)
+email_index_cache = TTLCache(ttl=60)
+monitoring_dashboard_cache = TTLCache(ttl=float(os.environ.get('MONITORING_DASHBOARD_TTL', 5)))
+
+# Categories shown on the monitoring dashboard, each with its most recent metrics
+DASHBOARD_CATEGORIES = ("performance", "quality", "volume")
+
+
+# Changes stamped this long before a sync token are re-sent, to catch writes that committed late
+SYNC_OVERLAP = timedelta(seconds=int(os.environ.get('SYNC_OVERLAP_SECONDS', 5)))
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def encode_sync_token(updated_at: datetime, id: str) -> str:
+    """Encode a (updated_at, id) sync position as an opaque token"""
+    millis = int(updated_at.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return base64.urlsafe_b64encode(f"{millis}:{id}".encode()).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> tuple:
+    """Decode a token produced by encode_sync_token"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        millis, id = base64.urlsafe_b64decode(padded).decode().split(":", 1)
+        updated_at = datetime.fromtimestamp(int(millis) / 1000, tz=timezone.utc).replace(tzinfo=None)
+    except Exception:
+        raise InvalidSyncToken("Invalid sync token")
+    return updated_at, id
 
 
 class BaseService:
@@ -20,7 +82,10 @@ class BaseService:
             data['updated_at'] = datetime.utcnow()
         
         result = await self.collection.insert_one(data)
-        return await self.get_by_id(data['id'])
+        doc = await self.get_by_id(data['id'])
+        if doc:
+            hub.publish(self.collection.name, "created", doc)
+        return doc
     
     async def get_by_id(self, id: str) -> Optional[dict]:
         """Get document by ID"""
@@ -46,42 +111,231 @@ class BaseService:
             {"$set": data}
         )
         if result.modified_count:
-            return await self.get_by_id(id)
+            doc = await self.get_by_id(id)
+            if doc:
+                hub.publish(self.collection.name, "updated", doc)
+            return doc
         return None
     
+    async def update_and_get_previous(self, id: str, data: dict) -> Optional[dict]:
+        """Update document by ID and return it as it was before the update"""
+        data['updated_at'] = datetime.utcnow()
+        doc = await self.collection.find_one_and_update(
+            {"id": id},
+            {"$set": data},
+            return_document=ReturnDocument.BEFORE
+        )
+        if doc:
+            doc.pop('_id', None)
+            hub.publish(self.collection.name, "updated", {**doc, **data}, previous=doc)
+        return doc
+    
     async def delete(self, id: str) -> bool:
         """Delete document by ID"""
         result = await self.collection.delete_one({"id": id})
+        if result.deleted_count:
+            await self._record_delete(id)
         return result.deleted_count > 0
     
+    async def _record_delete(self, id: str) -> None:
+        """Leave a tombstone so delta sync clients learn about the delete"""
+        now = datetime.utcnow()
+        await self.db["tombstones"].update_one(
+            {"collection": self.collection.name, "id": id},
+            {"$set": {"updated_at": now, "deleted_at": now}},
+            upsert=True
+        )
+        hub.publish(self.collection.name, "deleted", {"id": id})
+    
+    async def _read_changes(self, query: dict, limit: int) -> List[tuple]:
+        """(updated_at, id, doc or None for a delete) entries matching query, oldest first"""
+        order = [("updated_at", 1), ("id", 1)]
+        docs = await self.collection.find(query, {"_id": 0}).sort(order).limit(limit).to_list(length=limit)
+        tombstones = await self.db["tombstones"].find(
+            {"collection": self.collection.name, **query},
+            {"_id": 0, "id": 1, "updated_at": 1}
+        ).sort(order).limit(limit).to_list(length=limit)
+        
+        # Both streams are sorted by the same key; keep the first `limit` of the merge
+        return sorted(
+            [(doc["updated_at"], doc["id"], doc) for doc in docs]
+            + [(tombstone["updated_at"], tombstone["id"], None) for tombstone in tombstones],
+            key=lambda entry: (entry[0], entry[1])
+        )[:limit]
+    
+    async def get_changes(self, since: str = None, limit: int = 500) -> dict:
+        """Get documents changed and deleted after a sync token, oldest first.
+        
+        updated_at is stamped before the write commits, so a write can become
+        visible after a client already synced past its timestamp. Changes from
+        SYNC_OVERLAP before the token are therefore sent again; clients apply
+        them idempotently by id.
+        """
+        entries = await self._read_changes({}, limit) if not since else None
+        replayed = []
+        if since:
+            updated_at, id = decode_sync_token(since)
+            if updated_at < datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+                return {"changed": [], "deleted": [], "next_token": None, "has_more": False, "reset": True}
+            entries = await self._read_changes({"$or": [
+                {"updated_at": {"$gt": updated_at}},
+                {"updated_at": updated_at, "id": {"$gt": id}}
+            ]}, limit)
+            replayed = await self._read_changes({
+                "updated_at": {"$gte": updated_at - SYNC_OVERLAP, "$lte": updated_at},
+                "$nor": [{"updated_at": updated_at, "id": {"$gt": id}}]
+            }, limit)
+        
+        # Only entries after the token move it forward; the latest entry per id wins
+        latest = {}
+        for entry in replayed + entries:
+            latest[entry[1]] = entry
+        merged = sorted(latest.values(), key=lambda entry: (entry[0], entry[1]))
+        
+        next_token = encode_sync_token(entries[-1][0], entries[-1][1]) if entries else since
+        return {
+            "changed": [doc for _, _, doc in merged if doc is not None],
+            "deleted": [id for _, id, doc in merged if doc is None],
+            "next_token": next_token,
+            "has_more": len(entries) == limit,
+            "reset": False
+        }
+    
     async def count(self, filters: dict = None) -> int:
         """Count documents with filters"""
         query = filters if filters else {}
         return await self.collection.count_documents(query)
 
 
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """Case-insensitive form of an email, backed by a unique index"""
+    return email.strip().lower() if email else None
+
+
+async def has_unique_email_index(collection) -> bool:
+    cached = email_index_cache.get(collection.name)
+    if cached is None:
+        indexes = await collection.index_information()
+        cached = any(
+            index.get("unique") and index["key"] == [("email_normalized", 1)] for index in indexes.values()
+        )
+        email_index_cache.set(collection.name, cached)
+    return cached
+
+
+async def check_email_available(collection, email: Optional[str], exclude_id: str = None) -> None:
+    """Raise DuplicateKeyError if the email is taken, while the unique index is missing.
+    
+    Existing duplicates block the index (see backfill-normalized-emails);
+    until it exists this read check keeps enforcing uniqueness, racily.
+    """
+    if not email or await has_unique_email_index(collection):
+        return
+    query = {"email_normalized": normalize_email(email)}
+    if exclude_id:
+        query["id"] = {"$ne": exclude_id}
+    if await collection.find_one(query, {"_id": 1}):
+        raise DuplicateKeyError("Email already exists", 11000)
+
+
 class UserService(BaseService):
     def __init__(self, db: AsyncIOMotorDatabase):
         super().__init__(db, "users")
     
     async def get_by_email(self, email: str) -> Optional[dict]:
-        """Get user by email"""
-        doc = await self.collection.find_one({"email": email})
-        if doc:
-            doc.pop('_id', None)
-        return doc
+        """Get user by email (case-insensitive) from the in-memory directory"""
+        await directory.ensure_loaded(self.db)
+        return presence.overlay(directory.get_by_email(email))
     
     async def get_by_role(self, role: str) -> List[dict]:
-        """Get users by role"""
-        return await self.get_all(filters={"role": role})
+        """Get users by role from the in-memory directory"""
+        await directory.ensure_loaded(self.db)
+        return [presence.overlay(user) for user in directory.find(role=role)]
     
     async def get_active_users(self) -> List[dict]:
-        """Get active users"""
-        return await self.get_all(filters={"is_active": True})
+        """Get active users from the in-memory directory"""
+        await directory.ensure_loaded(self.db)
+        return [presence.overlay(user) for user in directory.find(is_active=True)]
+    
+    async def get_by_id(self, id: str) -> Optional[dict]:
+        """Get user by ID with the live presence status"""
+        await directory.ensure_loaded(self.db)
+        doc = directory.get(id)
+        if doc is None:
+            # Created by another worker since the last directory poll
+            doc = await super().get_by_id(id)
+            if doc:
+                directory.apply(doc)
+        return presence.overlay(doc)
+    
+    async def get_all(self, skip: int = 0, limit: int = 100, filters: dict = None) -> List[dict]:
+        """Get users with pagination and filters, with the live presence status"""
+        return [presence.overlay(doc) for doc in await super().get_all(skip, limit, filters)]
+    
+    async def create(self, data: dict) -> dict:
+        """Create a new user; raises DuplicateKeyError if the email is taken"""
+        await check_email_available(self.collection, data.get("email"))
+        data["email_normalized"] = normalize_email(data.get("email"))
+        doc = await super().create(data)
+        if doc:
+            directory.apply(doc)
+        return doc
+    
+    async def update(self, id: str, data: dict) -> Optional[dict]:
+        """Update user by ID; raises DuplicateKeyError if the new email is taken"""
+        if "email" in data:
+            await check_email_available(self.collection, data["email"], exclude_id=id)
+            data["email_normalized"] = normalize_email(data["email"])
+        doc = await super().update(id, data)
+        if doc:
+            directory.apply(doc)
+            if "status" in data:
+                presence.set_status(doc, data["status"])
+            else:
+                presence.update_profile(doc)
+        return presence.overlay(doc)
+    
+    async def delete(self, id: str) -> bool:
+        """Delete user by ID"""
+        deleted = await super().delete(id)
+        if deleted:
+            presence.remove(id)
+            directory.remove(id)
+        return deleted
     
     async def update_status(self, user_id: str, status: str) -> Optional[dict]:
-        """Update user status"""
-        return await self.update(user_id, {"status": status})
+        """Update user status in the presence store; it is persisted in the background"""
+        user = await self.get_by_id(user_id)
+        if not user:
+            return None
+        presence.set_status(user, status)
+        # Same shape as before presence existed: the user document with its new status
+        doc = presence.overlay(user)
+        hub.publish(self.collection.name, "updated", doc)
+        return doc
+    
+    async def heartbeat(self, user_id: str) -> Optional[dict]:
+        """Keep a user online, registering their persisted status on the first heartbeat"""
+        view = presence.heartbeat(user_id)
+        if view is None:
+            user = await self.get_by_id(user_id)
+            if not user:
+                return None
+            presence.set_status(user, user.get("status") or UserStatus.AVAILABLE.value)
+            view = presence.heartbeat(user_id)
+        return view
+    
+    async def get_available(self, skills: List[str] = None) -> List[dict]:
+        """Get available users, optionally having every one of skills"""
+        return presence.with_status(UserStatus.AVAILABLE.value, skills or ())
+    
+    async def search_by_skills(self, skills: List[str] = None, match: str = "all", role: str = None,
+                               is_active: bool = None, status: str = None, limit: int = 100) -> List[dict]:
+        """Find users with all (or any) of skills, filtered by role, active flag and live status"""
+        await directory.ensure_loaded(self.db)
+        user_ids = presence.user_ids(status) if status else None
+        users = directory.skills.search(skills or (), match, role, is_active, user_ids)[:limit]
+        return [presence.overlay(dict(user)) for user in users]
 
 
 class ScheduleService(BaseService):
@@ -95,6 +349,79 @@ class ScheduleService(BaseService):
     async def get_active_schedules(self) -> List[dict]:
         """Get active schedules"""
         return await self.get_all(filters={"is_active": True})
+    
+    async def get_on_shift(self, at: datetime = None) -> List[dict]:
+        """Get schedules covering an instant (default now)"""
+        await schedule_cache.ensure_loaded(self.db)
+        return schedule_cache.on_shift(at or datetime.utcnow())
+    
+    async def get_coverage(self, step: int = 60, weekday: int = None) -> List[dict]:
+        """Get the number of scheduled shifts per time slot of the week"""
+        await schedule_cache.ensure_loaded(self.db)
+        slots = schedule_cache.coverage(step)
+        if weekday is not None:
+            slots = [slot for slot in slots if slot["weekday"] == weekday]
+        return slots
+    
+    async def create(self, data: dict) -> dict:
+        """Create a new schedule"""
+        doc = await super().create(data)
+        if doc:
+            schedule_cache.apply(doc)
+        return doc
+    
+    async def update(self, id: str, data: dict) -> Optional[dict]:
+        """Update schedule by ID"""
+        doc = await super().update(id, data)
+        if doc:
+            schedule_cache.apply(doc)
+        return doc
+    
+    async def delete(self, id: str) -> bool:
+        """Delete schedule by ID"""
+        deleted = await super().delete(id)
+        if deleted:
+            schedule_cache.remove(id)
+        return deleted
+
+
+def day_key(date: datetime) -> str:
+    """Calendar day an attendance record belongs to"""
+    return date.strftime('%Y-%m-%d')
+
+
+# Statuses the schedule classifier may set or replace; "absent" is left alone
+CLASSIFIED_STATUSES = ["present", "late", "early_leave"]
+
+
+def check_in_fields(classification: dict, day: str = "$") -> dict:
+    """Pipeline $set fields classifying a check-in; a status outside CLASSIFIED_STATUSES is left alone"""
+    status = f"{day}status"
+    if "status" not in classification:
+        # No shift to classify against: a new day starts as present
+        return {"status": {"$ifNull": [status, "present"]}}
+    return {
+        **classification,
+        "status": {"$cond": [
+            {"$in": [{"$ifNull": [status, "present"]}, CLASSIFIED_STATUSES]}, classification["status"], status
+        ]}
+    }
+
+
+def check_out_fields(minutes_early_leave: Optional[int], day: str = "$") -> dict:
+    """Pipeline $set fields classifying a check-out; lateness comes from the stored check-in"""
+    if minutes_early_leave is None:
+        return {}
+    status = f"{day}status"
+    on_time = "early_leave" if minutes_early_leave > LATE_GRACE_MINUTES else "present"
+    return {
+        "minutes_early_leave": minutes_early_leave,
+        "status": {"$cond": [
+            {"$in": [status, CLASSIFIED_STATUSES]},
+            {"$cond": [{"$gt": [{"$ifNull": [f"{day}minutes_late", 0]}, LATE_GRACE_MINUTES]}, "late", on_time]},
+            status
+        ]}
+    }
 
 
 class AttendanceService(BaseService):
@@ -121,48 +448,597 @@ class AttendanceService(BaseService):
             "date": {"$gte": start_date, "$lte": end_date}
         })
     
+    async def create(self, data: dict) -> dict:
+        """Create a new attendance record"""
+        if data.get('date') and 'day_key' not in data:
+            data['day_key'] = day_key(data['date'])
+        return await super().create(data)
+    
     async def check_in(self, user_id: str, timestamp: datetime = None) -> dict:
         """Check in user"""
         if not timestamp:
             timestamp = datetime.utcnow()
         
-        date = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
-        existing = await self.get_by_user_and_date(user_id, date)
+        # The day is the check-in's calendar day where the schedules are kept
+        date = local_day(timestamp)
+        now = datetime.utcnow()
+        await schedule_cache.ensure_loaded(self.db)
+        classification = classify(schedule_cache.shift_for(user_id, timestamp), check_in=timestamp)
+        # One atomic upsert on the unique (user_id, day_key) index
+        for attempt in range(2):
+            try:
+                doc = await self.collection.find_one_and_update(
+                    {"user_id": user_id, "day_key": day_key(date)},
+                    [{"$set": {
+                        # Set only when the upsert inserts the day
+                        "id": {"$ifNull": ["$id", str(uuid.uuid4())]},
+                        "date": {"$ifNull": ["$date", date]},
+                        "created_at": {"$ifNull": ["$created_at", now]},
+                        "check_in": timestamp,
+                        "updated_at": now,
+                        **check_in_fields(classification)
+                    }}],
+                    projection={"_id": 0},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                break
+            except DuplicateKeyError:
+                # A concurrent check-in inserted the day first; retrying updates it
+                if attempt:
+                    raise
+        hub.publish(self.collection.name, "updated", doc)
+        return doc
+    
+    async def check_out(self, user_id: str, timestamp: datetime = None) -> Optional[dict]:
+        """Check out user"""
+        if not timestamp:
+            timestamp = datetime.utcnow()
         
-        if existing:
-            return await self.update(existing['id'], {"check_in": timestamp})
-        else:
-            return await self.create({
-                "user_id": user_id,
+        key, shift = await self._check_out_day(user_id, timestamp)
+        minutes_early_leave = classify(shift, check_out=timestamp).get("minutes_early_leave")
+        # hours_worked and status are computed server-side from the stored check_in
+        doc = await self.collection.find_one_and_update(
+            {"user_id": user_id, "day_key": key},
+            [{"$set": {
+                "check_out": timestamp,
+                "updated_at": datetime.utcnow(),
+                "hours_worked": {"$cond": [
+                    {"$ifNull": ["$check_in", False]},
+                    {"$divide": [{"$subtract": [timestamp, "$check_in"]}, 3600000]},
+                    None
+                ]},
+                **check_out_fields(minutes_early_leave)
+            }}],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            hub.publish(self.collection.name, "updated", doc)
+        return doc
+    
+    async def _open_days(self, user_id: str, keys: List[str]) -> List[dict]:
+        """Days among keys checked in but not yet out"""
+        return await self.collection.find(
+            {"user_id": user_id, "day_key": {"$in": keys}, "check_in": {"$ne": None}, "check_out": None},
+            {"_id": 0, "day_key": 1, "check_in": 1}
+        ).to_list(length=len(keys))
+    
+    async def _check_out_day(self, user_id: str, timestamp: datetime) -> tuple:
+        """Day key a check-out closes and the shift it is classified against.
+        
+        That is the latest open check-in of the local day or the day before,
+        so overnight shifts close the day they started on; the shift is
+        resolved from that check-in.
+        """
+        today = local_day(timestamp)
+        keys = [day_key(today - timedelta(days=1)), day_key(today)]
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        open_days = [day for day in await self._open_days(user_id, keys) if day["check_in"] <= timestamp]
+        await schedule_cache.ensure_loaded(self.db)
+        if not open_days:
+            return keys[-1], schedule_cache.shift_for(user_id, timestamp)
+        day = max(open_days, key=lambda day: day["check_in"])
+        return day["day_key"], schedule_cache.shift_for(user_id, day["check_in"])
+    
+    def _records_pipeline(self, filters: dict) -> List[dict]:
+        """Stages producing flat attendance records that match filters"""
+        return [{"$match": filters}]
+    
+    async def timesheet(self, start_date: datetime, end_date: datetime, user_id: str = None):
+        """Yield one row per user with hours worked (net of breaks), late days and absences.
+        
+        The aggregation runs server-side and rows are streamed from the cursor,
+        so memory use does not grow with the number of users or days.
+        """
+        filters = {"date": {"$gte": start_date, "$lte": end_date}}
+        if user_id:
+            filters["user_id"] = user_id
+        
+        def duration_ms(start: str, end: str) -> dict:
+            return {"$cond": [
+                {"$and": [{"$ifNull": [start, False]}, {"$ifNull": [end, False]}]},
+                {"$subtract": [end, start]},
+                0
+            ]}
+        
+        def count_status(*statuses: str) -> dict:
+            return {"$sum": {"$cond": [{"$in": ["$status", list(statuses)]}, 1, 0]}}
+        
+        pipeline = self._records_pipeline(filters) + [
+            {"$set": {
+                "worked_ms": duration_ms("$check_in", "$check_out"),
+                "break_ms": duration_ms("$break_start", "$break_end")
+            }},
+            {"$group": {
+                "_id": "$user_id",
+                "days": {"$sum": 1},
+                "present_days": count_status("present", "late", "early_leave"),
+                "late_days": count_status("late"),
+                "early_leave_days": count_status("early_leave"),
+                "absences": count_status("absent"),
+                "worked_ms": {"$sum": {"$max": [0, {"$subtract": ["$worked_ms", "$break_ms"]}]}},
+                "break_ms": {"$sum": "$break_ms"}
+            }},
+            {"$sort": {"_id": 1}},
+            {"$lookup": {"from": "users", "localField": "_id", "foreignField": "id", "as": "user"}},
+            {"$project": {
+                "_id": 0,
+                "user_id": "$_id",
+                "name": {"$first": "$user.name"},
+                "email": {"$first": "$user.email"},
+                "department": {"$first": "$user.department"},
+                "days": 1,
+                "present_days": 1,
+                "late_days": 1,
+                "early_leave_days": 1,
+                "absences": 1,
+                "hours_worked": {"$round": [{"$divide": ["$worked_ms", 3600000]}, 2]},
+                "break_hours": {"$round": [{"$divide": ["$break_ms", 3600000]}, 2]}
+            }}
+        ]
+        async for row in self.collection.aggregate(pipeline, allowDiskUse=True, batchSize=500):
+            yield row
+    
+    def _set_fields(self, id: str, fields: dict) -> UpdateOne:
+        """Bulk operation setting fields on one attendance record"""
+        return UpdateOne({"id": id}, {"$set": {**fields, "updated_at": datetime.utcnow()}})
+    
+    async def classify_records(self, start_date: datetime, end_date: datetime, user_id: str = None,
+                               batch_size: int = 500) -> dict:
+        """Classify historical records as present, late or early leave against cached schedules"""
+        await schedule_cache.ensure_loaded(self.db)
+        filters = {
+            "date": {"$gte": start_date, "$lte": end_date},
+            "check_in": {"$ne": None},
+            "status": {"$in": CLASSIFIED_STATUSES}
+        }
+        if user_id:
+            filters["user_id"] = user_id
+        pipeline = self._records_pipeline(filters) + [{"$project": {
+            "_id": 0, "id": 1, "user_id": 1, "check_in": 1, "check_out": 1,
+            "status": 1, "minutes_late": 1, "minutes_early_leave": 1
+        }}]
+        
+        scanned = unscheduled = updated = 0
+        operations = []
+        async for record in self.collection.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size):
+            scanned += 1
+            shift = schedule_cache.shift_for(record["user_id"], record["check_in"])
+            fields = classify(shift, record["check_in"], record.get("check_out"))
+            if not fields:
+                unscheduled += 1
+                continue
+            if any(record.get(key) != value for key, value in fields.items()):
+                operations.append(self._set_fields(record["id"], fields))
+            if len(operations) >= batch_size:
+                await self.collection.bulk_write(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+            updated += len(operations)
+        return {"scanned": scanned, "unscheduled": unscheduled, "updated": updated}
+    
+    async def backfill_day_keys(self) -> dict:
+        """Add day_key to records created before it existed, report duplicate days and index the rest"""
+        return await create_attendance_day_index(self.db)
+
+
+class BucketedAttendanceService(AttendanceService):
+    """Attendance stored as one document per user per month with an embedded array of days.
+    
+    Exposes the same interface and record shape as AttendanceService, so the
+    attendance endpoints work unchanged with ATTENDANCE_STORAGE=bucket.
+    """
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        BaseService.__init__(self, db, "attendance_buckets")
+    
+    @staticmethod
+    def _day_projection(match: dict) -> dict:
+        return {"_id": 0, "user_id": 1, "days": {"$elemMatch": match}}
+    
+    @staticmethod
+    def _flatten(bucket: Optional[dict]) -> Optional[dict]:
+        if not bucket or not bucket.get("days"):
+            return None
+        return {**bucket["days"][0], "user_id": bucket["user_id"]}
+    
+    @staticmethod
+    def _bucket_match(filters: dict) -> dict:
+        """Narrow the buckets scanned using the user and date parts of a record filter"""
+        match = {}
+        if isinstance(filters.get("user_id"), str):
+            match["user_id"] = filters["user_id"]
+        date_filter = filters.get("date")
+        if isinstance(date_filter, dict):
+            month_key = {}
+            if isinstance(date_filter.get("$gte"), datetime):
+                month_key["$gte"] = day_key(date_filter["$gte"])[:7]
+            if isinstance(date_filter.get("$lte"), datetime):
+                month_key["$lte"] = day_key(date_filter["$lte"])[:7]
+            if month_key:
+                match["month_key"] = month_key
+        return match
+    
+    def _records_pipeline(self, filters: dict) -> List[dict]:
+        return [
+            {"$match": self._bucket_match(filters)},
+            {"$unwind": "$days"},
+            {"$replaceWith": {"$mergeObjects": ["$days", {"user_id": "$user_id"}]}},
+            {"$match": filters}
+        ]
+    
+    async def _open_days(self, user_id: str, keys: List[str]) -> List[dict]:
+        return await self.collection.aggregate([
+            {"$match": {"user_id": user_id, "month_key": {"$in": sorted({key[:7] for key in keys})}}},
+            {"$unwind": "$days"},
+            {"$replaceWith": "$days"},
+            {"$match": {"day_key": {"$in": keys}, "check_in": {"$ne": None}, "check_out": None}},
+            {"$project": {"_id": 0, "day_key": 1, "check_in": 1}}
+        ]).to_list(length=len(keys))
+    
+    async def _push_day(self, user_id: str, day: dict) -> None:
+        """Append a day to the month bucket; raises DuplicateKeyError if the day already exists"""
+        month_key = day["day_key"][:7]
+        for attempt in range(2):
+            try:
+                await self.collection.update_one(
+                    {"user_id": user_id, "month_key": month_key, "days.day_key": {"$ne": day["day_key"]}},
+                    {
+                        "$push": {"days": day},
+                        "$set": {"updated_at": day["updated_at"]},
+                        "$setOnInsert": {"id": f"{user_id}:{month_key}", "created_at": day["created_at"]}
+                    },
+                    upsert=True
+                )
+                return
+            except DuplicateKeyError:
+                # Either the day exists or another request created the bucket first
+                if attempt or await self.get_by_user_and_date(user_id, day["date"]):
+                    raise
+    
+    async def create(self, data: dict) -> dict:
+        """Create a new attendance record"""
+        data = dict(data)
+        user_id = data.pop("user_id")
+        now = datetime.utcnow()
+        day = {
+            "id": data.pop("id", None) or str(uuid.uuid4()),
+            "day_key": day_key(data["date"]),
+            "created_at": now,
+            "updated_at": now,
+            **data
+        }
+        await self._push_day(user_id, day)
+        doc = {**day, "user_id": user_id}
+        hub.publish("attendance", "created", doc)
+        return doc
+    
+    async def get_by_id(self, id: str) -> Optional[dict]:
+        """Get attendance record by ID"""
+        bucket = await self.collection.find_one({"days.id": id}, self._day_projection({"id": id}))
+        return self._flatten(bucket)
+    
+    async def get_all(self, skip: int = 0, limit: int = 100, filters: dict = None) -> List[dict]:
+        """Get attendance records with pagination and filters"""
+        pipeline = self._records_pipeline(filters or {}) + [{"$skip": skip}, {"$limit": limit}]
+        return await self.collection.aggregate(pipeline).to_list(length=limit)
+    
+    async def count(self, filters: dict = None) -> int:
+        """Count attendance records with filters"""
+        pipeline = self._records_pipeline(filters or {}) + [{"$count": "count"}]
+        rows = await self.collection.aggregate(pipeline).to_list(length=1)
+        return rows[0]["count"] if rows else 0
+    
+    async def update(self, id: str, data: dict) -> Optional[dict]:
+        """Update attendance record by ID"""
+        now = datetime.utcnow()
+        changes = {f"days.$.{key}": value for key, value in data.items()}
+        changes.update({"days.$.updated_at": now, "updated_at": now})
+        result = await self.collection.update_one({"days.id": id}, {"$set": changes})
+        if result.modified_count:
+            doc = await self.get_by_id(id)
+            if doc:
+                hub.publish("attendance", "updated", doc)
+            return doc
+        return None
+    
+    async def delete(self, id: str) -> bool:
+        """Delete attendance record by ID"""
+        result = await self.collection.update_one(
+            {"days.id": id},
+            {"$pull": {"days": {"id": id}}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        if result.modified_count:
+            hub.publish("attendance", "deleted", {"id": id})
+        return result.modified_count > 0
+    
+    async def get_by_user_and_date(self, user_id: str, date: datetime) -> Optional[dict]:
+        """Get attendance by user and date"""
+        key = day_key(date)
+        bucket = await self.collection.find_one(
+            {"user_id": user_id, "month_key": key[:7], "days.day_key": key},
+            self._day_projection({"day_key": key})
+        )
+        return self._flatten(bucket)
+    
+    async def check_in(self, user_id: str, timestamp: datetime = None) -> dict:
+        """Check in user"""
+        if not timestamp:
+            timestamp = datetime.utcnow()
+        
+        date = local_day(timestamp)
+        key = day_key(date)
+        now = datetime.utcnow()
+        await schedule_cache.ensure_loaded(self.db)
+        classification = classify(schedule_cache.shift_for(user_id, timestamp), check_in=timestamp)
+        for attempt in range(2):
+            bucket = await self.collection.find_one_and_update(
+                {"user_id": user_id, "month_key": key[:7], "days.day_key": key},
+                [{"$set": {
+                    "updated_at": now,
+                    "days": {"$map": {
+                        "input": "$days",
+                        "as": "day",
+                        "in": {"$cond": [
+                            {"$eq": ["$$day.day_key", key]},
+                            {"$mergeObjects": ["$$day", {
+                                "check_in": timestamp,
+                                "updated_at": now,
+                                **check_in_fields(classification, "$$day.")
+                            }]},
+                            "$$day"
+                        ]}
+                    }}
+                }}],
+                projection=self._day_projection({"day_key": key}),
+                return_document=ReturnDocument.AFTER
+            )
+            if bucket:
+                doc = self._flatten(bucket)
+                break
+            day = {
+                "id": str(uuid.uuid4()),
+                "day_key": key,
                 "date": date,
                 "check_in": timestamp,
-                "status": "present"
-            })
+                "status": "present",
+                "created_at": now,
+                "updated_at": now,
+                **classification
+            }
+            try:
+                await self._push_day(user_id, day)
+                doc = {**day, "user_id": user_id}
+                break
+            except DuplicateKeyError:
+                # A concurrent check-in added the day first; retrying updates it
+                if attempt:
+                    raise
+        hub.publish("attendance", "updated", doc)
+        return doc
     
     async def check_out(self, user_id: str, timestamp: datetime = None) -> Optional[dict]:
         """Check out user"""
         if not timestamp:
             timestamp = datetime.utcnow()
         
-        date = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
-        existing = await self.get_by_user_and_date(user_id, date)
+        key, shift = await self._check_out_day(user_id, timestamp)
+        now = datetime.utcnow()
+        minutes_early_leave = classify(shift, check_out=timestamp).get("minutes_early_leave")
+        bucket = await self.collection.find_one_and_update(
+            {"user_id": user_id, "month_key": key[:7], "days.day_key": key},
+            [{"$set": {
+                "updated_at": now,
+                "days": {"$map": {
+                    "input": "$days",
+                    "as": "day",
+                    "in": {"$cond": [
+                        {"$eq": ["$$day.day_key", key]},
+                        {"$mergeObjects": ["$$day", {
+                            "check_out": timestamp,
+                            "updated_at": now,
+                            "hours_worked": {"$cond": [
+                                {"$ifNull": ["$$day.check_in", False]},
+                                {"$divide": [{"$subtract": [timestamp, "$$day.check_in"]}, 3600000]},
+                                None
+                            ]},
+                            **check_out_fields(minutes_early_leave, "$$day.")
+                        }]},
+                        "$$day"
+                    ]}
+                }}
+            }}],
+            projection=self._day_projection({"day_key": key}),
+            return_document=ReturnDocument.AFTER
+        )
+        doc = self._flatten(bucket)
+        if doc:
+            hub.publish("attendance", "updated", doc)
+        return doc
+    
+    def _set_fields(self, id: str, fields: dict) -> UpdateOne:
+        now = datetime.utcnow()
+        changes = {f"days.$.{key}": value for key, value in fields.items()}
+        changes.update({"days.$.updated_at": now, "updated_at": now})
+        return UpdateOne({"days.id": id}, {"$set": changes})
+    
+    async def backfill_day_keys(self) -> dict:
+        """Bucketed records always carry a day_key"""
+        return {"backfilled": 0, "duplicates": []}
+    
+    async def migrate_from_daily(self) -> dict:
+        """Copy per-day attendance documents into month buckets.
         
-        if existing:
-            # Calculate hours worked
-            hours_worked = None
-            if existing.get('check_in'):
-                hours_worked = (timestamp - existing['check_in']).total_seconds() / 3600
-            
-            return await self.update(existing['id'], {
-                "check_out": timestamp,
-                "hours_worked": hours_worked
-            })
-        return None
+        Runs as one server-side pipeline; days already present in a bucket are
+        kept, so the migration can be re-run safely.
+        """
+        await self.db["attendance"].aggregate([
+            {"$set": {"day_key": {"$ifNull": [
+                "$day_key", {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}
+            ]}}},
+            {"$unset": "_id"},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "month_key": {"$substrBytes": ["$day_key", 0, 7]}},
+                "days": {"$push": "$$ROOT"},
+                "created_at": {"$min": "$created_at"},
+                "updated_at": {"$max": "$updated_at"}
+            }},
+            {"$project": {
+                "_id": 0,
+                "id": {"$concat": ["$_id.user_id", ":", "$_id.month_key"]},
+                "user_id": "$_id.user_id",
+                "month_key": "$_id.month_key",
+                "days": {"$map": {
+                    "input": "$days",
+                    "as": "day",
+                    "in": {"$arrayToObject": {"$filter": {
+                        "input": {"$objectToArray": "$$day"},
+                        "cond": {"$ne": ["$$this.k", "user_id"]}
+                    }}}
+                }},
+                "created_at": 1,
+                "updated_at": 1
+            }},
+            {"$merge": {
+                "into": "attendance_buckets",
+                "on": ["user_id", "month_key"],
+                "whenMatched": [{"$set": {"days": {"$concatArrays": ["$days", {"$filter": {
+                    "input": "$$new.days",
+                    "as": "day",
+                    "cond": {"$not": [{"$in": ["$$day.day_key", "$days.day_key"]}]}
+                }}]}}}],
+                "whenNotMatched": "insert"
+            }}
+        ], allowDiskUse=True).to_list(length=None)
+        
+        return {
+            "daily_records": await self.db["attendance"].count_documents({}),
+            "buckets": await self.collection.count_documents({})
+        }
+
+
+def get_attendance_service(db: AsyncIOMotorDatabase) -> AttendanceService:
+    """Get the attendance service for the configured storage mode"""
+    if ATTENDANCE_STORAGE == "bucket":
+        return BucketedAttendanceService(db)
+    return AttendanceService(db)
+
+
+class GoalHistoryService(BaseService):
+    """Goal progress samples bucketed as one document per goal per day"""
+    
+    # Keeps a bucket well under the document size limit even for very busy goals
+    MAX_SAMPLES_PER_DAY = 2000
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        super().__init__(db, "goal_progress_history")
+    
+    def _sample_update(self, goal_id: str, value: float, at: datetime) -> UpdateOne:
+        day = at.replace(hour=0, minute=0, second=0, microsecond=0)
+        return UpdateOne(
+            {"goal_id": goal_id, "day": day.strftime('%Y-%m-%d')},
+            {
+                "$push": {"samples": {"$each": [{"t": at, "v": value}], "$slice": -self.MAX_SAMPLES_PER_DAY}},
+                "$inc": {"count": 1},
+                "$set": {"last_value": value, "updated_at": at},
+                "$setOnInsert": {"id": str(uuid.uuid4()), "date": day, "created_at": at}
+            },
+            upsert=True
+        )
+    
+    async def record(self, goals: List[dict]) -> None:
+        """Append the current value of each goal to today's bucket"""
+        if not goals:
+            return
+        now = datetime.utcnow()
+        await self.collection.bulk_write(
+            [self._sample_update(goal["id"], goal.get("current_value") or 0, now) for goal in goals],
+            ordered=False
+        )
+    
+    async def get_history(self, goal_id: str, start_date: datetime, end_date: datetime, points: int = 200) -> List[dict]:
+        """Get progress samples in a time range, downsampled to at most `points` values"""
+        cursor = self.collection.find(
+            {
+                "goal_id": goal_id,
+                "day": {"$gte": start_date.strftime('%Y-%m-%d'), "$lte": end_date.strftime('%Y-%m-%d')}
+            },
+            {"_id": 0, "samples": 1}
+        ).sort("day", 1)
+        
+        samples = []
+        async for bucket in cursor:
+            samples.extend(sample for sample in bucket["samples"] if start_date <= sample["t"] <= end_date)
+        if len(samples) <= points:
+            return samples
+        
+        # Progress is a step function: keep the last sample of each interval
+        first = samples[0]["t"]
+        span = (samples[-1]["t"] - first).total_seconds() or 1
+        intervals = {}
+        for sample in samples:
+            index = min(int((sample["t"] - first).total_seconds() / span * points), points - 1)
+            intervals[index] = sample
+        return list(intervals.values())
 
 
 class GoalService(BaseService):
     def __init__(self, db: AsyncIOMotorDatabase):
         super().__init__(db, "goals")
+        self.history = GoalHistoryService(db)
+    
+    def _goal_changed(self, goal: dict) -> None:
+        """Keep in-memory views of goal progress in step with a write"""
+        leaderboards.apply(goal)
+        goal_rollup_cache.invalidate()
+    
+    async def create(self, data: dict) -> dict:
+        """Create a new goal"""
+        goal = await super().create(data)
+        if goal:
+            self._goal_changed(goal)
+        return goal
+    
+    async def update(self, id: str, data: dict) -> Optional[dict]:
+        """Update goal by ID, recording a progress sample when current_value is set"""
+        goal = await super().update(id, data)
+        if goal:
+            self._goal_changed(goal)
+            if "current_value" in data:
+                await self.history.record([goal])
+        return goal
+    
+    async def delete(self, id: str) -> bool:
+        """Delete goal by ID"""
+        deleted = await super().delete(id)
+        if deleted:
+            leaderboards.remove(id)
+            goal_rollup_cache.invalidate()
+        return deleted
     
     async def get_by_user(self, user_id: str) -> List[dict]:
         """Get goals by user"""
@@ -179,15 +1055,263 @@ class GoalService(BaseService):
     async def update_progress(self, goal_id: str, current_value: float) -> Optional[dict]:
         """Update goal progress"""
         return await self.update(goal_id, {"current_value": current_value})
+    
+    async def _team_ids_for_user(self, user_id: str) -> List[str]:
+        """Team goals are matched on the member's department"""
+        await directory.ensure_loaded(self.db)
+        user = directory.get(user_id)
+        return [user["department"]] if user and user.get("department") else []
+    
+    async def _apply_ticket_event(self, user_id: Optional[str], unit: str, at: datetime, update) -> List[dict]:
+        """Apply one update to every active goal of the agent (or their team) covering `at`"""
+        if not user_id:
+            return []
+        owners = [{"user_id": user_id}]
+        team_ids = await self._team_ids_for_user(user_id)
+        if team_ids:
+            owners.append({"team_id": {"$in": team_ids}})
+        query = {
+            "unit": unit,
+            # Goals created through GoalCreate carry no is_active flag
+            "is_active": {"$ne": False},
+            "start_date": {"$lte": at},
+            "end_date": {"$gte": at},
+            "$or": owners
+        }
+        result = await self.collection.update_many(query, update)
+        if not result.modified_count:
+            return []
+        
+        goals = await self.collection.find(query, {"_id": 0}).to_list(length=None)
+        for goal in goals:
+            hub.publish(self.collection.name, "updated", goal)
+            self._goal_changed(goal)
+        await self.history.record(goals)
+        return goals
+    
+    async def record_ticket_resolved(self, user_id: Optional[str], resolved_at: datetime) -> List[dict]:
+        """Count a resolved ticket towards "tickets" goals"""
+        return await self._apply_ticket_event(user_id, "tickets", resolved_at, {
+            "$inc": {"current_value": 1},
+            "$set": {"updated_at": datetime.utcnow()}
+        })
+    
+    async def record_ticket_rated(self, user_id: Optional[str], resolved_at: datetime,
+                                  rating: int, previous_rating: Optional[int]) -> List[dict]:
+        """Fold a satisfaction rating into the running average of "satisfaction" goals"""
+        count_delta = 0 if previous_rating is not None else 1
+        sum_delta = rating - (previous_rating or 0)
+        return await self._apply_ticket_event(user_id, "satisfaction", resolved_at, [
+            {"$set": {
+                "rating_sum": {"$add": [{"$ifNull": ["$rating_sum", 0]}, sum_delta]},
+                "rating_count": {"$add": [{"$ifNull": ["$rating_count", 0]}, count_delta]}
+            }},
+            {"$set": {
+                "current_value": {"$cond": [
+                    {"$gt": ["$rating_count", 0]},
+                    {"$divide": ["$rating_sum", "$rating_count"]},
+                    0
+                ]},
+                "updated_at": datetime.utcnow()
+            }}
+        ])
+    
+    async def record_ticket_deleted(self, ticket: dict) -> List[dict]:
+        """Take a deleted resolved ticket (and its rating) back out of goal progress"""
+        if not ticket.get("resolved_at"):
+            return []
+        goals = await self._apply_ticket_event(ticket.get("assigned_to"), "tickets", ticket["resolved_at"], {
+            "$inc": {"current_value": -1},
+            "$set": {"updated_at": datetime.utcnow()}
+        })
+        rating = ticket.get("satisfaction_rating")
+        if rating is not None:
+            goals += await self._apply_ticket_event(ticket.get("assigned_to"), "satisfaction", ticket["resolved_at"], [
+                {"$set": {
+                    "rating_sum": {"$subtract": [{"$ifNull": ["$rating_sum", 0]}, rating]},
+                    "rating_count": {"$max": [{"$subtract": [{"$ifNull": ["$rating_count", 0]}, 1]}, 0]}
+                }},
+                {"$set": {
+                    "current_value": {"$cond": [
+                        {"$gt": ["$rating_count", 0]},
+                        {"$divide": ["$rating_sum", "$rating_count"]},
+                        0
+                    ]},
+                    "updated_at": datetime.utcnow()
+                }}
+            ])
+        return goals
+    
+    async def recompute_progress(self, goal_ids: List[str] = None) -> dict:
+        """Recompute "tickets" and "satisfaction" goals from tickets (backfills and repairs)"""
+        query = {"unit": {"$in": ["tickets", "satisfaction"]}, "is_active": {"$ne": False}}
+        if goal_ids:
+            query["id"] = {"$in": goal_ids}
+        
+        await directory.ensure_loaded(self.db)
+        operations = []
+        recomputed = []
+        async for goal in self.collection.find(query, {"_id": 0}):
+            if goal.get("user_id"):
+                members = [goal["user_id"]]
+            elif goal.get("team_id"):
+                members = directory.ids(department=goal["team_id"])
+            else:
+                continue
+            
+            pipeline = [
+                {"$unionWith": "tickets_archive"},
+                {"$match": {
+                    "assigned_to": {"$in": members},
+                    "resolved_at": {"$gte": goal["start_date"], "$lte": goal["end_date"]}
+                }},
+                {"$group": {
+                    "_id": None,
+                    "resolved": {"$sum": 1},
+                    "rating_sum": {"$sum": {"$ifNull": ["$satisfaction_rating", 0]}},
+                    "rating_count": {"$sum": {"$cond": [{"$ifNull": ["$satisfaction_rating", False]}, 1, 0]}}
+                }}
+            ]
+            rows = await self.db["tickets"].aggregate(pipeline).to_list(length=1)
+            totals = rows[0] if rows else {"resolved": 0, "rating_sum": 0, "rating_count": 0}
+            
+            if goal["unit"] == "tickets":
+                update = {"current_value": totals["resolved"]}
+            else:
+                update = {
+                    "current_value": totals["rating_sum"] / totals["rating_count"] if totals["rating_count"] else 0,
+                    "rating_sum": totals["rating_sum"],
+                    "rating_count": totals["rating_count"]
+                }
+            update["updated_at"] = datetime.utcnow()
+            operations.append(UpdateOne({"id": goal["id"]}, {"$set": update}))
+            recomputed.append({"id": goal["id"], "current_value": update["current_value"]})
+        
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+            await self.history.record(recomputed)
+            leaderboards.invalidate()
+            goal_rollup_cache.invalidate()
+        return {"goals": len(operations)}
+    
+    def _team_goals_pipeline(self, match: dict) -> List[dict]:
+        """Goals tagged with their team: team_id for team goals, the member's department otherwise"""
+        return [
+            {"$match": {"is_active": {"$ne": False}, **match}},
+            {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "id", "as": "member"}},
+            {"$set": {
+                "team": {"$ifNull": ["$team_id", {"$first": "$member.department"}]},
+                "member_name": {"$first": "$member.name"},
+                "attainment": {"$cond": [
+                    {"$gt": ["$target_value", 0]},
+                    {"$divide": [{"$ifNull": ["$current_value", 0]}, "$target_value"]},
+                    None
+                ]}
+            }},
+            {"$match": {"team": {"$ne": None}}},
+            {"$project": {"_id": 0, "member": 0}}
+        ]
+    
+    @staticmethod
+    def _rollup_group(by: dict) -> dict:
+        return {"$group": {
+            "_id": by,
+            "goals": {"$sum": 1},
+            "members": {"$addToSet": "$user_id"},
+            "current_value": {"$sum": {"$ifNull": ["$current_value", 0]}},
+            "target_value": {"$sum": "$target_value"},
+            "average_attainment": {"$avg": "$attainment"},
+            "completed": {"$sum": {"$cond": [{"$gte": [{"$ifNull": ["$current_value", 0]}, "$target_value"]}, 1, 0]}}
+        }}
+    
+    @staticmethod
+    def _format_rollup(row: dict) -> dict:
+        return {
+            **row["_id"],
+            "goals": row["goals"],
+            "members": len([member for member in row["members"] if member]),
+            "current_value": row["current_value"],
+            "target_value": row["target_value"],
+            "average_attainment": row["average_attainment"],
+            "completed": row["completed"]
+        }
+    
+    async def get_team_rollups(self, unit: str = None) -> List[dict]:
+        """Sum and average goal progress per team and unit"""
+        async def compute():
+            pipeline = self._team_goals_pipeline({"unit": unit} if unit else {}) + [
+                self._rollup_group({"team": "$team", "unit": "$unit"}),
+                {"$sort": {"_id.team": 1, "_id.unit": 1}}
+            ]
+            return [self._format_rollup(row) async for row in self.collection.aggregate(pipeline)]
+        
+        return await goal_rollup_cache.get_or_compute(("rollups", unit), compute)
+    
+    async def get_team_dashboard(self, team_id: str, limit: int = 100) -> dict:
+        """Rollup per unit plus the team's goals ranked by attainment"""
+        async def compute():
+            await directory.ensure_loaded(self.db)
+            members = directory.ids(department=team_id)
+            pipeline = self._team_goals_pipeline({"$or": [{"team_id": team_id}, {"user_id": {"$in": members}}]}) + [
+                {"$match": {"team": team_id}},
+                {"$facet": {
+                    "rollup": [self._rollup_group({"unit": "$unit"}), {"$sort": {"_id.unit": 1}}],
+                    "goals": [{"$sort": {"attainment": -1}}, {"$limit": limit}]
+                }}
+            ]
+            results = await self.collection.aggregate(pipeline).to_list(length=1)
+            facets = results[0] if results else {"rollup": [], "goals": []}
+            return {
+                "team": team_id,
+                "members": len(members),
+                "rollup": [self._format_rollup(row) for row in facets["rollup"]],
+                "goals": facets["goals"]
+            }
+        
+        return await goal_rollup_cache.get_or_compute(("dashboard", team_id, limit), compute)
+    
+    async def get_leaderboard(self, unit: str, period: str = None, limit: int = 10, offset: int = 0) -> dict:
+        """Get goals of a unit ranked by attainment for a period"""
+        await leaderboards.ensure_loaded(self.db)
+        period, board = leaderboards.get(unit, period)
+        return {
+            "unit": unit,
+            "period": period,
+            "periods": leaderboards.periods(unit),
+            "total": len(board) if board else 0,
+            "entries": board.top(limit, offset) if board else []
+        }
+    
+    async def get_leaderboard_rank(self, unit: str, user_id: str, period: str = None) -> Optional[dict]:
+        """Get a user's best rank on a leaderboard"""
+        await leaderboards.ensure_loaded(self.db)
+        period, board = leaderboards.get(unit, period)
+        entry = board.rank_of_user(user_id) if board else None
+        if entry is None:
+            return None
+        return {"unit": unit, "period": period, "total": len(board), **entry}
 
 
 class CustomerService(BaseService):
     def __init__(self, db: AsyncIOMotorDatabase):
         super().__init__(db, "customers")
     
+    async def create(self, data: dict) -> dict:
+        """Create a new customer; raises DuplicateKeyError if the email is taken"""
+        await check_email_available(self.collection, data.get("email"))
+        data["email_normalized"] = normalize_email(data.get("email"))
+        return await super().create(data)
+    
+    async def update(self, id: str, data: dict) -> Optional[dict]:
+        """Update customer by ID; raises DuplicateKeyError if the new email is taken"""
+        if "email" in data:
+            await check_email_available(self.collection, data["email"], exclude_id=id)
+            data["email_normalized"] = normalize_email(data["email"])
+        return await super().update(id, data)
+    
     async def get_by_email(self, email: str) -> Optional[dict]:
-        """Get customer by email"""
-        doc = await self.collection.find_one({"email": email})
+        """Get customer by email (case-insensitive)"""
+        doc = await self.collection.find_one({"email_normalized": normalize_email(email)})
         if doc:
             doc.pop('_id', None)
         return doc
@@ -210,13 +1334,244 @@ class CustomerService(BaseService):
         })
 
 
+OPEN_TICKET_STATUSES = ["open", "in_progress", "escalated"]
+ARCHIVABLE_TICKET_STATUSES = ["resolved", "closed"]
+
+
+def is_open_ticket(ticket: dict) -> bool:
+    """Tickets without a status were never updated and are still open"""
+    return ticket.get("status") in (None, *OPEN_TICKET_STATUSES)
+
+
+class AgentStatsService(BaseService):
+    """Materialized per-agent counters kept in step with ticket writes"""
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        super().__init__(db, "agent_stats")
+    
+    async def increment(self, user_id: str, counters: Dict[str, float]) -> None:
+        """Atomically increment counters for an agent, creating the document if needed"""
+        if not user_id or not counters:
+            return
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"user_id": user_id},
+            {
+                "$inc": counters,
+                "$set": {"updated_at": now},
+                "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}
+            },
+            upsert=True
+        )
+    
+    async def record_assignment(self, previous_user_id: Optional[str], user_id: str, is_open: bool) -> None:
+        """Move an open ticket from one agent's workload to another's"""
+        if not is_open or previous_user_id == user_id:
+            return
+        await self.increment(previous_user_id, {"open_tickets": -1})
+        await self.increment(user_id, {"open_tickets": 1})
+    
+    async def record_resolution(self, user_id: Optional[str], was_open: bool, resolved_at: datetime) -> None:
+        """Count a resolved ticket for its agent"""
+        if not was_open:
+            return
+        await self.increment(user_id, {
+            "open_tickets": -1,
+            "resolved_total": 1,
+            f"resolved_by_day.{resolved_at.strftime('%Y-%m-%d')}": 1
+        })
+    
+    async def record_rating(self, user_id: Optional[str], rating: int, previous_rating: Optional[int]) -> None:
+        """Add a satisfaction rating, replacing the previous one if the ticket was re-rated"""
+        if previous_rating is None:
+            await self.increment(user_id, {"rating_sum": rating, "rating_count": 1})
+        else:
+            await self.increment(user_id, {"rating_sum": rating - previous_rating})
+    
+    async def record_removal(self, ticket: dict) -> None:
+        """Take a deleted ticket out of its agent's counters"""
+        counters = {}
+        if is_open_ticket(ticket):
+            counters["open_tickets"] = -1
+        if ticket.get("resolved_at"):
+            counters["resolved_total"] = -1
+            counters[f"resolved_by_day.{ticket['resolved_at'].strftime('%Y-%m-%d')}"] = -1
+        if ticket.get("satisfaction_rating") is not None:
+            counters.update({"rating_sum": -ticket["satisfaction_rating"], "rating_count": -1})
+        await self.increment(ticket.get("assigned_to"), counters)
+    
+    def _format(self, doc: dict) -> dict:
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        rating_count = doc.get("rating_count", 0)
+        return {
+            "user_id": doc["user_id"],
+            "open_tickets": doc.get("open_tickets", 0),
+            "resolved_today": doc.get("resolved_by_day", {}).get(today, 0),
+            "resolved_total": doc.get("resolved_total", 0),
+            "rating_count": rating_count,
+            "average_satisfaction": doc.get("rating_sum", 0) / rating_count if rating_count else None,
+            "updated_at": doc.get("updated_at")
+        }
+    
+    async def get_by_user(self, user_id: str) -> Optional[dict]:
+        """Get counters for one agent"""
+        doc = await self.collection.find_one({"user_id": user_id}, {"_id": 0})
+        return self._format(doc) if doc else None
+    
+    async def get_all_stats(self, skip: int = 0, limit: int = 100) -> List[dict]:
+        """Get counters for all agents"""
+        docs = await self.get_all(skip=skip, limit=limit)
+        return [self._format(doc) for doc in docs]
+    
+    async def reconcile(self, days: int = 30) -> dict:
+        """Rebuild every agent's counters from the tickets collection to repair drift"""
+        tickets = self.db["tickets"]
+        since = (datetime.utcnow() - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        totals_pipeline = [
+            {"$unionWith": "tickets_archive"},
+            {"$match": {"assigned_to": {"$ne": None}}},
+            {"$group": {
+                "_id": "$assigned_to",
+                "open_tickets": {"$sum": {"$cond": [
+                    {"$in": [{"$ifNull": ["$status", "open"]}, OPEN_TICKET_STATUSES]}, 1, 0
+                ]}},
+                "resolved_total": {"$sum": {"$cond": [{"$ifNull": ["$resolved_at", False]}, 1, 0]}},
+                "rating_sum": {"$sum": {"$ifNull": ["$satisfaction_rating", 0]}},
+                "rating_count": {"$sum": {"$cond": [{"$ifNull": ["$satisfaction_rating", False]}, 1, 0]}}
+            }}
+        ]
+        daily_pipeline = [
+            {"$unionWith": "tickets_archive"},
+            {"$match": {"assigned_to": {"$ne": None}, "resolved_at": {"$gte": since}}},
+            {"$group": {
+                "_id": {
+                    "user_id": "$assigned_to",
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$resolved_at"}}
+                },
+                "count": {"$sum": 1}
+            }}
+        ]
+        
+        resolved_by_day: Dict[str, Dict[str, int]] = {}
+        async for row in tickets.aggregate(daily_pipeline):
+            resolved_by_day.setdefault(row["_id"]["user_id"], {})[row["_id"]["day"]] = row["count"]
+        
+        now = datetime.utcnow()
+        operations = []
+        async for row in tickets.aggregate(totals_pipeline):
+            operations.append(UpdateOne(
+                {"user_id": row["_id"]},
+                {
+                    "$set": {
+                        "open_tickets": row["open_tickets"],
+                        "resolved_total": row["resolved_total"],
+                        "resolved_by_day": resolved_by_day.get(row["_id"], {}),
+                        "rating_sum": row["rating_sum"],
+                        "rating_count": row["rating_count"],
+                        "updated_at": now
+                    },
+                    "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}
+                },
+                upsert=True
+            ))
+        
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+        # Agents with no assigned tickets left keep no counters
+        stale = await self.collection.delete_many({"updated_at": {"$lt": now}})
+        
+        return {"agents": len(operations), "removed": stale.deleted_count}
+
+
 class TicketService(BaseService):
     def __init__(self, db: AsyncIOMotorDatabase):
         super().__init__(db, "tickets")
+        self.archive = db["tickets_archive"]
+        self.agent_stats = AgentStatsService(db)
+    
+    async def create(self, data: dict) -> dict:
+        """Create a new ticket"""
+        ticket = await super().create(data)
+        if ticket and ticket.get("assigned_to"):
+            await self.agent_stats.increment(ticket["assigned_to"], {"open_tickets": 1})
+        return ticket
     
-    async def get_by_customer(self, customer_id: str) -> List[dict]:
-        """Get tickets by customer"""
-        return await self.get_all(filters={"customer_id": customer_id})
+    async def get_by_id(self, id: str) -> Optional[dict]:
+        """Get ticket by ID, falling back to the archive"""
+        doc = await super().get_by_id(id)
+        if doc is None:
+            doc = await self.archive.find_one({"id": id}, {"_id": 0})
+        return doc
+    
+    async def get_by_customer(self, customer_id: str, limit: int = 100) -> List[dict]:
+        """Get tickets by customer, including archived history"""
+        tickets = await self.get_all(limit=limit, filters={"customer_id": customer_id})
+        if len(tickets) < limit:
+            remaining = limit - len(tickets)
+            # Skip stale copies of tickets reopened while being archived
+            cursor = self.archive.find(
+                {"customer_id": customer_id, "id": {"$nin": [ticket["id"] for ticket in tickets]}}, {"_id": 0}
+            ).sort("created_at", -1).limit(remaining)
+            tickets.extend(await cursor.to_list(length=remaining))
+        return tickets
+    
+    async def archive_closed(self, older_than_days: int = 90, batch_size: int = 500,
+                             max_batches: int = None) -> dict:
+        """Move tickets resolved or closed more than N days ago into tickets_archive.
+        
+        Each batch is copied with idempotent upserts before being deleted from
+        the working set, so an interrupted run can simply be started again.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        query = {
+            "status": {"$in": ARCHIVABLE_TICKET_STATUSES},
+            "$or": [
+                {"resolved_at": {"$lt": cutoff}},
+                # Closed without going through resolve_ticket
+                {"resolved_at": None, "updated_at": {"$lt": cutoff}}
+            ]
+        }
+        
+        archived = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            docs = await self.collection.find(query).limit(batch_size).to_list(length=batch_size)
+            if not docs:
+                break
+            
+            archived_at = datetime.utcnow()
+            operations = []
+            for doc in docs:
+                doc.pop('_id', None)
+                doc["archived_at"] = archived_at
+                operations.append(ReplaceOne({"id": doc["id"]}, doc, upsert=True))
+            await self.archive.bulk_write(operations, ordered=False)
+            
+            # Re-check the archival condition so a ticket reopened mid-batch stays hot
+            ids = [doc["id"] for doc in docs]
+            result = await self.collection.delete_many({"$and": [{"id": {"$in": ids}}, query]})
+            archived += result.deleted_count
+            still_hot = []
+            if result.deleted_count < len(ids):
+                # ...and drop its archive copy, so it is never counted twice
+                still_hot = await self.collection.distinct("id", {"id": {"$in": ids}})
+                await self.archive.delete_many({"id": {"$in": still_hot}})
+            
+            # Tombstones tell delta sync clients the tickets left the working set
+            moved = set(ids) - set(still_hot)
+            if moved:
+                await self.db["tombstones"].bulk_write([
+                    UpdateOne(
+                        {"collection": self.collection.name, "id": id},
+                        {"$set": {"updated_at": archived_at, "deleted_at": archived_at}},
+                        upsert=True
+                    )
+                    for id in moved
+                ], ordered=False)
+            batches += 1
+        
+        return {"archived": archived, "batches": batches, "cutoff": cutoff}
     
     async def get_by_assignee(self, user_id: str) -> List[dict]:
         """Get tickets by assignee"""
@@ -230,6 +1585,54 @@ class TicketService(BaseService):
         """Get tickets by priority"""
         return await self.get_all(filters={"priority": priority})
     
+    async def update(self, id: str, data: dict) -> Optional[dict]:
+        """Update ticket, counting assignee, status and rating changes like the dedicated endpoints"""
+        if data.get("status") == "resolved" and "resolved_at" not in data:
+            data["resolved_at"] = datetime.utcnow()
+        previous = await self.update_and_get_previous(id, data)
+        if not previous:
+            return None
+        await self._record_changes(previous, data)
+        return await self.get_by_id(id)
+    
+    async def delete(self, id: str) -> bool:
+        """Delete ticket, taking it out of agent counters and goal progress"""
+        ticket = await self.collection.find_one_and_delete({"id": id}, projection={"_id": 0})
+        if not ticket:
+            return False
+        await self._record_delete(id)
+        await self.agent_stats.record_removal(ticket)
+        await GoalService(self.db).record_ticket_deleted(ticket)
+        return True
+    
+    async def _record_changes(self, previous: dict, changes: dict) -> None:
+        """Keep agent counters and goal progress in step with a ticket write.
+        
+        Changes apply as an assignment, then a status change, then a rating,
+        each attributed to the assignee at that point.
+        """
+        assignee = previous.get("assigned_to")
+        was_open = is_open_ticket(previous)
+        if "assigned_to" in changes:
+            await self.agent_stats.record_assignment(assignee, changes["assigned_to"], was_open)
+            assignee = changes["assigned_to"]
+        resolved_at = previous.get("resolved_at")
+        if "status" in changes:
+            is_open = is_open_ticket(changes)
+            if was_open and changes["status"] == "resolved":
+                resolved_at = changes["resolved_at"]
+                await self.agent_stats.record_resolution(assignee, True, resolved_at)
+                await GoalService(self.db).record_ticket_resolved(assignee, resolved_at)
+            elif was_open != is_open:
+                # Closed without resolving, or reopened
+                await self.agent_stats.increment(assignee, {"open_tickets": 1 if is_open else -1})
+        rating = changes.get("satisfaction_rating")
+        if rating is not None:
+            await self.agent_stats.record_rating(assignee, rating, previous.get("satisfaction_rating"))
+            await GoalService(self.db).record_ticket_rated(
+                assignee, resolved_at or datetime.utcnow(), rating, previous.get("satisfaction_rating")
+            )
+    
     async def assign_ticket(self, ticket_id: str, user_id: str) -> Optional[dict]:
         """Assign ticket to user"""
         return await self.update(ticket_id, {"assigned_to": user_id})
@@ -249,11 +1652,175 @@ class TicketService(BaseService):
             update_data["satisfaction_comment"] = comment
         return await self.update(ticket_id, update_data)
 
+    async def get_stats(self, start_date: datetime = None, end_date: datetime = None,
+                        customer_id: str = None) -> dict:
+        """Get ticket counts by status, priority, channel and assignee in one aggregation, archive included"""
+        async def compute():
+            match = {}
+            if start_date or end_date:
+                match["created_at"] = {}
+                if start_date:
+                    match["created_at"]["$gte"] = start_date
+                if end_date:
+                    match["created_at"]["$lte"] = end_date
+            if customer_id:
+                match["customer_id"] = customer_id
+            
+            pipeline = [{"$match": match}]
+            if await self.archive.find_one(match, {"_id": 1}):
+                # The range reaches archived tickets
+                pipeline.append({"$unionWith": {"coll": self.archive.name, "pipeline": [{"$match": match}]}})
+            pipeline += [
+                {"$facet": {
+                    "total": [{"$count": "count"}],
+                    # Tickets created through TicketCreate carry no status until updated
+                    "by_status": [{"$group": {
+                        "_id": {"$ifNull": ["$status", "open"]},
+                        "count": {"$sum": 1}
+                    }}],
+                    "by_priority": [{"$group": {"_id": "$priority", "count": {"$sum": 1}}}],
+                    "by_channel": [{"$group": {"_id": "$channel", "count": {"$sum": 1}}}],
+                    "by_assignee": [{"$group": {"_id": "$assigned_to", "count": {"$sum": 1}}}],
+                    "satisfaction": [
+                        {"$match": {"satisfaction_rating": {"$ne": None}}},
+                        {"$group": {
+                            "_id": None,
+                            "average": {"$avg": "$satisfaction_rating"},
+                            "count": {"$sum": 1}
+                        }}
+                    ]
+                }}
+            ]
+            results = await self.collection.aggregate(pipeline).to_list(length=1)
+            facets = results[0] if results else {}
+            
+            def counts(name: str, empty_key: str = "none") -> Dict[str, int]:
+                return {
+                    (row["_id"] if row["_id"] is not None else empty_key): row["count"]
+                    for row in facets.get(name, [])
+                }
+            
+            satisfaction = facets.get("satisfaction") or [{}]
+            return {
+                "total": facets["total"][0]["count"] if facets.get("total") else 0,
+                "by_status": counts("by_status"),
+                "by_priority": counts("by_priority"),
+                "by_channel": counts("by_channel"),
+                "by_assignee": counts("by_assignee", empty_key="unassigned"),
+                "satisfaction": {
+                    "average": satisfaction[0].get("average"),
+                    "count": satisfaction[0].get("count", 0)
+                }
+            }
+        
+        return await ticket_stats_cache.get_or_compute((start_date, end_date, customer_id), compute)
+
+
+class AttachmentService(BaseService):
+    """Ticket attachment metadata; file contents live in the configured store"""
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        super().__init__(db, "ticket_attachments")
+    
+    async def get_by_ticket(self, ticket_id: str) -> List[dict]:
+        """Get attachments by ticket"""
+        return await self.get_all(filters={"ticket_id": ticket_id})
+    
+    async def upload(self, ticket_id: str, filename: str, content_type: str, chunks) -> dict:
+        """Stream a file into storage and link it to the ticket"""
+        store = get_attachment_store(self.db)
+        attachment_id = str(uuid.uuid4())
+        size = await store.save(attachment_id, filename, content_type, chunks)
+        
+        attachment = await self.create({
+            "id": attachment_id,
+            "ticket_id": ticket_id,
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+            "storage": store.name,
+            "url": f"/api/tickets/{ticket_id}/attachments/{attachment_id}"
+        })
+        await self.db["tickets"].update_one(
+            {"id": ticket_id},
+            {"$push": {"attachments": attachment["url"]}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        return attachment
+    
+    async def download(self, attachment: dict, byte_range=None):
+        """Build a streaming response for the whole file or an inclusive byte range"""
+        store = get_attachment_store(self.db, attachment.get("storage"))
+        return await store.response(attachment, byte_range)
+    
+    async def remove(self, attachment: dict) -> bool:
+        """Delete the file, its metadata and the ticket link"""
+        store = get_attachment_store(self.db, attachment.get("storage"))
+        await store.delete(attachment["id"])
+        await self.db["tickets"].update_one(
+            {"id": attachment["ticket_id"]},
+            {"$pull": {"attachments": attachment["url"]}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        return await self.delete(attachment["id"])
+
 
 class MonitoringService(BaseService):
     def __init__(self, db: AsyncIOMotorDatabase):
         super().__init__(db, "monitoring_metrics")
     
+    async def create(self, data: dict) -> dict:
+        """Create a new metric without reading it back"""
+        now = datetime.utcnow()
+        data.setdefault("id", str(uuid.uuid4()))
+        data.setdefault("timestamp", now)
+        data.setdefault("created_at", now)
+        data.setdefault("updated_at", now)
+        await self.collection.insert_one(data)
+        data.pop("_id", None)
+        await self._after_insert([data])
+        hub.publish("monitoring_metrics", "created", data)
+        return data
+    
+    def _to_documents(self, metrics: List[dict]) -> List[dict]:
+        return metrics
+    
+    def _points_pipeline(self, filters: dict, sort: dict = None, limit: int = None) -> List[dict]:
+        """Aggregation stages yielding matching metrics in the MonitoringMetric shape"""
+        return [{"$match": filters}] + ([{"$sort": sort}] if sort else []) + ([{"$limit": limit}] if limit else [])
+    
+    async def _after_insert(self, metrics: List[dict]) -> None:
+        """Feed stored metrics to the recent-metrics buffer, rollups and quantile sketches.
+        
+        Failures are logged, not raised: the points are already stored, and
+        the ingest buffer would otherwise insert them again.
+        """
+        recent_metrics.append(metrics)
+        for summary in (MetricRollupService(self.db), MetricSketchService(self.db)):
+            try:
+                await summary.record(metrics)
+            except Exception as e:
+                logging.getLogger(__name__).warning(
+                    f"Could not update {summary.__class__.__name__} (repair with rebuild-metric-rollups): {e}"
+                )
+    
+    async def insert_many(self, metrics: List[dict]) -> int:
+        """Write a batch of stamped metrics in one round trip.
+        
+        Documents the server rejects are logged and dropped, so one bad point
+        cannot block the ingest buffer; connection errors are raised for retry.
+        pymongo stamps an _id on each metric, so a retried batch that was
+        partly written is rejected as duplicates rather than stored twice.
+        """
+        try:
+            await self.collection.insert_many(self._to_documents(metrics), ordered=False)
+            inserted = metrics
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            logging.getLogger(__name__).warning(f"Dropped {len(errors)} metrics rejected by the database")
+            rejected = {error["index"] for error in errors}
+            inserted = [metric for index, metric in enumerate(metrics) if index not in rejected]
+        await self._after_insert(inserted)
+        return len(inserted)
+    
     async def get_by_category(self, category: str) -> List[dict]:
         """Get metrics by category"""
         return await self.get_all(filters={"category": category})
@@ -275,6 +1842,415 @@ class MonitoringService(BaseService):
         for doc in docs:
             doc.pop('_id', None)
         return docs
+    
+    async def get_latest_by_category(self, categories=DASHBOARD_CATEGORIES, limit: int = 10) -> Dict[str, List[dict]]:
+        """Most recent metrics of each category, one concurrent indexed query per category.
+        
+        Each query walks the (category, timestamp) index and stops after
+        `limit` points; a single $facet could not use the index and would
+        sort every stored metric of the categories.
+        """
+        async def latest(category: str) -> List[dict]:
+            pipeline = self._points_pipeline({"category": category}, sort={"timestamp": -1}, limit=limit) + [
+                {"$project": {"_id": 0}}
+            ]
+            return await self.collection.aggregate(pipeline).to_list(length=limit)
+        
+        results = await asyncio.gather(*(latest(category) for category in categories))
+        return dict(zip(categories, results))
+    
+    async def get_dashboard(self, latest: int = 50, per_category: int = 10) -> dict:
+        """Latest metrics plus the latest per dashboard category.
+        
+        Both queries run concurrently; the result is cached briefly and
+        concurrent requests share one computation.
+        """
+        async def compute():
+            latest_metrics, by_category = await asyncio.gather(
+                self.get_latest_metrics(latest),
+                self.get_latest_by_category(DASHBOARD_CATEGORIES, per_category)
+            )
+            return {
+                "latest_metrics": latest_metrics,
+                **{f"{category}_metrics": by_category.get(category, []) for category in DASHBOARD_CATEGORIES},
+                "total_metrics": len(latest_metrics)
+            }
+        
+        cache_key = (self.collection.name, latest, per_category)
+        return await monitoring_dashboard_cache.get_or_compute(cache_key, compute)
+
+
+class TimeSeriesMonitoringService(MonitoringService):
+    """Monitoring metrics in a MongoDB time-series collection.
+    
+    name, category and user_id form the metaField, so points of one series
+    are stored together in compressed buckets. Filters on those fields are
+    translated and results flattened back into the MonitoringMetric shape,
+    so the monitoring endpoints work unchanged with MONITORING_STORAGE=timeseries.
+    Deleting single metrics needs MongoDB 7.0 or later.
+    
+    Time-series collections do not enforce unique _ids, so when a
+    connection error interrupts insert_many after part of a batch was
+    written, the ingest buffer's retry stores that part twice.
+    """
+    
+    META_FIELDS = ("name", "category", "user_id")
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        BaseService.__init__(self, db, TIMESERIES_METRICS_COLLECTION)
+    
+    @classmethod
+    def _to_point(cls, metric: dict) -> dict:
+        point = {key: value for key, value in metric.items() if key not in cls.META_FIELDS and key != "_id"}
+        point["meta"] = {field: metric.get(field) for field in cls.META_FIELDS}
+        return point
+    
+    @staticmethod
+    def _flatten(point: Optional[dict]) -> Optional[dict]:
+        if not point:
+            return None
+        point.pop("_id", None)
+        return {**point.pop("meta", {}), **point}
+    
+    @classmethod
+    def _translate(cls, filters: Optional[dict]) -> dict:
+        """Rewrite a metric filter to the stored point shape"""
+        if not filters:
+            return {}
+        translated = {}
+        for key, value in filters.items():
+            if key in ("$and", "$or", "$nor"):
+                translated[key] = [cls._translate(clause) for clause in value]
+            elif key in cls.META_FIELDS:
+                translated[f"meta.{key}"] = value
+            else:
+                translated[key] = value
+        return translated
+    
+    async def create(self, data: dict) -> dict:
+        """Create a new metric point"""
+        now = datetime.utcnow()
+        data.setdefault("id", str(uuid.uuid4()))
+        data.setdefault("timestamp", now)
+        data.setdefault("created_at", now)
+        data.setdefault("updated_at", now)
+        await self.collection.insert_one(self._to_point(data))
+        doc = {key: value for key, value in data.items() if key != "_id"}
+        await self._after_insert([doc])
+        hub.publish("monitoring_metrics", "created", doc)
+        return doc
+    
+    def _to_documents(self, metrics: List[dict]) -> List[dict]:
+        return [self._to_point(metric) for metric in metrics]
+    
+    def _points_pipeline(self, filters: dict, sort: dict = None, limit: int = None) -> List[dict]:
+        # Sort and limit before flattening, while the stored fields can still use the indexes
+        stages = [{"$match": self._translate(filters)}] + ([{"$sort": sort}] if sort else [])
+        return stages + ([{"$limit": limit}] if limit else []) + [
+            {"$replaceWith": {"$mergeObjects": ["$meta", "$$ROOT"]}},
+            {"$unset": "meta"}
+        ]
+    
+    async def get_by_id(self, id: str) -> Optional[dict]:
+        """Get metric by ID"""
+        return self._flatten(await self.collection.find_one({"id": id}))
+    
+    async def get_all(self, skip: int = 0, limit: int = 100, filters: dict = None) -> List[dict]:
+        """Get metrics with pagination and filters"""
+        cursor = self.collection.find(self._translate(filters)).skip(skip).limit(limit)
+        return [self._flatten(point) for point in await cursor.to_list(length=limit)]
+    
+    async def count(self, filters: dict = None) -> int:
+        """Count metrics with filters"""
+        return await self.collection.count_documents(self._translate(filters))
+    
+    async def delete(self, id: str) -> bool:
+        """Delete metric by ID"""
+        result = await self.collection.delete_one({"id": id})
+        if result.deleted_count:
+            hub.publish("monitoring_metrics", "deleted", {"id": id})
+        return result.deleted_count > 0
+    
+    async def get_latest_metrics(self, limit: int = 100) -> List[dict]:
+        """Get latest metrics"""
+        cursor = self.collection.find().sort("timestamp", -1).limit(limit)
+        return [self._flatten(point) for point in await cursor.to_list(length=limit)]
+    
+    async def migrate_from_collection(self, batch_size: int = 1000) -> dict:
+        """Copy metrics from the regular collection into the time-series one.
+        
+        Resumes after the newest point already copied, so the migration can be
+        re-run (e.g. just before switching MONITORING_STORAGE) to catch up.
+        """
+        await create_monitoring_timeseries(self.db)
+        query = {}
+        copied_ids = set()
+        newest = await self.collection.find_one({}, {"timestamp": 1}, sort=[("timestamp", -1)])
+        if newest:
+            query = {"timestamp": {"$gte": newest["timestamp"]}}
+            copied_ids = set(await self.collection.distinct("id", {"timestamp": newest["timestamp"]}))
+        
+        copied = 0
+        batch = []
+        cursor = self.db["monitoring_metrics"].aggregate([
+            # Metrics created through MonitoringMetricCreate carry no timestamp
+            {"$set": {"timestamp": {"$ifNull": ["$timestamp", "$created_at"]}}},
+            {"$match": {"timestamp": {"$type": "date"}, **query}},
+            {"$sort": {"timestamp": 1}},
+            {"$project": {"_id": 0}}
+        ], allowDiskUse=True, batchSize=batch_size)
+        async for metric in cursor:
+            if metric.get("id") in copied_ids:
+                continue
+            batch.append(self._to_point(metric))
+            if len(batch) >= batch_size:
+                await self.collection.insert_many(batch, ordered=False)
+                copied += len(batch)
+                batch = []
+        if batch:
+            await self.collection.insert_many(batch, ordered=False)
+            copied += len(batch)
+        return {
+            "copied": copied,
+            "source_metrics": await self.db["monitoring_metrics"].count_documents({}),
+            "timeseries_metrics": await self.collection.count_documents({})
+        }
+
+
+def get_monitoring_service(db: AsyncIOMotorDatabase) -> MonitoringService:
+    """Get the monitoring service for the configured storage mode"""
+    if MONITORING_STORAGE == "timeseries":
+        return TimeSeriesMonitoringService(db)
+    return MonitoringService(db)
+
+
+# Matches numeric metric values other than NaN and +/-Infinity (NaN equals NaN in queries)
+FINITE_NUMBER = {"$type": "number", "$nin": [float("nan"), float("inf"), float("-inf")]}
+
+
+class MetricRollupService:
+    """Per-minute, per-hour and per-day aggregates of every metric series.
+    
+    Each tier holds count/sum/min/max/last per (name, category, user_id) and
+    bucket start, kept current from the insert path and expired by a TTL
+    index after the tier's retention. Range queries read the coarsest tier
+    that still answers at the requested resolution instead of raw points.
+    """
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+    
+    async def record(self, metrics: List[dict]) -> None:
+        """Merge newly stored metrics into every tier"""
+        metrics = [metric for metric in metrics if is_metric_point(metric)]
+        if not metrics:
+            return
+        for tier in ROLLUP_TIERS:
+            await self.db[tier.collection].bulk_write(rollup_operations(metrics, tier.seconds), ordered=False)
+    
+    @staticmethod
+    def _regroup(milliseconds: int) -> List[dict]:
+        """Stages merging buckets (or raw points shaped as buckets) into `milliseconds` intervals"""
+        start = {"$toLong": "$start"}
+        return [
+            {"$sort": {"last_at": 1}},
+            {"$group": {
+                "_id": {"$subtract": [start, {"$mod": [start, milliseconds]}]},
+                "count": {"$sum": "$count"},
+                "sum": {"$sum": "$sum"},
+                "min": {"$min": "$min"},
+                "max": {"$max": "$max"},
+                "last": {"$last": "$last"}
+            }},
+            {"$sort": {"_id": 1}},
+            {"$project": {
+                "_id": 0,
+                "start": {"$toDate": "$_id"},
+                "count": 1, "sum": 1, "min": 1, "max": 1, "last": 1,
+                "avg": {"$divide": ["$sum", "$count"]}
+            }}
+        ]
+    
+    async def get_series(self, name: str, start: datetime, end: datetime, resolution: int = None,
+                         max_points: int = 500, category: str = None, user_id: str = None) -> dict:
+        """Aggregated points of one metric between start and end.
+        
+        Without a resolution (seconds), one is picked to return at most
+        max_points points. exact is false when the range starts before the
+        finer data expired and the points are coarser than requested.
+        """
+        if not resolution:
+            resolution = max(1, int((end - start).total_seconds()) // max_points + 1)
+        tier, exact = choose_tier(start, resolution)
+        filters = {"name": name}
+        if category:
+            filters["category"] = category
+        if user_id:
+            filters["user_id"] = user_id
+        
+        if tier is None:
+            raw = get_monitoring_service(self.db)
+            collection = raw.collection
+            pipeline = raw._points_pipeline({**filters, "timestamp": {"$gte": start, "$lte": end}}) + [
+                {"$match": {"value": FINITE_NUMBER}},
+                {"$project": {
+                    "start": "$timestamp", "count": {"$literal": 1}, "sum": "$value",
+                    "min": "$value", "max": "$value", "last": "$value", "last_at": "$timestamp"
+                }}
+            ]
+        else:
+            collection = self.db[tier.collection]
+            pipeline = [{"$match": {**filters, "start": {"$gte": bucket_start(start, tier.seconds), "$lte": end}}}]
+            resolution = max(resolution, tier.seconds)
+        
+        pipeline += self._regroup(resolution * 1000)
+        points = await collection.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+        return {
+            "name": name,
+            "source": tier.name if tier else "raw",
+            "resolution": resolution,
+            "exact": exact,
+            "points": points
+        }
+    
+    async def rebuild(self, start: datetime, end: datetime, batch_size: int = 1000, raw_expires: bool = True) -> dict:
+        """Recompute every tier's whole buckets between start and end from raw metrics.
+        
+        Repairs buckets missed while rollup writes were failing, and backfills
+        metrics stored before rollups existed. Days whose raw metrics may have
+        partly expired (unless raw_expires is false), buckets past the tier's
+        own retention, and each tier's buckets still open at `end` are skipped
+        so buckets are never truncated or raced with live upserts.
+        """
+        now = datetime.utcnow()
+        start = bucket_start(start, 86400)
+        if raw_expires:
+            start = max(start, bucket_start(now - timedelta(days=METRIC_RAW_RETENTION_DAYS), 86400) + timedelta(days=1))
+        raw = get_monitoring_service(self.db)
+        rebuilt = {}
+        for tier in ROLLUP_TIERS:
+            tier_start = max(start, bucket_start(now - timedelta(days=tier.retention_days), tier.seconds))
+            tier_end = closed_before(end, tier.seconds)
+            if tier_end <= tier_start:
+                rebuilt[tier.name] = 0
+                continue
+            milliseconds = tier.seconds * 1000
+            timestamp = {"$toLong": "$timestamp"}
+            cursor = raw.collection.aggregate(raw._points_pipeline({"timestamp": {"$gte": tier_start, "$lt": tier_end}}) + [
+                {"$match": {"value": FINITE_NUMBER}},
+                {"$sort": {"timestamp": 1}},
+                {"$group": {
+                    "_id": {
+                        "name": "$name",
+                        "category": "$category",
+                        "user_id": {"$ifNull": ["$user_id", None]},
+                        "start": {"$toDate": {"$subtract": [timestamp, {"$mod": [timestamp, milliseconds]}]}}
+                    },
+                    "count": {"$sum": 1},
+                    "sum": {"$sum": "$value"},
+                    "min": {"$min": "$value"},
+                    "max": {"$max": "$value"},
+                    "last": {"$last": "$value"},
+                    "last_at": {"$last": "$timestamp"}
+                }}
+            ], allowDiskUse=True, batchSize=batch_size)
+            
+            written = 0
+            operations = []
+            async for bucket in cursor:
+                key = bucket.pop("_id")
+                operations.append(ReplaceOne(key, {**key, **bucket}, upsert=True))
+                if len(operations) >= batch_size:
+                    await self.db[tier.collection].bulk_write(operations, ordered=False)
+                    written += len(operations)
+                    operations = []
+            if operations:
+                await self.db[tier.collection].bulk_write(operations, ordered=False)
+                written += len(operations)
+            rebuilt[tier.name] = written
+        return {"start": start, "end": end, "buckets": rebuilt}
+
+
+def is_metric_point(metric: dict) -> bool:
+    value = metric.get("value")
+    return isinstance(metric.get("timestamp"), datetime) and isinstance(value, (int, float)) and math.isfinite(value)
+
+
+class MetricSketchService(BaseService):
+    """Hourly DDSketch quantile sketches per metric name.
+    
+    Bins are stored as a sparse {index: count} map and updated with $inc, so
+    concurrent workers merge into the same bucket; a range query merges the
+    hourly buckets instead of sorting raw values.
+    """
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        super().__init__(db, METRIC_SKETCHES_COLLECTION)
+    
+    async def record(self, metrics: List[dict]) -> None:
+        """Add newly stored metrics to their hourly sketches"""
+        sketches = sketch_batch(metric for metric in metrics if is_metric_point(metric))
+        if sketches:
+            await self.collection.bulk_write(sketch_operations(sketches), ordered=False)
+    
+    async def get_quantiles(self, name: str, start: datetime, end: datetime, quantiles: List[float]) -> dict:
+        """Estimate quantiles of a metric over the hourly buckets overlapping start..end"""
+        sketch = DDSketch()
+        cursor = self.collection.find({
+            "name": name,
+            "accuracy": METRIC_SKETCH_ACCURACY,
+            "start": {"$gte": bucket_start(start, METRIC_SKETCH_SECONDS), "$lte": end}
+        }, {"_id": 0, "name": 0, "start": 0})
+        async for doc in cursor:
+            sketch.merge_document(doc)
+        return {
+            "name": name,
+            "start": bucket_start(start, METRIC_SKETCH_SECONDS),
+            "end": end,
+            "count": sketch.count,
+            "min": sketch.min,
+            "max": sketch.max,
+            "relative_accuracy": METRIC_SKETCH_ACCURACY,
+            "quantiles": {str(q): sketch.quantile(q) for q in quantiles}
+        }
+    
+    async def rebuild(self, start: datetime, end: datetime, batch_size: int = 1000, raw_expires: bool = True) -> dict:
+        """Recompute whole hourly sketches from raw metrics, one day at a time"""
+        # The hour still open at `end` keeps receiving live $inc upserts
+        end = closed_before(end, METRIC_SKETCH_SECONDS)
+        now = datetime.utcnow()
+        # Sketches past their own retention would expire right away
+        window = max(bucket_start(start, METRIC_SKETCH_SECONDS),
+                     bucket_start(now - timedelta(days=METRIC_SKETCH_RETENTION_DAYS), METRIC_SKETCH_SECONDS))
+        if raw_expires:
+            # Skip the hour whose raw metrics have partly expired
+            bucket = timedelta(seconds=METRIC_SKETCH_SECONDS)
+            window = max(window, bucket_start(now - timedelta(days=METRIC_RAW_RETENTION_DAYS), METRIC_SKETCH_SECONDS) + bucket)
+        raw = get_monitoring_service(self.db)
+        rebuilt = 0
+        while window < end:
+            window_end = min(window + timedelta(days=1), end)
+            cursor = raw.collection.aggregate(
+                raw._points_pipeline({"timestamp": {"$gte": window, "$lt": window_end}}) +
+                [{"$project": {"_id": 0, "name": 1, "timestamp": 1, "value": 1}}],
+                allowDiskUse=True, batchSize=batch_size
+            )
+            # Fold points in as they stream; only the day's sketches are held in memory
+            sketches = {}
+            async for metric in cursor:
+                if is_metric_point(metric):
+                    add_sample(sketches, metric)
+            operations = [
+                ReplaceOne({"name": name, "start": hour, "accuracy": sketch.relative_accuracy},
+                           {"name": name, "start": hour, "accuracy": sketch.relative_accuracy, **sketch.to_document()},
+                           upsert=True)
+                for (name, hour), sketch in sketches.items()
+            ]
+            for offset in range(0, len(operations), batch_size):
+                await self.collection.bulk_write(operations[offset:offset + batch_size], ordered=False)
+            rebuilt += len(operations)
+            window = window_end
+        return {"sketches": rebuilt}
 
 
 class ReportService(BaseService):
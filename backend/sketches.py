@@ -0,0 +1,134 @@
+import math
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from rollups import bucket_start
+
+# Quantile estimates are within this relative error of the true value
+METRIC_SKETCH_ACCURACY = float(os.environ.get('METRIC_SKETCH_ACCURACY', 0.01))
+# Sketches are kept per metric name and bucket of this many seconds...
+METRIC_SKETCH_SECONDS = 3600
+# ...for this many days
+METRIC_SKETCH_RETENTION_DAYS = int(os.environ.get('METRIC_SKETCH_RETENTION_DAYS', 180))
+
+# Values closer to zero than this are counted as zero
+MIN_INDEXABLE = 1e-9
+
+
+class DDSketch:
+    """Mergeable quantile sketch with relative-error guarantees (DDSketch).
+
+    Values fall into logarithmic bins whose width grows with the value, so
+    every quantile is estimated within `relative_accuracy` of the real
+    value. Two sketches merge by adding bin counts, which is what lets the
+    stored buckets be combined over any time range.
+    """
+
+    def __init__(self, relative_accuracy: float = METRIC_SKETCH_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.negative_bins: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def value(self, key: int) -> float:
+        # Midpoint (in relative terms) of the bin (gamma^(key-1), gamma^key]
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float) -> None:
+        if not math.isfinite(value):
+            # NaN has no rank and infinity no bin
+            return
+        if value > MIN_INDEXABLE:
+            key = self.key(value)
+            self.bins[key] = self.bins.get(key, 0) + 1
+        elif value < -MIN_INDEXABLE:
+            key = self.key(-value)
+            self.negative_bins[key] = self.negative_bins.get(key, 0) + 1
+        else:
+            self.zero += 1
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge_document(self, doc: dict) -> None:
+        """Add a stored sketch bucket"""
+        for bins, stored in ((self.bins, doc.get("bins")), (self.negative_bins, doc.get("negative_bins"))):
+            for key, count in (stored or {}).items():
+                bins[int(key)] = bins.get(int(key), 0) + count
+        self.zero += doc.get("zero", 0)
+        self.count += doc.get("count", 0)
+        for field, pick in (("min", min), ("max", max)):
+            if doc.get(field) is not None:
+                current = getattr(self, field)
+                setattr(self, field, doc[field] if current is None else pick(current, doc[field]))
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        # Ascending value order: most negative first, then zero, then positive
+        ordered = (
+            [(-self.value(key), count) for key, count in sorted(self.negative_bins.items(), reverse=True)]
+            + [(0.0, self.zero)]
+            + [(self.value(key), count) for key, count in sorted(self.bins.items())]
+        )
+        estimate = ordered[-1][0]
+        for value, count in ordered:
+            seen += count
+            if seen > rank:
+                estimate = value
+                break
+        return min(max(estimate, self.min), self.max)
+
+    def to_document(self) -> dict:
+        return {
+            "count": self.count,
+            "zero": self.zero,
+            "min": self.min,
+            "max": self.max,
+            "bins": {str(key): count for key, count in self.bins.items()},
+            "negative_bins": {str(key): count for key, count in self.negative_bins.items()}
+        }
+
+    def to_update(self) -> dict:
+        """$inc / $min / $max update merging this sketch into a stored bucket"""
+        increments = {"count": self.count, "zero": self.zero}
+        increments.update({f"bins.{key}": count for key, count in self.bins.items()})
+        increments.update({f"negative_bins.{key}": count for key, count in self.negative_bins.items()})
+        return {"$inc": increments, "$min": {"min": self.min}, "$max": {"max": self.max}}
+
+
+def add_sample(sketches: Dict[Tuple[str, datetime], DDSketch], metric: dict) -> None:
+    """Add a metric to the sketch of its name and bucket"""
+    key = (metric["name"], bucket_start(metric["timestamp"], METRIC_SKETCH_SECONDS))
+    sketch = sketches.get(key)
+    if sketch is None:
+        sketch = sketches[key] = DDSketch()
+    sketch.add(metric["value"])
+
+
+def sketch_batch(metrics: Iterable[dict]) -> Dict[Tuple[str, datetime], DDSketch]:
+    """One sketch per metric name and bucket for a batch of metrics"""
+    sketches: Dict[Tuple[str, datetime], DDSketch] = {}
+    for metric in metrics:
+        add_sample(sketches, metric)
+    return sketches
+
+
+def sketch_operations(sketches: Dict[Tuple[str, datetime], DDSketch]) -> List[UpdateOne]:
+    return [
+        UpdateOne({"name": name, "start": start, "accuracy": sketch.relative_accuracy}, sketch.to_update(), upsert=True)
+        for (name, start), sketch in sketches.items()
+    ]
@@ -0,0 +1,65 @@
+from typing import Dict, Iterable, List, Set
+
+from presence import PROFILE_FIELDS
+
+
+def normalize_skill(skill: str) -> str:
+    return skill.strip().lower()
+
+
+class SkillIndex:
+    """Inverted index from (normalized) skill to the ids of users having it.
+
+    Maintained by the user directory alongside its other indexes.
+    """
+
+    def __init__(self):
+        self._users: Dict[str, dict] = {}
+        self._by_skill: Dict[str, Set[str]] = {}
+
+    def apply(self, user: dict) -> None:
+        """Add or re-index a user after a change"""
+        self.remove(user["id"])
+        profile = {field: user[field] for field in PROFILE_FIELDS if field in user}
+        self._users[user["id"]] = profile
+        for skill in {normalize_skill(skill) for skill in profile.get("skills") or ()}:
+            self._by_skill.setdefault(skill, set()).add(user["id"])
+
+    def remove(self, user_id: str) -> None:
+        profile = self._users.pop(user_id, None)
+        if profile is None:
+            return
+        for skill in {normalize_skill(skill) for skill in profile.get("skills") or ()}:
+            users = self._by_skill.get(skill)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._by_skill[skill]
+
+    def skills(self) -> Dict[str, int]:
+        """Every known skill with its number of users"""
+        return {skill: len(users) for skill, users in sorted(self._by_skill.items())}
+
+    def search(self, skills: Iterable[str] = (), match: str = "all", role: str = None,
+               is_active: bool = None, user_ids: Set[str] = None) -> List[dict]:
+        """Users having all (or any) of skills, filtered by role, active flag and an id set"""
+        wanted = {normalize_skill(skill) for skill in skills if skill.strip()}
+        if not wanted:
+            candidates = set(self._users)
+        elif match == "any":
+            candidates = set().union(*(self._by_skill.get(skill, ()) for skill in wanted))
+        else:
+            # Intersect starting from the rarest skill
+            postings = sorted((self._by_skill.get(skill, set()) for skill in wanted), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        if user_ids is not None:
+            candidates &= user_ids
+        results = []
+        for user_id in candidates:
+            profile = self._users[user_id]
+            if role and profile.get("role") != role:
+                continue
+            if is_active is not None and profile.get("is_active", True) != is_active:
+                continue
+            results.append(profile)
+        return sorted(results, key=lambda profile: (profile.get("name") or "", profile["id"]))
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Throughput Benchmarks for StarPrint CRM Backend
+Measures large-payload and high-volume API paths against a running backend
+"""
+
+import asyncio
+import json
+import random
+import requests
+import os
+import ssl
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Iterator
+from urllib.parse import urlsplit
+
+# Get backend URL from environment
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
+
+MB = 1024 * 1024
+
+
+class APIBenchmark:
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.results = []
+        self.created_tickets = []
+
+    def log_result(self, name: str, seconds: float, **details):
+        """Log benchmark result"""
+        result = {
+            'benchmark': name,
+            'seconds': round(seconds, 3),
+            'timestamp': datetime.now().isoformat(),
+            **details
+        }
+        self.results.append(result)
+        extra = ", ".join(f"{key}={value}" for key, value in details.items())
+        print(f"⏱  {name}: {seconds:.3f}s {extra}")
+
+    def create_ticket(self) -> str:
+        """Create a throwaway ticket to hang benchmark data on"""
+        response = self.session.post(f"{self.base_url}/tickets/", json={
+            "title": f"Benchmark {uuid.uuid4().hex[:8]}",
+            "description": "Created by backend_benchmark.py",
+            "channel": "email",
+            "customer_id": "benchmark"
+        })
+        response.raise_for_status()
+        ticket_id = response.json()['data']['id']
+        self.created_tickets.append(ticket_id)
+        return ticket_id
+
+    @staticmethod
+    def generate_payload(size: int, chunk_size: int = MB) -> Iterator[bytes]:
+        """Yield size bytes without materialising the whole payload"""
+        block = os.urandom(chunk_size)
+        sent = 0
+        while sent < size:
+            chunk = block[:min(chunk_size, size - sent)]
+            sent += len(chunk)
+            yield chunk
+
+    def benchmark_attachments(self, sizes_mb=(16, 128, 512)):
+        """Benchmark streaming attachment upload, full download and range download"""
+        print("\n=== Benchmarking Attachment Throughput ===")
+        ticket_id = self.create_ticket()
+
+        for size_mb in sizes_mb:
+            size = size_mb * MB
+
+            start = time.perf_counter()
+            response = self.session.post(
+                f"{self.base_url}/tickets/{ticket_id}/attachments",
+                params={"filename": f"bench-{size_mb}mb.bin"},
+                data=self.generate_payload(size),
+                headers={"Content-Type": "application/octet-stream"}
+            )
+            elapsed = time.perf_counter() - start
+            response.raise_for_status()
+            attachment_id = response.json()['data']['id']
+            self.log_result(f"Upload {size_mb} MB", elapsed, mb_per_s=round(size_mb / elapsed, 1))
+
+            url = f"{self.base_url}/tickets/{ticket_id}/attachments/{attachment_id}"
+            start = time.perf_counter()
+            received = 0
+            with self.session.get(url, stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=MB):
+                    received += len(chunk)
+            elapsed = time.perf_counter() - start
+            self.log_result(f"Download {size_mb} MB", elapsed, mb_per_s=round(size_mb / elapsed, 1),
+                            complete=received == size)
+
+            range_start = size // 2
+            start = time.perf_counter()
+            response = self.session.get(url, headers={"Range": f"bytes={range_start}-{range_start + MB - 1}"})
+            elapsed = time.perf_counter() - start
+            self.log_result(f"Range 1 MB from {size_mb} MB", elapsed,
+                            status=response.status_code, complete=len(response.content) == MB)
+
+            self.session.delete(url)
+
+    async def _open_event_stream(self, path: str):
+        """Open a raw SSE connection and wait for the response headers"""
+        url = urlsplit(self.base_url)
+        secure = url.scheme == "https"
+        port = url.port or (443 if secure else 80)
+        reader, writer = await asyncio.open_connection(
+            url.hostname, port, ssl=ssl.create_default_context() if secure else None
+        )
+        writer.write(
+            f"GET {url.path}{path} HTTP/1.1\r\nHost: {url.hostname}\r\n"
+            f"Accept: text/event-stream\r\n\r\n".encode()
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        if b" 200 " not in status_line:
+            raise RuntimeError(f"Subscription failed: {status_line!r}")
+        return reader, writer
+
+    async def _event_subscribers(self, count: int, concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def connect():
+            async with semaphore:
+                return await self._open_event_stream("/events/stream?topics=tickets")
+
+        start = time.perf_counter()
+        connections = await asyncio.gather(*(connect() for _ in range(count)), return_exceptions=True)
+        connected = [connection for connection in connections if not isinstance(connection, Exception)]
+        self.log_result(f"Connect {count} SSE subscribers", time.perf_counter() - start,
+                        connected=len(connected), failed=count - len(connected))
+
+        async def wait_for_event(reader):
+            while True:
+                line = await reader.readline()
+                if not line or line.startswith(b"event: tickets"):
+                    return bool(line)
+
+        waiters = [asyncio.ensure_future(wait_for_event(reader)) for reader, _ in connected]
+        start = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, self.create_ticket)
+        done, pending = await asyncio.wait(waiters, timeout=30)
+        self.log_result("Fan-out ticket event to subscribers", time.perf_counter() - start,
+                        received=sum(1 for task in done if task.result()), missed=len(pending))
+
+        for task in pending:
+            task.cancel()
+        for _, writer in connected:
+            writer.close()
+
+    def benchmark_event_subscribers(self, count: int = 2000, concurrency: int = 200):
+        """Connect thousands of concurrent SSE subscribers and time one fan-out"""
+        print("\n=== Benchmarking Event Hub Subscribers ===")
+        asyncio.run(self._event_subscribers(count, concurrency))
+
+    @staticmethod
+    def generate_metrics_ndjson(count: int) -> bytes:
+        """A batch of synthetic latency samples as NDJSON"""
+        names = [f"bench.latency.{index}" for index in range(20)]
+        return "\n".join(json.dumps({
+            "name": random.choice(names),
+            "value": round(random.lognormvariate(4, 0.6), 2),
+            "unit": "ms",
+            "category": "performance",
+            "user_id": f"bench-agent-{random.randrange(50)}"
+        }) for _ in range(count)).encode()
+
+    def benchmark_ingest(self, seconds: int = 30, batch_size: int = 1000, producers: int = 8):
+        """Sustain batched NDJSON metric ingestion and report accepted samples per second"""
+        print("\n=== Benchmarking Sustained Metric Ingestion ===")
+        bodies = [self.generate_metrics_ndjson(batch_size) for _ in range(10)]
+        deadline = time.perf_counter() + seconds
+
+        def produce(worker: int) -> Dict[str, int]:
+            session = requests.Session()
+            counts = {"accepted": 0, "throttled": 0, "failed": 0}
+            while time.perf_counter() < deadline:
+                response = session.post(
+                    f"{self.base_url}/monitoring/ingest",
+                    data=bodies[worker % len(bodies)],
+                    headers={"Content-Type": "application/x-ndjson"}
+                )
+                if response.status_code == 202:
+                    counts["accepted"] += response.json()['data']['accepted']
+                elif response.status_code in (429, 503):
+                    counts["throttled"] += 1
+                    time.sleep(float(response.headers.get("Retry-After", 1)))
+                else:
+                    counts["failed"] += 1
+            return counts
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=producers) as executor:
+            results = list(executor.map(produce, range(producers)))
+        elapsed = time.perf_counter() - start
+
+        accepted = sum(result["accepted"] for result in results)
+        self.log_result(
+            f"Ingest {batch_size}-sample batches x {producers} producers", elapsed,
+            samples_per_s=round(accepted / elapsed), accepted=accepted,
+            throttled=sum(result["throttled"] for result in results),
+            failed=sum(result["failed"] for result in results)
+        )
+        status = self.session.get(f"{self.base_url}/monitoring/ingest/status").json()['data']
+        self.log_result("Ingest buffer after run", 0, buffered=status['buffered'],
+                        flushed=status['flushed'], failed_flushes=status['failed_flushes'])
+
+    def cleanup(self):
+        """Delete benchmark entities"""
+        for ticket_id in self.created_tickets:
+            self.session.delete(f"{self.base_url}/tickets/{ticket_id}")
+
+    def run(self, names=None) -> Dict[str, Any]:
+        """Run the selected benchmarks (all by default)"""
+        benchmarks = {
+            'attachments': self.benchmark_attachments,
+            'events': self.benchmark_event_subscribers,
+            'ingest': self.benchmark_ingest,
+        }
+        print("🚀 Starting Backend Throughput Benchmarks for StarPrint CRM")
+        print(f"Backend URL: {self.base_url}")
+        print("=" * 80)
+
+        try:
+            for name in names or benchmarks:
+                benchmarks[name]()
+        finally:
+            self.cleanup()
+
+        return {'results': self.results}
+
+
+if __name__ == "__main__":
+    benchmark = APIBenchmark(BACKEND_URL)
+    benchmark.run(sys.argv[1:] or None)
@@ -10,6 +10,7 @@ import uuid
 from datetime import datetime, date, timedelta
 from typing import Dict, Any, List
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 # Get backend URL from environment
 BACKEND_URL = "https://2abee03d-b1f7-47f0-b834-0e866b360d76.preview.emergentagent.com/api"
@@ -655,6 +656,54 @@ class APITester:
             f"Filtered metrics: {response['success']}"
         )
 
+    def test_concurrent_operations(self):
+        """Test that concurrent writes do not create duplicates"""
+        print("\n=== Testing Concurrent Operations ===")
+        
+        # Test 1: Concurrent Check-ins create a single day record
+        user_id = f"concurrency-{uuid.uuid4()}"
+        timestamp = datetime.utcnow().replace(microsecond=0).isoformat()
+        
+        def check_in(_):
+            return requests.post(
+                f"{self.base_url}/attendance/checkin",
+                params={'user_id': user_id, 'timestamp': timestamp}
+            ).status_code
+        
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            statuses = list(executor.map(check_in, range(20)))
+        
+        response = self.make_request('GET', '/attendance/', params={'user_id': user_id})
+        records = response['data'].get('data', []) if response['success'] else []
+        self.created_entities['attendance'].extend(record['id'] for record in records)
+        self.log_test(
+            "Concurrent Check-ins",
+            all(status == 200 for status in statuses) and response['data'].get('total') == 1,
+            f"Statuses: {sorted(set(statuses))}, Records: {response['data'].get('total')}"
+        )
+
+        # Test 2: Concurrent user creation with the same email (differing in case) creates one user
+        email = f"concurrent-{uuid.uuid4().hex[:8]}@starprint.com"
+        
+        def create_user(index):
+            return requests.post(f"{self.base_url}/users/", json={
+                "name": f"Concurrent User {index}",
+                "email": email.upper() if index % 2 else email,
+                "role": "agent"
+            })
+        
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            responses = list(executor.map(create_user, range(10)))
+        
+        created = [response.json()['data']['id'] for response in responses if response.status_code == 200]
+        self.created_entities['users'].extend(created)
+        statuses = [response.status_code for response in responses]
+        self.log_test(
+            "Concurrent User Creation With Same Email",
+            len(created) == 1 and statuses.count(400) == len(statuses) - 1,
+            f"Statuses: {sorted(statuses)}"
+        )
+
     def test_edge_cases(self):
         """Test edge cases and error handling"""
         print("\n=== Testing Edge Cases and Error Handling ===")
@@ -755,6 +804,7 @@ class APITester:
         self.test_goals_management()
         self.test_attendance_management()
         self.test_monitoring_metrics()
+        self.test_concurrent_operations()
         self.test_edge_cases()
         
         # Clean up test data